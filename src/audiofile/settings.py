@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 import configparser
+import os
 from pathlib import Path
 
 from django.core.exceptions import ImproperlyConfigured
@@ -59,11 +60,13 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'core'
 ]
 
 MIDDLEWARE = [
+    'core.middleware.metrics_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -95,14 +98,47 @@ WSGI_APPLICATION = 'audiofile.wsgi.application'
 
 REST_FRAMEWORK = {
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
+# Build list and export payloads from `values()` rows instead of model instances and serializers
+AUDIOFILE_FAST_SERIALIZATION = CFG_PARSER.getboolean('MISC', 'FAST_SERIALIZATION', fallback=True)
+
+# Set by audiofile.asgi, async views only pay off when served from an event loop
+AUDIOFILE_ASYNC_VIEWS = os.environ.get('AUDIOFILE_ASYNC_VIEWS') == '1'
+
+# Threads, and so database connections, async views wait on the database with
+AUDIOFILE_ASYNC_DB_THREADS = CFG_PARSER.getint('MISC', 'ASYNC_DB_THREADS', fallback=20)
+
+# Request metrics served at /metrics, see core.metrics
+AUDIOFILE_METRICS = CFG_PARSER.getboolean('MISC', 'METRICS', fallback=True)
+
+# What to do when a view runs more queries than its budget or N+1 queries: 'log', 'raise' or 'off', see core.querybudget
+AUDIOFILE_QUERY_BUDGETS = CFG_PARSER.get('MISC', 'QUERY_BUDGETS', fallback='log')
+if AUDIOFILE_QUERY_BUDGETS not in ('off', 'log', 'raise'):
+    raise ImproperlyConfigured(
+        f"QUERY_BUDGETS option in MISC section must be 'off', 'log' or 'raise', not {AUDIOFILE_QUERY_BUDGETS!r}"
+    )
+
+# Storage of uploaded audio, see core.storage
+AUDIOFILE_STORAGE = {
+    'BACKEND': CFG_PARSER.get('STORAGE', 'BACKEND', fallback='core.storage.FileSystemAudioStorage'),
+    'OPTIONS': {
+        'location': CFG_PARSER.get('STORAGE', 'LOCATION', fallback=str(BASE_DIR / 'media')),
+    },
+}
+AUDIOFILE_UPLOAD_CHUNK_SIZE = CFG_PARSER.getint('STORAGE', 'UPLOAD_CHUNK_SIZE', fallback=1024 * 1024)
+AUDIOFILE_MAX_UPLOAD_SIZE = CFG_PARSER.getint('STORAGE', 'MAX_UPLOAD_SIZE', fallback=2 * 1024 ** 3)
+
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db_backends.postgresql',
         'NAME': CFG_PARSER.get('DATABASE', 'NAME'),
         'USER': CFG_PARSER.get('DATABASE', 'USER'),
         'PASSWORD': CFG_PARSER.get('DATABASE', 'PASSWORD'),
@@ -114,6 +150,32 @@ DATABASES = {
     }
 }
 
+# Connections are handed back to a pool when Django closes them at the end of a request
+if CFG_PARSER.getboolean('DATABASE', 'POOL', fallback=True):
+    DATABASES['default']['POOL'] = {
+        'min_size': CFG_PARSER.getint('DATABASE', 'POOL_MIN_SIZE', fallback=0),
+        'max_size': CFG_PARSER.getint('DATABASE', 'POOL_MAX_SIZE', fallback=20),
+        'timeout': CFG_PARSER.getfloat('DATABASE', 'POOL_TIMEOUT', fallback=30),
+        'max_lifetime': CFG_PARSER.getfloat('DATABASE', 'POOL_MAX_LIFETIME', fallback=3600),
+        'health_check_interval': CFG_PARSER.getfloat('DATABASE', 'POOL_HEALTH_CHECK_INTERVAL', fallback=30),
+    }
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Local memory by default, any Django cache backend (e.g. a Redis one) can be configured in the CACHE section
+
+CACHES = {
+    'default': {
+        'BACKEND': CFG_PARSER.get('CACHE', 'BACKEND', fallback='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': CFG_PARSER.get('CACHE', 'LOCATION', fallback='audiofile'),
+        'OPTIONS': {
+            'MAX_ENTRIES': CFG_PARSER.getint('CACHE', 'MAX_ENTRIES', fallback=10000),
+        },
+    }
+}
+
+AUDIOFILE_RESPONSE_CACHE_TIMEOUT = CFG_PARSER.getint('CACHE', 'TIMEOUT', fallback=300)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
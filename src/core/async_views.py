@@ -0,0 +1,61 @@
+"""
+Async variants of the create, retrieve, list, update and delete endpoints
+
+DRF 3.12 only knows synchronous views. These views run DRF's dispatch on the event loop and hand the part that
+touches the database, authentication included, to the database thread pool of `core.db`. Responses are identical to
+those of the synchronous views, which they reuse for everything else.
+"""
+import functools
+
+from core import views
+from core.db import database_sync_to_async
+
+
+class AsyncAPIViewMixin:
+    """Make a DRF view a coroutine Django awaits from the event loop when served over ASGI"""
+
+    @classmethod
+    def as_view(cls, *args, **initkwargs):
+
+        view = super().as_view(*args, **initkwargs)
+
+        # Django 3.2 awaits the resolved callback only if it is a coroutine function, the view returns a coroutine
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        return functools.wraps(view)(async_view)
+
+    async def dispatch(self, request, *args, **kwargs):
+        """`APIView.dispatch`, awaiting the handler in the database thread pool"""
+
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            response = await database_sync_to_async(self.handle)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    def handle(self, request, *args, **kwargs):
+        """Check the request and run its handler"""
+
+        self.initial(request, *args, **kwargs)
+        if request.method.lower() in self.http_method_names:
+            handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+        else:
+            handler = self.http_method_not_allowed
+        return handler(request, *args, **kwargs)
+
+
+class AsyncAudioFileCreateAPIView(AsyncAPIViewMixin, views.AudioFileCreateAPIView):
+    pass
+
+
+class AsyncAudioFileViewSet(AsyncAPIViewMixin, views.AudioFileViewSet):
+    pass
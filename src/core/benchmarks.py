@@ -0,0 +1,272 @@
+"""
+Helpers shared by the benchmark management commands
+"""
+import asyncio
+import statistics
+import time
+from contextlib import contextmanager
+from urllib import parse
+
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+
+from core import constants, metrics, middleware, mixins, models, querybudget
+
+SEED_ROW_FACTORIES = {
+    constants.SONG: lambda index: models.Song(name=f'Song {index}', duration=index % 600 + 1),
+    constants.PODCAST: lambda index: models.Podcast(
+        name=f'Podcast {index}',
+        duration=index % 3600 + 1,
+        host=f'Host {index % 1000}',
+        participants=[f'Participant {index % 100}', f'Participant {index % 37}']
+    ),
+    constants.AUDIOBOOK: lambda index: models.AudioBook(
+        name=f'Audiobook {index}',
+        duration=index % 36000 + 1,
+        author=f'Author {index % 1000}',
+        narrator=f'Narrator {index % 500}'
+    ),
+}
+
+# Fields of the seeded rows sent as the metadata of created audiofiles
+PAYLOAD_FIELDS = {
+    constants.SONG: ['name', 'duration'],
+    constants.PODCAST: ['name', 'duration', 'host', 'participants'],
+    constants.AUDIOBOOK: ['name', 'duration', 'author', 'narrator'],
+}
+
+# Latency and throughput may differ from the baseline by this fraction before a run fails
+DEFAULT_TOLERANCE = 0.2
+
+# Share of the median latency of an operation recording metrics may add, in percent
+METRICS_OVERHEAD_BUDGET = 2.0
+
+# Phases timed by the views, see `core.metrics.phase`
+METRICS_PHASES = ['parse', 'validation', 'serialization', 'render']
+
+
+def seed_audiofiles(audiofiletype, count, batch_size=10000):
+    """Insert `count` generated rows of the given audiofiletype using batched bulk inserts"""
+
+    factory = SEED_ROW_FACTORIES[audiofiletype]
+    model = mixins.AudioFileModelSerializerMappingMixin.audio_type_serializer_model_mapping[audiofiletype]['model']
+    for start in range(0, count, batch_size):
+        model.objects.bulk_create(
+            [factory(index) for index in range(start, min(start + batch_size, count))],
+            batch_size=batch_size
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+
+def get_seed_payload(audiofiletype, index):
+    """Metadata of the `index`th generated audiofile, as sent to the create endpoint"""
+
+    instance = SEED_ROW_FACTORIES[audiofiletype](index)
+    return {field: getattr(instance, field) for field in PAYLOAD_FIELDS[audiofiletype]}
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of an already sorted list of samples"""
+
+    index = max(0, min(len(samples) - 1, round(fraction * len(samples)) - 1))
+    return samples[index]
+
+
+def summarize(samples):
+    """Latency summary, in milliseconds, of a list of durations measured in seconds"""
+
+    samples = sorted(samples)
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.mean(samples) * 1000, 3),
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+    }
+
+
+def time_calls(func, repeat):
+    """Call `func` `repeat` times and return how long each call took in seconds"""
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def find_regressions(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Describe every operation of `report` slower than the same operation of `baseline`
+
+    Both map names to operation summaries, each with `p95_ms`, `ops_per_second` and `queries_per_request`. The p95
+    latency and the throughput may be worse by `tolerance`, a fraction, to allow for noise. Query counts do not depend
+    on the machine, any increase is a regression, and so is any increase of `errors`, the requests that failed or
+    answered with an unexpected status, which would otherwise make a broken endpoint look fast. Operations missing from
+    either side are not compared.
+    """
+
+    regressions = []
+    for name, expected in baseline.items():
+        measured = report.get(name)
+        if measured is None:
+            continue
+        if measured['p95_ms'] > expected['p95_ms'] * (1 + tolerance):
+            regressions.append(f'{name}: p95 {measured["p95_ms"]}ms, baseline {expected["p95_ms"]}ms')
+        if measured['ops_per_second'] < expected['ops_per_second'] * (1 - tolerance):
+            regressions.append(
+                f'{name}: {measured["ops_per_second"]} ops/s, baseline {expected["ops_per_second"]} ops/s'
+            )
+        if measured['queries_per_request'] > expected['queries_per_request']:
+            regressions.append(
+                f'{name}: {measured["queries_per_request"]} queries per request, '
+                f'baseline {expected["queries_per_request"]}'
+            )
+        if measured.get('errors', 0) > expected.get('errors', 0):
+            regressions.append(f'{name}: {measured["errors"]} errors, baseline {expected.get("errors", 0)}')
+    return regressions
+
+
+def time_metrics_recording(queries, repeat=1000, rounds=5):
+    """
+    Seconds recording metrics adds to a request running `queries` queries and going through every phase
+
+    Latencies of whole requests vary by more than the cost of recording, which is measured on its own instead: a stub
+    view enters every phase and runs its queries through `core.metrics.record_query` on a no-op execute, bare and behind
+    the metrics middleware. The best of `rounds` rounds of `repeat` requests is kept for both.
+    """
+
+    request = RequestFactory().get('/')
+    request.resolver_match = None
+    response = HttpResponse(b'{}')
+
+    def execute(sql, params, many, context):
+        return None
+
+    def view(request):
+        for name in METRICS_PHASES:
+            with metrics.phase(name):
+                pass
+        for _ in range(queries):
+            metrics.record_query(execute, 'SELECT 1', None, False, None)
+        return response
+
+    with override_settings(AUDIOFILE_METRICS=True, AUDIOFILE_QUERY_BUDGETS=querybudget.OFF):
+        recorded_view = middleware.metrics_middleware(view)
+    bare, recorded = [
+        min(time_calls(lambda: [handler(request) for _ in range(repeat)], rounds)) / repeat
+        for handler in (view, recorded_view)
+    ]
+    return max(0.0, recorded - bare)
+
+
+def find_metrics_overhead(overhead, budget=METRICS_OVERHEAD_BUDGET):
+    """Describe every operation of `overhead` where recording metrics adds more than `budget` percent"""
+
+    return [
+        f'{name}: recording metrics adds {measured["overhead_percent"]}%, budget {budget}%'
+        for name, measured in overhead.items()
+        if measured['overhead_percent'] > budget
+    ]
+
+
+@contextmanager
+def benchmark_database(keepdb=False, verbosity=0):
+    """Run the enclosed block against a throwaway test database so seeded rows never reach real data"""
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, keepdb=keepdb)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity, keepdb=keepdb)
+
+
+async def read_response(reader):
+    """Read an HTTP/1.1 response, return its status code and whether the connection can be reused"""
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed by the server')
+    status_code = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.read()
+        return status_code, False
+    return status_code, headers.get('connection') != 'close'
+
+
+async def run_connection(url, deadline, samples, errors, get_headers=None):
+    """
+    Send requests to `url` over one keep-alive connection until `deadline`, reconnecting when it drops
+
+    `get_headers` returns extra headers for each request.
+    """
+
+    parsed = parse.urlsplit(url)
+    target = parsed.path + (f'?{parsed.query}' if parsed.query else '')
+    request_head = f'GET {target or "/"} HTTP/1.1\r\nHost: {parsed.netloc}\r\nAccept: application/json\r\n'
+    writer = None
+    while time.perf_counter() < deadline:
+        headers = get_headers() if get_headers else {}
+        extra_headers = ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+        request = f'{request_head}{extra_headers}\r\n'.encode('latin-1')
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(parsed.hostname, parsed.port or 80)
+            start = time.perf_counter()
+            writer.write(request)
+            status_code, keep_alive = await read_response(reader)
+            if status_code >= 400:
+                errors.append(status_code)
+            else:
+                samples.append(time.perf_counter() - start)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError) as exc:
+            errors.append(type(exc).__name__)
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.01)
+    if writer is not None:
+        writer.close()
+
+
+async def load_test(url, connections, duration, get_headers=None):
+    """
+    Hammer `url` with GET requests from `connections` concurrent keep-alive connections for `duration` seconds
+
+    Returns the latency summary of the successful requests, the throughput and the number of failed requests.
+    """
+
+    samples, errors = [], []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(
+        run_connection(url, deadline, samples, errors, get_headers) for _ in range(connections)
+    ))
+    elapsed = time.perf_counter() - start
+    report = summarize(samples) if samples else {'count': 0}
+    report['requests_per_second'] = round(len(samples) / elapsed, 1)
+    report['errors'] = len(errors)
+    return report
@@ -0,0 +1,151 @@
+"""
+Content addressed storage of uploaded media
+
+A completed upload is looked up by the sha256 checksum computed while it was received. Content seen before only gains
+a reference on the existing `AudioBlob`, its received bytes are dropped and what was probed or computed from the first
+copy is reused, so identical payloads are stored, probed and turned into peaks once. Releasing the last reference
+deletes the blob and its files.
+
+Media uploaded before blobs existed belongs to a single audiofile and is deleted as soon as it is released.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, connection, transaction
+
+from core import models, probing
+from core.storage import get_storage
+
+
+def get_name(checksum):
+    """Storage name of a blob, spread over two levels of directories"""
+
+    return f'blobs/{checksum[:2]}/{checksum[2:4]}/{checksum}'
+
+
+def get_info(blob):
+    """`AudioInfo` recorded on a blob, None when its media was not probed"""
+
+    if blob.sample_rate is None:
+        return None
+    return probing.AudioInfo(None, blob.duration, blob.bitrate, blob.sample_rate, blob.channels)
+
+
+def lock(checksum):
+    """
+    Lock the blob of a checksum until the end of the transaction, whether its row exists or not
+
+    Taking a reference and deleting the files of a released blob are serialized on this lock, so that the files of a
+    blob whose content was just uploaded again are never deleted.
+    """
+
+    with connection.cursor() as cursor:
+        # The first 60 bits of the checksum fit the bigint key of the lock
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [int(checksum[:15], 16)])
+
+
+def acquire(name, checksum, size):
+    """
+    Take a reference on the blob of the file stored at `name`, creating it from the file if its content is new
+
+    Must run in a transaction, the blob stays locked until it ends.
+    """
+
+    storage = get_storage()
+    lock(checksum)
+    blob = models.AudioBlob.objects.select_for_update().filter(pk=checksum).first()
+    if blob is None:
+        try:
+            with transaction.atomic():
+                blob = models.AudioBlob.objects.create(
+                    checksum=checksum,
+                    name=get_name(checksum),
+                    size=size,
+                    references=1
+                )
+        except IntegrityError:
+            # An upload of the same content completed in the meantime
+            blob = models.AudioBlob.objects.select_for_update().get(pk=checksum)
+        else:
+            storage.move(name, blob.name)
+            return blob
+
+    blob.references += 1
+    blob.save(update_fields=['references'])
+    transaction.on_commit(lambda: storage.delete(name))
+    return blob
+
+
+def release(media):
+    """
+    Drop a reference per (file, peaks) name pair of `media`, deleting the blobs left without any once committed
+
+    Files that are not blobs are deleted along with their peaks.
+    """
+
+    references = Counter()
+    peaks_names = {}
+    for name, peaks_name in media:
+        if name:
+            references[name] += 1
+            peaks_names[name] = peaks_name
+    if not references:
+        return
+
+    with transaction.atomic():
+        blobs = {blob.name: blob for blob in models.AudioBlob.objects.select_for_update().filter(name__in=references)}
+        deleted_names = []
+        for name, count in references.items():
+            blob = blobs.get(name)
+            if blob is None:
+                deleted_names += [name, peaks_names[name]]
+            else:
+                blob.references -= count
+
+        unreferenced = [blob for blob in blobs.values() if blob.references <= 0]
+        models.AudioBlob.objects.bulk_update(
+            [blob for blob in blobs.values() if blob.references > 0],
+            ['references']
+        )
+        models.AudioBlob.objects.filter(pk__in=[blob.pk for blob in unreferenced]).delete()
+
+    deleted_names = [name for name in deleted_names if name]
+    if deleted_names:
+        transaction.on_commit(lambda: delete_files(deleted_names))
+    if unreferenced:
+        released = [(blob.checksum, [blob.name, blob.peaks]) for blob in unreferenced]
+        transaction.on_commit(lambda: delete_released_blobs(released))
+
+
+def delete_files(names):
+
+    storage = get_storage()
+    for name in names:
+        if name:
+            storage.delete(name)
+
+
+def delete_released_blobs(released):
+    """Delete the files of released blobs given as (checksum, names) pairs, unless their content was uploaded again"""
+
+    for checksum, names in released:
+        with transaction.atomic():
+            lock(checksum)
+            if not models.AudioBlob.objects.filter(pk=checksum).exists():
+                delete_files(names)
+
+
+def record_info(name, info):
+    """Record the probed properties of the media of a blob for the audiofiles uploading it later"""
+
+    models.AudioBlob.objects.filter(name=name).update(
+        duration=info.duration,
+        bitrate=info.bitrate,
+        sample_rate=info.sample_rate,
+        channels=info.channels
+    )
+
+
+def record_peaks(name, peaks_name):
+    """Record the peaks of the media of a blob, returns False if `name` is not a blob"""
+
+    return bool(models.AudioBlob.objects.filter(name=name).update(peaks=peaks_name))
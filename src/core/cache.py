@@ -0,0 +1,115 @@
+"""
+Caching of serialized audiofile responses
+
+Every key embeds a version number kept per audiofiletype. Any write to an audiofiletype bumps its version, which
+makes all of its cached responses unreachable at once; the orphaned entries then age out through the TTL and LRU
+eviction of the cache backend.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from core import metrics
+
+
+class AudioFileResponseCache:
+    """Versioned cache of response payloads with hit and miss counters"""
+
+    key_prefix = 'audiofile'
+
+    def __init__(self, alias='default'):
+
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+
+        return caches[self.alias]
+
+    @property
+    def timeout(self):
+
+        return getattr(settings, 'AUDIOFILE_RESPONSE_CACHE_TIMEOUT', 300)
+
+    def get_version_key(self, audiofiletype):
+
+        return f'{self.key_prefix}:{audiofiletype}:version'
+
+    def get_version(self, audiofiletype):
+        """
+        Current version of an audiofiletype
+
+        A version that is missing, e.g. evicted, restarts from the current time rather than from 1 so that it can never
+        make an older generation of cached responses reachable again.
+        """
+
+        version_key = self.get_version_key(audiofiletype)
+        version = self.cache.get(version_key)
+        if version is None:
+            self.cache.add(version_key, time.time_ns(), timeout=None)
+            version = self.cache.get(version_key)
+        return version
+
+    def make_key(self, audiofiletype, request, audiofileid=None):
+        """Key of a response, built from the audiofiletype version, the audiofileid and the full request url"""
+
+        url_hash = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        resource = 'list' if audiofileid is None else audiofileid
+        return f'{self.key_prefix}:{audiofiletype}:{self.get_version(audiofiletype)}:{resource}:{url_hash}'
+
+    def get(self, key):
+
+        data = self.cache.get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def collect(self):
+        """Hit and miss counters of this process, see `core.metrics.MetricsRegistry.register_collector`"""
+
+        with self._lock:
+            samples = [((('result', 'hit'),), self.hits), ((('result', 'miss'),), self.misses)]
+        return [(
+            'audiofile_response_cache_lookups_total',
+            'counter',
+            'Lookups of cached retrieve and list responses by result',
+            samples
+        )]
+
+    def set(self, key, data):
+
+        self.cache.set(key, data, timeout=self.timeout)
+
+    def invalidate(self, audiofiletype):
+        """
+        Make every cached response of an audiofiletype unreachable, now and once the current transaction commits
+
+        Until the commit, concurrent requests still read the data from before the write and may cache it under the
+        version bumped right away, the second bump drops those responses.
+        """
+
+        self.bump_version(audiofiletype)
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(lambda: self.bump_version(audiofiletype))
+
+    def bump_version(self, audiofiletype):
+
+        version_key = self.get_version_key(audiofiletype)
+        try:
+            self.cache.incr(version_key)
+        except ValueError:
+            self.cache.add(version_key, time.time_ns(), timeout=None)
+
+
+response_cache = AudioFileResponseCache()
+metrics.registry.register_collector(response_cache.collect)
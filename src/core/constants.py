@@ -5,3 +5,6 @@ Variables containing constant values
 PODCAST = 'podcast'
 SONG = 'song'
 AUDIOBOOK = 'audiobook'
+
+PROBE_JOB = 'probe'
+PEAKS_JOB = 'peaks'
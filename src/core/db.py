@@ -0,0 +1,66 @@
+"""
+Database access from async code
+
+Django 3.2 has no async ORM, so async views hand their database work to a bounded pool of threads. Unlike the
+default `sync_to_async`, which runs every call on one shared thread, the pool lets up to
+`AUDIOFILE_ASYNC_DB_THREADS` requests wait on the database at the same time, each thread holding its own connection.
+"""
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(max_workers):
+    """Thread pool shared by every async view, one per pool size"""
+
+    with _executors_lock:
+        if max_workers not in _executors:
+            _executors[max_workers] = ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix='audiofile-db'
+            )
+        return _executors[max_workers]
+
+
+def call_with_connection(func, *args, **kwargs):
+    """
+    Call `func` on a pool thread, discarding connections that went stale or past `CONN_MAX_AGE`
+
+    Pool threads are not request threads, so the request_started/request_finished handlers doing this for sync views
+    never run on them.
+    """
+
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def database_sync_to_async(func):
+    """
+    Wrap a function touching the database so async code can await it
+
+    With `AUDIOFILE_ASYNC_DB_THREADS` set to 0 calls go through Django's thread sensitive `sync_to_async` instead, which
+    keeps them on the connection of the calling thread, e.g. inside a test case transaction.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        max_workers = settings.AUDIOFILE_ASYNC_DB_THREADS
+        if not max_workers:
+            return await sync_to_async(func)(*args, **kwargs)
+        return await sync_to_async(
+            call_with_connection,
+            thread_sensitive=False,
+            executor=get_executor(max_workers)
+        )(func, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,61 @@
+"""
+PostgreSQL backend taking its connections from a `pool.ConnectionPool`
+
+Pooling is configured with a `POOL` dictionary in the database settings, holding the keyword arguments of the pool.
+Without it the backend behaves exactly like Django's own.
+"""
+import psycopg2.extras
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+
+from core.db_backends.postgresql import pool
+from core.db_backends.postgresql.creation import DatabaseCreation
+
+
+def connect(conn_params):
+    """Open a connection the way Django's backend does, independently of the thread asking for it"""
+
+    connection = base.Database.connect(**conn_params)
+    psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+    return connection
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    creation_class = DatabaseCreation
+    connection_pool = None
+
+    def get_pool(self, conn_params):
+
+        options = self.settings_dict.get('POOL')
+        if options is None:
+            return None
+        return pool.get_pool(tuple(sorted(conn_params.items())), lambda: connect(conn_params), **options)
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+
+        connection_pool = self.get_pool(conn_params)
+        if connection_pool is None:
+            return super().get_new_connection(conn_params)
+
+        connection = connection_pool.getconn()
+        self.connection_pool = connection_pool
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+
+        if self.connection_pool is None or self.connection is None:
+            return super()._close()
+        connection_pool, self.connection_pool = self.connection_pool, None
+        # A connection closed inside an atomic block stays referenced by this wrapper, it must not be handed out again
+        with self.wrap_database_errors:
+            connection_pool.putconn(self.connection, discard=self.in_atomic_block)
@@ -0,0 +1,18 @@
+from django.db.backends.postgresql import creation
+
+from core.db_backends.postgresql import pool
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    """Close pooled connections to a database before it is dropped or used as a template"""
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+
+        pool.close_pools(database=test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+
+        self.connection.close()
+        pool.close_pools(database=self.connection.settings_dict['NAME'])
+        super()._clone_test_db(suffix, verbosity, keepdb)
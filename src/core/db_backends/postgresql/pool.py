@@ -0,0 +1,323 @@
+"""
+Pool of open psycopg2 connections shared by the threads of a process
+
+Django 3.2 opens a connection per request with `CONN_MAX_AGE = 0` and keeps one per thread otherwise. The pool sits
+below Django's connection handling instead: closing a Django connection hands the psycopg2 connection back to the
+pool, and opening one takes an idle connection from it, so request latency no longer includes connection setup.
+"""
+import threading
+import time
+from collections import deque
+
+from psycopg2 import OperationalError, extensions
+
+from core import metrics
+
+
+class PooledConnection:
+    """An open connection and the times it was opened and last handed back"""
+
+    __slots__ = ('connection', 'opened_at', 'returned_at')
+
+    def __init__(self, connection):
+
+        self.connection = connection
+        self.opened_at = self.returned_at = time.monotonic()
+
+
+class ConnectionPool:
+    """
+    Bounded pool of connections created by `connect`
+
+    At most `max_size` connections are open at a time, callers wait up to `timeout` seconds for one to be handed back
+    once they all are in use. Idle connections older than `max_lifetime` seconds are closed instead of being reused,
+    and those idle for more than `health_check_interval` seconds are checked with a `SELECT 1` first. Connections
+    discarded below `min_size` are replaced by a background thread.
+
+    Connections are opened, checked, rolled back and closed without holding the lock, so that a slow server only
+    holds up the callers that need it.
+    """
+
+    def __init__(self, connect, min_size=0, max_size=20, timeout=30, max_lifetime=3600, health_check_interval=30):
+
+        if max_size < 1 or min_size > max_size:
+            raise ValueError('Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1')
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+
+        self._idle = deque()
+        self._in_use = {}
+        # Connections taken by callers while being opened or checked, which count towards `max_size`
+        self._pending = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self.refill_thread = None
+
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self.opened = 0
+        self.discarded = 0
+
+        for _ in range(min_size):
+            self._idle.append(self._open())
+
+    @property
+    def size(self):
+        """Number of open connections, idle or in use"""
+
+        return len(self._idle) + len(self._in_use)
+
+    def _open(self):
+
+        pooled = PooledConnection(self.connect())
+        self.opened += 1
+        return pooled
+
+    @staticmethod
+    def _close_connection(pooled):
+
+        try:
+            pooled.connection.close()
+        except Exception:
+            pass
+
+    def _refill_if_needed(self):
+        """Start replacing the connections missing below `min_size`, the lock is held by the caller"""
+
+        if self._closed or self.size + self._pending >= self.min_size:
+            return
+        if self.refill_thread is None or not self.refill_thread.is_alive():
+            self.refill_thread = threading.Thread(target=self._refill, name='connection-pool-refill', daemon=True)
+            self.refill_thread.start()
+
+    def _refill(self):
+
+        while True:
+            with self._condition:
+                if self._closed or self.size + self._pending >= self.min_size:
+                    return
+                self._pending += 1
+            try:
+                pooled = PooledConnection(self.connect())
+            except Exception:
+                with self._condition:
+                    self._pending -= 1
+                return
+            with self._condition:
+                self._pending -= 1
+                closed = self._closed
+                if not closed:
+                    self.opened += 1
+                    self._idle.appendleft(pooled)
+                    self._condition.notify()
+            if closed:
+                self._close_connection(pooled)
+                return
+
+    def is_healthy(self, pooled, now):
+        """Whether an idle connection can be handed out again"""
+
+        if pooled.connection.closed or now - pooled.opened_at >= self.max_lifetime:
+            return False
+        if now - pooled.returned_at < self.health_check_interval:
+            return True
+        try:
+            with pooled.connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not pooled.connection.autocommit:
+                pooled.connection.rollback()
+        except Exception:
+            return False
+        return True
+
+    def _reserve(self, started_at):
+        """
+        Take an idle connection, or the right to open one, waiting while `max_size` connections are open
+
+        Returns the idle connection, or None when one has to be opened.
+        """
+
+        waited = False
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise OperationalError('Connection pool is closed')
+                if self._idle or self.size + self._pending < self.max_size:
+                    break
+                waited = True
+                remaining = self.timeout - (time.monotonic() - started_at)
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    self.timeouts += 1
+                    self.wait_seconds += time.monotonic() - started_at
+                    raise OperationalError(
+                        f'No connection available within {self.timeout} seconds, all {self.max_size} are in use'
+                    )
+            if waited:
+                self.waits += 1
+                self.wait_seconds += time.monotonic() - started_at
+            self._pending += 1
+            return self._idle.pop() if self._idle else None
+
+    def getconn(self):
+        """Hand out an idle connection, open a new one while below `max_size` or wait for one to be handed back"""
+
+        started_at = time.monotonic()
+        while True:
+            pooled = self._reserve(started_at)
+            if pooled is None:
+                try:
+                    pooled = PooledConnection(self.connect())
+                except Exception:
+                    with self._condition:
+                        self._pending -= 1
+                        self._condition.notify()
+                    raise
+                with self._condition:
+                    self.opened += 1
+                break
+            if self.is_healthy(pooled, time.monotonic()):
+                break
+            self._close_connection(pooled)
+            with self._condition:
+                self._pending -= 1
+                self.discarded += 1
+                self._refill_if_needed()
+                self._condition.notify()
+
+        with self._condition:
+            self._pending -= 1
+            self._in_use[id(pooled.connection)] = pooled
+            self.checkouts += 1
+        return pooled.connection
+
+    def putconn(self, connection, discard=False):
+        """Hand a connection back, rolling back an open transaction, or close it when broken or `discard` is set"""
+
+        # The connection still belongs to the caller until it is back in the pool, it is cleaned up without the lock
+        if not discard and not connection.closed:
+            status = connection.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    connection.rollback()
+                except Exception:
+                    discard = True
+        else:
+            discard = True
+
+        with self._condition:
+            pooled = self._in_use.pop(id(connection), None)
+            if pooled is not None:
+                discard = discard or self._closed
+                if discard:
+                    self.discarded += 1
+                    self._refill_if_needed()
+                else:
+                    pooled.returned_at = time.monotonic()
+                    self._idle.append(pooled)
+                self._condition.notify()
+        if pooled is None or discard:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def close(self):
+        """Close the idle connections and every connection handed back from now on"""
+
+        with self._condition:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self.discarded += len(idle)
+            self._condition.notify_all()
+        for pooled in idle:
+            self._close_connection(pooled)
+
+    def stats(self):
+
+        with self._condition:
+            return {
+                'size': self.size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_seconds': round(self.wait_seconds, 6),
+                'timeouts': self.timeouts,
+                'opened': self.opened,
+                'discarded': self.discarded,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, connect, **options):
+    """Pool of the connections matching `key`, created on first use"""
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._closed:
+            pool = _pools[key] = ConnectionPool(connect, **options)
+        return pool
+
+
+def close_pools(database=None):
+    """Close the pools of every database, or of the named one, e.g. before it is dropped"""
+
+    with _pools_lock:
+        for key, pool in list(_pools.items()):
+            if database is None or dict(key).get('database') == database:
+                pool.close()
+                del _pools[key]
+
+
+def pool_stats():
+    """Stats of every pool, along with the name of its database"""
+
+    with _pools_lock:
+        pools = list(_pools.items())
+    return [{'database': dict(key).get('database', ''), **pool.stats()} for key, pool in pools]
+
+
+POOL_METRICS = [
+    ('audiofile_db_pool_connections', 'gauge', 'Open pooled connections by state', None),
+    ('audiofile_db_pool_max_size', 'gauge', 'Most connections a pool opens', 'max_size'),
+    ('audiofile_db_pool_checkouts_total', 'counter', 'Connections handed out', 'checkouts'),
+    ('audiofile_db_pool_waits_total', 'counter', 'Checkouts that waited for a connection', 'waits'),
+    ('audiofile_db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a connection', 'wait_seconds'),
+    ('audiofile_db_pool_timeouts_total', 'counter', 'Checkouts that gave up waiting', 'timeouts'),
+    ('audiofile_db_pool_opened_total', 'counter', 'Connections opened', 'opened'),
+    ('audiofile_db_pool_discarded_total', 'counter', 'Broken, expired or failing connections closed', 'discarded'),
+]
+
+
+def collect_pool_metrics():
+    """Stats of every pool of this process, see `core.metrics.MetricsRegistry.register_collector`"""
+
+    stats = pool_stats()
+    collected = []
+    for name, metric_type, description, stat in POOL_METRICS:
+        if stat is None:
+            samples = [
+                ((('database', pool['database']), ('state', state)), pool[state])
+                for pool in stats for state in ('idle', 'in_use')
+            ]
+        else:
+            samples = [((('database', pool['database']),), pool[stat]) for pool in stats]
+        collected.append((name, metric_type, description, samples))
+    return collected
+
+
+metrics.registry.register_collector(collect_pool_metrics)
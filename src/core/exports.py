@@ -0,0 +1,237 @@
+"""
+Bulk export of audiofiles with PostgreSQL COPY
+
+A table is split into ranges of ids, each exported with `COPY ... TO STDOUT` into its own, optionally gzip compressed,
+part file by a pool of processes. Rows are streamed from the server to the file, so memory stays bounded whatever
+the size of the table. Every process reads through a snapshot exported by the transaction that planned the ranges,
+the parts of a table are as consistent as a single scan. Exporting in a single process reads every part in that one
+repeatable read transaction instead.
+
+Columns are those of the API representation. In CSV output lists are JSON arrays, as `import_audiofiles` reads them,
+and times are written in UTC as the API writes them, ending with `Z`.
+"""
+import gzip
+import json
+import multiprocessing
+import os
+import time
+from concurrent import futures
+
+from django.contrib.postgres.fields import ArrayField
+from django.db import connection, transaction
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import DateTimeField, Max, Min
+
+from core import mixins, workers
+from core.fast_serializers import get_field_plan
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+FORMATS = [CSV, NDJSON]
+GZIP = 'gzip'
+COMPRESSIONS = [GZIP, 'none']
+
+DEFAULT_ROWS_PER_PART = 1000000
+
+
+def get_model(audiofiletype):
+
+    return mixins.AudioFileModelSerializerMappingMixin.audio_type_serializer_model_mapping[audiofiletype]['model']
+
+
+def get_columns(audiofiletype):
+    """
+    Output names and model fields of the columns, those of the API representation
+
+    Fields the fast serialization path does not support are exported too, as long as each reads a model field.
+    """
+
+    serializer_class = mixins.AudioFileModelSerializerMappingMixin.audio_type_serializer_mapping[audiofiletype]
+    model = get_model(audiofiletype)
+    field_plan = get_field_plan(serializer_class)
+    if field_plan is not None:
+        sources = [(name, source) for name, source, _ in field_plan.entries]
+    else:
+        sources = [(name, field.source) for name, field in serializer_class().fields.items() if not field.write_only]
+
+    columns = []
+    for name, source in sources:
+        try:
+            columns.append((name, model._meta.get_field(source)))
+        except FieldDoesNotExist:
+            raise ValueError(
+                f'Field {name} of {serializer_class.__name__} does not read a column of {model._meta.db_table}, '
+                f'{audiofiletype} cannot be exported'
+            ) from None
+    return columns
+
+
+def get_select_sql(audiofiletype, output_format):
+    """Query of the rows of an id range, taking the bounds as parameters"""
+
+    quote_name = connection.ops.quote_name
+    select_list = []
+    for name, field in get_columns(audiofiletype):
+        column = quote_name(field.column)
+        if output_format == CSV and isinstance(field, ArrayField):
+            # Empty lists are left out like in the input of `import_audiofiles`, whose serializers reject them
+            column = f"array_to_json(NULLIF({column}, '{{}}'))"
+        elif isinstance(field, DateTimeField):
+            # Microseconds are left out when zero, like by datetime.isoformat()
+            column = (
+                f"regexp_replace(to_char({column} AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS.US'), "
+                f"'\\.0{{6}}$', '') || 'Z'"
+            )
+        select_list.append(f'{column} AS {quote_name(name)}')
+
+    table = quote_name(get_model(audiofiletype)._meta.db_table)
+    sql = f'SELECT {", ".join(select_list)} FROM {table} WHERE "id" >= %s AND "id" < %s ORDER BY "id"'
+    if output_format == NDJSON:
+        # CSV without quoting nor delimiter leaves the JSON of each row as it is, where the text format would escape
+        # its backslashes
+        return (
+            f'COPY (SELECT row_to_json(row) FROM ({sql}) AS row) TO STDOUT '
+            f"WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+        )
+    return f'COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true)'
+
+
+def get_part_name(index, output_format, compression):
+
+    return f'part-{index:05d}.{output_format}' + ('.gz' if compression == GZIP else '')
+
+
+def plan_ranges(model, rows_per_part):
+    """[start, end) id ranges covering a table, each spanning `rows_per_part` ids"""
+
+    bounds = model.objects.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return []
+    first, end = bounds['first'], bounds['last'] + 1
+    return [
+        (start, min(start + rows_per_part, end))
+        for start in range(first, end, rows_per_part)
+    ]
+
+
+def export_range(audiofiletype, output_format, compression, compress_level, path, start, end, snapshot=None):
+    """
+    Write the rows of an id range to `path`, return the number of rows and bytes written
+
+    With a `snapshot`, the rows are read through that exported snapshot in a transaction of their own, as the worker
+    processes do.
+    """
+
+    output = gzip.open(path, 'wb', compresslevel=compress_level) if compression == GZIP else open(path, 'wb')
+    with transaction.atomic(), output, connection.cursor() as cursor:
+        if snapshot is not None:
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            cursor.execute('SET TRANSACTION SNAPSHOT %s', [snapshot])
+        # COPY takes no parameters, the bounds are bound on the client
+        sql = cursor.mogrify(get_select_sql(audiofiletype, output_format), [start, end]).decode()
+        cursor.copy_expert(sql, output)
+        rows = cursor.rowcount
+    return rows, os.path.getsize(path)
+
+
+class Exporter:
+    """
+    Export audiofiles of some types into part files of `output_dir/<audiofiletype>/`, on `processes` processes
+
+    `processes` 0 exports in this process.
+    """
+
+    def __init__(self, output_dir, output_format=CSV, compression=GZIP, compress_level=6, processes=0,
+                 rows_per_part=DEFAULT_ROWS_PER_PART):
+
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.compression = compression
+        self.compress_level = compress_level
+        self.processes = processes
+        self.rows_per_part = rows_per_part
+
+    def get_type_dir(self, audiofiletype):
+        """Directory of the parts of a type, emptied of the parts of an earlier export"""
+
+        type_dir = os.path.join(self.output_dir, audiofiletype)
+        os.makedirs(type_dir, exist_ok=True)
+        for name in os.listdir(type_dir):
+            if name.startswith('part-'):
+                os.unlink(os.path.join(type_dir, name))
+        return type_dir
+
+    def run(self, audiofiletypes):
+        """Export every type, write `manifest.json` in the output directory and return it"""
+
+        manifest = {'format': self.output_format, 'compression': self.compression, 'types': {}}
+        start = time.perf_counter()
+        executor = None
+        if self.processes:
+            executor = futures.ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=workers.setup,
+                # Workers read the database the exporting process is connected to
+                initargs=(connection.settings_dict,)
+            )
+        try:
+            for audiofiletype in audiofiletypes:
+                manifest['types'][audiofiletype] = self.export_type(audiofiletype, executor)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        seconds = time.perf_counter() - start
+        rows = sum(report['rows'] for report in manifest['types'].values())
+        manifest.update(rows=rows, seconds=round(seconds, 3), rows_per_second=round(rows / seconds, 1))
+        with open(os.path.join(self.output_dir, 'manifest.json'), 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        return manifest
+
+    def export_type(self, audiofiletype, executor):
+
+        type_dir = self.get_type_dir(audiofiletype)
+        start = time.perf_counter()
+        parts = []
+        # Within a transaction that already ran queries the isolation level can no longer be set, its own applies
+        set_isolation = not connection.in_atomic_block
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                # Parts exported in this process are read in this transaction, so planning and every part see the
+                # same rows
+                if set_isolation:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+                if executor is not None:
+                    # The snapshot the worker processes read through, which lives as long as this transaction
+                    cursor.execute('SELECT pg_export_snapshot()')
+                    snapshot = cursor.fetchone()[0]
+            ranges = plan_ranges(get_model(audiofiletype), self.rows_per_part)
+
+            calls = []
+            for index, (range_start, range_end) in enumerate(ranges):
+                name = get_part_name(index, self.output_format, self.compression)
+                args = (
+                    audiofiletype, self.output_format, self.compression, self.compress_level,
+                    os.path.join(type_dir, name), range_start, range_end
+                )
+                parts.append({'name': name, 'ids': [range_start, range_end]})
+                calls.append(args)
+
+            if executor is None:
+                results = [export_range(*args) for args in calls]
+            else:
+                results = executor.map(export_range, *zip(*calls), [snapshot] * len(calls)) if calls else []
+            for part, (rows, size) in zip(parts, results):
+                part.update(rows=rows, bytes=size)
+
+        seconds = time.perf_counter() - start
+        rows = sum(part['rows'] for part in parts)
+        return {
+            'columns': [name for name, _ in get_columns(audiofiletype)],
+            'rows': rows,
+            'bytes': sum(part['bytes'] for part in parts),
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(rows / seconds, 1),
+            'parts': parts,
+        }
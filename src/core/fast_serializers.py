@@ -0,0 +1,106 @@
+"""
+Fast representation of audiofile rows read with `QuerySet.values()`
+
+A field plan is derived once per serializer class from its fields. Fields whose representation of a database value
+is the value itself are copied as they are and datetimes are formatted the way `DateTimeField` does, so the output is
+identical to the serializer's. Serializers with any other kind of field get no plan and keep using the regular
+serializer path.
+"""
+import functools
+
+from django.utils import timezone
+from rest_framework import ISO_8601, fields as serializer_fields
+from rest_framework.settings import api_settings
+
+from core import metrics
+
+PASSTHROUGH_FIELDS = (serializer_fields.CharField, serializer_fields.IntegerField)
+
+
+def bind_datetime_field(field):
+    """
+    Return a function binding a `DateTimeField` to the timezone active when it is called
+
+    `DateTimeField.to_representation` looks the current timezone up for every value, which costs more than the
+    formatting itself, so the timezone is resolved once per batch of rows instead.
+    """
+
+    def bind():
+        field_timezone = getattr(field, 'timezone', field.default_timezone())
+        if field_timezone is None:
+            return field.to_representation
+
+        def to_representation(value):
+            if isinstance(value, str) or timezone.is_naive(value):
+                return field.to_representation(value)
+            value = value.astimezone(field_timezone).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+        return to_representation
+
+    return bind
+
+
+class FieldPlan:
+    """Output name, row key and optional conversion binder of every readable field of a serializer"""
+
+    def __init__(self, entries):
+
+        self.entries = tuple(entries)
+        self.sources = tuple(source for _, source, _ in self.entries)
+
+    def bind(self):
+        """Return a function building the representation of a row"""
+
+        entries = [(name, source, None if bind is None else bind()) for name, source, bind in self.entries]
+
+        def to_representation(row):
+            representation = {}
+            for name, source, convert in entries:
+                value = row[source]
+                representation[name] = value if convert is None or value is None else convert(value)
+            return representation
+
+        return to_representation
+
+    def to_representation(self, row):
+
+        return self.bind()(row)
+
+    def to_representations(self, rows):
+
+        with metrics.phase('serialization'):
+            to_representation = self.bind()
+            return [to_representation(row) for row in rows]
+
+
+def get_field_entry(name, field):
+    """Plan entry of a single serializer field, None when its representation cannot be built from a row value"""
+
+    if '.' in field.source or field.source == '*':
+        return None
+    if isinstance(field, serializer_fields.ListField):
+        return (name, field.source, None) if isinstance(field.child, PASSTHROUGH_FIELDS) else None
+    if isinstance(field, PASSTHROUGH_FIELDS):
+        return name, field.source, None
+    if isinstance(field, serializer_fields.DateTimeField):
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        if output_format is None or output_format.lower() != ISO_8601:
+            return None
+        return name, field.source, bind_datetime_field(field)
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_field_plan(serializer_class):
+    """Field plan of a serializer class, None if one of its fields is not supported"""
+
+    entries = []
+    for name, field in serializer_class().fields.items():
+        if field.write_only:
+            continue
+        entry = get_field_entry(name, field)
+        if entry is None:
+            return None
+        entries.append(entry)
+    return FieldPlan(entries)
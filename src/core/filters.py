@@ -0,0 +1,85 @@
+import datetime
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.utils import timezone
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+
+
+class AudioFileFilterBackend(filters.BaseFilterBackend):
+    """
+    Filter audiofiles with query parameters
+
+    Parameters naming a field the model of the requested audiofiletype does not have are ignored, so `host` only
+    narrows podcasts and `author`/`narrator` only narrow audiobooks.
+    """
+
+    filter_params = {
+        'name': ('name', 'exact'),
+        'duration_min': ('duration', 'gte'),
+        'duration_max': ('duration', 'lte'),
+        'uploaded_after': ('uploaded_time', 'gte'),
+        'uploaded_before': ('uploaded_time', 'lte'),
+        'host': ('host', 'exact'),
+        'author': ('author', 'exact'),
+        'narrator': ('narrator', 'exact'),
+        'participants': ('participants', 'contains'),
+    }
+
+    def filter_queryset(self, request, queryset, view):
+
+        return queryset.filter(**self.get_filter_kwargs(request, queryset))
+
+    def applies_to(self, request, model):
+        """Whether every filter parameter of the request names a field of the model, for listings of every type"""
+
+        for param, (field_name, _) in self.filter_params.items():
+            if param not in request.query_params:
+                continue
+            try:
+                model._meta.get_field(field_name)
+            except FieldDoesNotExist:
+                return False
+        return True
+
+    def get_filter_kwargs(self, request, queryset):
+        """Map the query parameters of the request to queryset lookups on the model"""
+
+        filter_kwargs = {}
+        errors = {}
+        for param, (field_name, lookup) in self.filter_params.items():
+            value = request.query_params.get(param)
+            if value is None:
+                continue
+            try:
+                field = queryset.model._meta.get_field(field_name)
+            except FieldDoesNotExist:
+                continue
+            try:
+                value = field.to_python(self.parse_value(field_name, value))
+            except DjangoValidationError as exc:
+                errors[param] = exc.messages
+                continue
+            if isinstance(value, datetime.datetime) and timezone.is_naive(value):
+                value = timezone.make_aware(value)
+            filter_kwargs[f'{field_name}__{lookup}'] = value
+        if errors:
+            raise ValidationError(detail=errors)
+        return filter_kwargs
+
+    def parse_value(self, field_name, value):
+        """Comma separated values are used for containment lookups on participants"""
+
+        if field_name == 'participants':
+            return [participant.strip() for participant in value.split(',') if participant.strip()]
+        return value
+
+
+class AudioFileOrderingFilter(filters.OrderingFilter):
+
+    ordering_fields = ['name', 'duration', 'uploaded_time']
+
+
+class AudioFileFeedOrderingFilter(filters.OrderingFilter):
+
+    ordering_fields = ['uploaded_time']
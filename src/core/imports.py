@@ -0,0 +1,329 @@
+"""
+Bulk loading of audiofiles with PostgreSQL COPY
+
+Rows are streamed from CSV or NDJSON input and grouped in chunks. Each chunk is validated on a pool of processes by
+the serializer of its audiofiletype, so the rules of the API apply (including the limit of 10 participants), and
+encoded in the text format of COPY. Chunks are then copied in input order, each in its own transaction which also
+records the progress of the import in `AudioImport`, so a restarted import skips the chunks already loaded. Recording
+a chunk only succeeds when the progress is still at the chunk before it, a concurrent run of the same import fails
+rather than loads the chunk again.
+
+List fields such as `participants` are JSON arrays in CSV input. Like audiofiles created through the API, imported
+rows are uploaded and last modified at the time of the import.
+"""
+import csv
+import datetime
+import functools
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent import futures
+
+import django
+from django.contrib.postgres.fields import ArrayField
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import fields as serializer_fields
+from rest_framework.exceptions import ValidationError
+
+from core import mixins, models
+from core.cache import response_cache
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+FORMATS = [CSV, NDJSON]
+
+DEFAULT_CHUNK_SIZE = 10000
+# Columns filled by database triggers
+TRIGGER_COLUMNS = {'search_vector'}
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def get_mapping(audiofiletype):
+
+    return mixins.AudioFileModelSerializerMappingMixin.audio_type_serializer_model_mapping[audiofiletype]
+
+
+def get_columns(model):
+    """Fields of the columns written by COPY"""
+
+    return [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key and field.name not in TRIGGER_COLUMNS
+    ]
+
+
+def get_copy_sql(model):
+
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in get_columns(model))
+    return f'COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) FROM STDIN'
+
+
+@functools.lru_cache(maxsize=None)
+def get_list_fields(serializer_class):
+    """Names of the list fields of a serializer, given as JSON arrays in CSV input"""
+
+    return {
+        name for name, field in serializer_class().fields.items()
+        if isinstance(field, serializer_fields.ListField) and not field.read_only
+    }
+
+
+def make_key(path, audiofiletype, input_format, chunk_size):
+    """Key of the progress of importing a file, which changes along with the file"""
+
+    stat = os.stat(path)
+    identity = f'{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}:{audiofiletype}:{input_format}:{chunk_size}'
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+
+def read_rows(file, input_format):
+    """
+    Yield the line number and row of every record of a text file
+
+    CSV records are dicts of strings, NDJSON lines are left undecoded for the validating processes to parse.
+    """
+
+    if input_format == CSV:
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(file, 1):
+        if line.strip():
+            yield line_number, line
+
+
+def iter_chunks(rows, chunk_size):
+
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_row(row, list_fields):
+    """Return the data of a row and None, or None and the errors of a row that is not an object"""
+
+    if isinstance(row, str):
+        try:
+            row = json.loads(row)
+        except ValueError as exc:
+            return None, {'non_field_errors': [f'Invalid JSON: {exc}']}
+        if not isinstance(row, dict):
+            return None, {'non_field_errors': ['Expected a JSON object']}
+        return row, None
+
+    errors = {}
+    for name in list_fields:
+        value = row.get(name)
+        if value == '':
+            # An empty cell leaves the list to its default, like a missing key in NDJSON input
+            del row[name]
+        elif value:
+            try:
+                row[name] = json.loads(value)
+            except ValueError:
+                errors[name] = ['Expected a JSON array']
+    return (None, errors) if errors else (row, None)
+
+
+def encode_value(field, value):
+    """A value in the text format of COPY"""
+
+    if value is None:
+        return '\\N'
+    if isinstance(field, ArrayField):
+        value = '{' + ','.join(
+            '"' + str(item).replace('\\', '\\\\').replace('"', '\\"') + '"' for item in value
+        ) + '}'
+    elif isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return value.translate(COPY_ESCAPES)
+
+
+def get_defaults(columns):
+    """
+    (field, value) of every column, the value of a row missing from its validated data
+
+    What saving a model instance would write, without building one for every row.
+    """
+
+    now = timezone.now()
+    defaults = []
+    for field in columns:
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            defaults.append((field, now))
+        else:
+            defaults.append((field, field.get_default() if field.has_default() else None))
+    return defaults
+
+
+def validate_chunk(audiofiletype, rows):
+    """
+    Validate a chunk of (line number, row) pairs with the serializer of the audiofiletype
+
+    Returns the COPY data of the valid rows, their number and the (line number, errors) of the rejected rows. Runs in
+    the validating processes, without touching the database.
+    """
+
+    mapping = get_mapping(audiofiletype)
+    model, serializer_class = mapping['model'], mapping['serializer']
+    columns = get_columns(model)
+    list_fields = get_list_fields(serializer_class)
+
+    # Binding the fields of a serializer costs far more than validating a row, a single one validates every row like
+    # the child of a list serializer does
+    serializer = serializer_class()
+    defaults = get_defaults(columns)
+    lines, rejected = [], []
+    for line_number, row in rows:
+        data, errors = parse_row(row, list_fields)
+        if errors is None:
+            try:
+                validated_data = serializer.run_validation(data)
+            except ValidationError as exc:
+                errors = json.loads(json.dumps(exc.detail))
+            else:
+                lines.append('\t'.join(
+                    encode_value(field, validated_data.get(field.name, default)) for field, default in defaults
+                ))
+                continue
+        rejected.append((line_number, errors))
+    return ''.join(f'{line}\n' for line in lines).encode(), len(lines), rejected
+
+
+class Importer:
+    """
+    Load rows of an audiofiletype with COPY, validating chunks of `chunk_size` rows on `processes` processes
+
+    With a `key`, the progress is recorded in the `AudioImport` of that key and an import of the same key resumes
+    after the last chunk it committed. `processes` 0 validates in this process.
+    """
+
+    def __init__(self, audiofiletype, processes=0, chunk_size=DEFAULT_CHUNK_SIZE, key=None, source=''):
+
+        self.audiofiletype = audiofiletype
+        self.model = get_mapping(audiofiletype)['model']
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.key = key
+        self.source = source
+
+    def get_progress(self):
+        """`AudioImport` of the key, None without a key"""
+
+        if self.key is None:
+            return None
+        progress, _ = models.AudioImport.objects.get_or_create(
+            key=self.key,
+            defaults={'audiofiletype': self.audiofiletype, 'source': self.source[:1024], 'chunk_size': self.chunk_size}
+        )
+        if (progress.audiofiletype, progress.chunk_size) != (self.audiofiletype, self.chunk_size):
+            raise ValueError(
+                f'Import {self.key} loads {progress.audiofiletype} in chunks of {progress.chunk_size} rows, '
+                f'not {self.audiofiletype} in chunks of {self.chunk_size}'
+            )
+        return progress
+
+    def copy_chunk(self, index, data, count, rejected, rejects=None):
+        """
+        Copy the rows of the chunk `index`, counted from 0, and record it in the progress of the import, all at once
+
+        The progress is updated first, its row stays locked until the rows are copied. The errors of the rejected
+        rows are written to `rejects` and flushed before the transaction commits, so a run stopped in between leaves
+        them written rather than counted and lost. Should the commit fail instead, the next run writes them again.
+        """
+
+        with transaction.atomic():
+            if self.key is not None:
+                recorded = models.AudioImport.objects.filter(pk=self.key, chunks=index).update(
+                    chunks=F('chunks') + 1,
+                    imported=F('imported') + count,
+                    rejected=F('rejected') + len(rejected)
+                )
+                if not recorded:
+                    raise ValueError(f'Chunk {index + 1} of import {self.key} was loaded by another run')
+            if count:
+                with connection.cursor() as cursor:
+                    cursor.copy_expert(get_copy_sql(self.model), io.BytesIO(data))
+            if rejects is not None and rejected:
+                for line_number, errors in rejected:
+                    rejects.write(json.dumps({'line': line_number, 'errors': errors}) + '\n')
+                rejects.flush()
+
+    def run(self, rows, rejects=None, progress_callback=None):
+        """
+        Import `rows` of (line number, row), return the counters of this run
+
+        The errors of rejected rows are written to `rejects` as JSON lines, `progress_callback` is called with the
+        counters after every chunk.
+        """
+
+        progress = self.get_progress()
+        skipped_chunks = progress.chunks if progress else 0
+        chunks = iter_chunks(rows, self.chunk_size)
+        # Rows of the chunks loaded before are read again, but neither validated nor copied
+        for _ in itertools.islice(chunks, skipped_chunks):
+            pass
+
+        counters = {'rows': 0, 'imported': 0, 'rejected': 0, 'chunks': 0, 'skipped_chunks': skipped_chunks}
+        start = time.perf_counter()
+        executor = None
+        if self.processes:
+            executor = futures.ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup
+            )
+        try:
+            for data, count, rejected in self.validate(chunks, executor):
+                self.copy_chunk(skipped_chunks + counters['chunks'], data, count, rejected, rejects)
+                counters['rows'] += count + len(rejected)
+                counters['imported'] += count
+                counters['rejected'] += len(rejected)
+                counters['chunks'] += 1
+                if progress_callback is not None:
+                    progress_callback(self.get_report(counters, start))
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            if counters['imported']:
+                response_cache.invalidate(self.audiofiletype)
+        return self.get_report(counters, start)
+
+    def validate(self, chunks, executor):
+        """Yield the validated chunks in order, keeping twice as many chunks as processes in flight"""
+
+        if executor is None:
+            for chunk in chunks:
+                yield validate_chunk(self.audiofiletype, chunk)
+            return
+
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(validate_chunk, self.audiofiletype, chunk))
+            if len(pending) >= 2 * self.processes:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    @staticmethod
+    def get_report(counters, start):
+
+        seconds = time.perf_counter() - start
+        return {
+            **counters,
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(counters['rows'] / seconds, 1) if seconds else 0.0,
+        }
@@ -0,0 +1,420 @@
+"""
+Database backed queue of audio processing jobs
+
+Jobs are rows of `AudioJob`, enqueued in the transaction that makes them necessary and run by the
+`run_audio_workers` command. A worker claims jobs with `SELECT ... FOR UPDATE SKIP LOCKED`, so any number of workers
+share the queue without handing out a job twice, and runs them on a pool of processes. Only the database is needed.
+
+The work of a job kind is split in three steps: `prepare` reads what the job needs from the database, `run` does the
+heavy lifting in a worker process without touching the database, and `finish` records its result.
+"""
+import logging
+import multiprocessing
+import threading
+import time
+import traceback
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+import django
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from core import blobs, constants, mixins, models, peaks, probing
+from core.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+
+class JobHandler:
+    """Steps of a kind of job, errors listed in `permanent_errors` fail a job without retrying it"""
+
+    permanent_errors = ()
+
+    def get_cached_result(self, job, audiofile):
+        """Result of the run step recorded by an earlier job on the same media, None when the job has to run"""
+
+        return None
+
+    def prepare(self, job, audiofile):
+        """Arguments of `run`, None when there is nothing to do"""
+
+        raise NotImplementedError
+
+    def run(self, *args):
+
+        raise NotImplementedError
+
+    def finish(self, job, audiofile, result):
+
+        raise NotImplementedError
+
+
+class ProbeJobHandler(JobHandler):
+    """Read duration and stream properties from the headers of the uploaded media"""
+
+    permanent_errors = (probing.ProbeError,)
+
+    def get_cached_result(self, job, audiofile):
+
+        blob = models.AudioBlob.objects.filter(name=audiofile.file).first()
+        return None if blob is None else blobs.get_info(blob)
+
+    def prepare(self, job, audiofile):
+
+        if not audiofile.file:
+            return None
+        return audiofile.file, get_storage()
+
+    def run(self, name, storage):
+
+        with storage.open(name) as file:
+            return probing.probe_file(file)
+
+    def finish(self, job, audiofile, result):
+
+        probing.apply_info(audiofile, result)
+        audiofile.save(update_fields=probing.PROBED_FIELDS + ['last_modified'])
+        blobs.record_info(audiofile.file, result)
+
+
+class PeaksJobHandler(JobHandler):
+    """Compute the waveform peaks of the uploaded media and store them next to it"""
+
+    permanent_errors = (peaks.PeaksError,)
+
+    def get_cached_result(self, job, audiofile):
+
+        peaks_name = models.AudioBlob.objects.filter(name=audiofile.file).values_list('peaks', flat=True).first()
+        return (audiofile.file, peaks_name) if peaks_name else None
+
+    def prepare(self, job, audiofile):
+
+        if not audiofile.file:
+            return None
+        return audiofile.file, get_storage()
+
+    def run(self, name, storage):
+
+        with storage.open(name) as file:
+            sample_rate, levels = peaks.compute_peaks(file)
+        peaks_name = f'{name}.peaks'
+        storage.write(peaks_name, peaks.encode_peaks(sample_rate, peaks.SAMPLES_PER_PEAK, levels))
+        return name, peaks_name
+
+    def finish(self, job, audiofile, result):
+
+        name, peaks_name = result
+        # The media may have been replaced while the peaks were computed, the peaks of a blob are kept for its other
+        # audiofiles though
+        updated = type(audiofile).objects.filter(pk=audiofile.pk, file=name).update(peaks=peaks_name)
+        if not blobs.record_peaks(name, peaks_name) and not updated:
+            transaction.on_commit(lambda: get_storage().delete(peaks_name))
+
+
+JOB_HANDLERS = {
+    constants.PROBE_JOB: ProbeJobHandler(),
+    constants.PEAKS_JOB: PeaksJobHandler(),
+}
+
+
+def enqueue(audiofile, kind):
+    """Queue a job for an audiofile, unless one of the same kind is still waiting to run"""
+
+    queued_job = models.AudioJob.objects.filter(
+        audiofiletype=audiofile.audiofiletype,
+        audiofileid=audiofile.pk,
+        kind=kind,
+        status=models.AudioJob.QUEUED
+    ).first()
+    if queued_job is not None:
+        return queued_job
+    return models.AudioJob.objects.create(audiofiletype=audiofile.audiofiletype, audiofileid=audiofile.pk, kind=kind)
+
+
+def run_job(kind, args):
+    """Run step of a job, in a worker process"""
+
+    return JOB_HANDLERS[kind].run(*args)
+
+
+def queue_stats():
+    """Number of jobs per status and age in seconds of the oldest job waiting to run"""
+
+    counts = dict(models.AudioJob.objects.values_list('status').annotate(count=Count('pk')).order_by())
+    oldest = models.AudioJob.objects.filter(status=models.AudioJob.QUEUED).aggregate(oldest=Min('created_time'))
+    return {
+        **{status: counts.get(status, 0) for status, _ in models.AudioJob.STATUS_CHOICES},
+        'oldest_queued_seconds': (timezone.now() - oldest['oldest']).total_seconds() if oldest['oldest'] else 0,
+    }
+
+
+class WorkerMetrics:
+    """Counters of a worker and its throughput since it started"""
+
+    def __init__(self):
+
+        self.started_at = time.monotonic()
+        self.claimed = 0
+        self.succeeded = 0
+        self.retried = 0
+        self.failed = 0
+        self.run_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+
+        with self._lock:
+            elapsed = time.monotonic() - self.started_at
+            done = self.succeeded + self.failed
+            return {
+                'claimed': self.claimed,
+                'succeeded': self.succeeded,
+                'retried': self.retried,
+                'failed': self.failed,
+                'jobs_per_second': round(done / elapsed, 3) if elapsed else 0.0,
+                'mean_run_seconds': round(self.run_seconds / (done + self.retried), 6) if done + self.retried else 0.0,
+            }
+
+
+class Worker:
+    """
+    Claim jobs and run them on `processes` worker processes, or in this process when `processes` is 0
+
+    A failed attempt is retried after `retry_delay` seconds, doubling with every attempt up to `max_retry_delay`.
+    A claimed job is leased for `lease_seconds`, after which another worker may claim it again.
+    """
+
+    retry_delay = 10
+    max_retry_delay = 3600
+    lease_seconds = 600
+
+    def __init__(self, processes=0, batch_size=None, poll_interval=1.0):
+
+        self.processes = processes
+        self.batch_size = batch_size or max(processes * 2, 1)
+        self.poll_interval = poll_interval
+        self.metrics = WorkerMetrics()
+        self.stopping = False
+
+    def claim(self, limit):
+        """
+        Lease up to `limit` runnable jobs to this worker
+
+        A job whose lease ran out counts the attempt of the worker that died running it, a job that keeps killing its
+        workers is failed once it ran out of attempts instead of being claimed again. The end of the lease identifies
+        it, so that a worker whose lease ran out cannot record the outcome of a job claimed again since.
+        """
+
+        now = timezone.now()
+        locked_until = now + timedelta(seconds=self.lease_seconds)
+        with transaction.atomic():
+            jobs = list(
+                models.AudioJob.objects.filter(
+                    Q(status=models.AudioJob.QUEUED, run_after__lte=now)
+                    | Q(status=models.AudioJob.RUNNING, locked_until__lt=now)
+                ).order_by('run_after', 'id').select_for_update(skip_locked=True)[:limit]
+            )
+            expired = [job for job in jobs if job.status == models.AudioJob.RUNNING]
+            for job in expired:
+                job.attempts += 1
+            exhausted = [job for job in expired if job.attempts >= job.max_attempts]
+            jobs = [job for job in jobs if job not in exhausted]
+            if expired:
+                models.AudioJob.objects.filter(pk__in=[job.pk for job in expired]).update(attempts=F('attempts') + 1)
+            if exhausted:
+                models.AudioJob.objects.filter(pk__in=[job.pk for job in exhausted]).update(
+                    status=models.AudioJob.FAILED,
+                    last_error='The lease of the job ran out, its worker died',
+                    locked_until=None,
+                    finished_time=now
+                )
+            if jobs:
+                models.AudioJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                    status=models.AudioJob.RUNNING,
+                    locked_until=locked_until,
+                    started_time=now
+                )
+        for job in exhausted:
+            logger.error('Job %s (%s) failed after %s attempts: its lease ran out', job.pk, job.kind, job.attempts)
+        for job in jobs:
+            job.status = models.AudioJob.RUNNING
+            job.locked_until = locked_until
+        self.metrics.add(claimed=len(jobs), failed=len(exhausted))
+        return jobs
+
+    def get_leased_job(self, job):
+        """Queryset of a job as long as this worker still holds its lease"""
+
+        return models.AudioJob.objects.filter(
+            pk=job.pk,
+            status=models.AudioJob.RUNNING,
+            locked_until=job.locked_until
+        )
+
+    def get_audiofile(self, job):
+
+        mapping = mixins.AudioFileModelSerializerMappingMixin.audio_type_serializer_model_mapping
+        model = mapping[job.audiofiletype]['model']
+        return model.objects.filter(pk=job.audiofileid).first()
+
+    def succeed(self, job):
+
+        if not self.get_leased_job(job).update(
+            status=models.AudioJob.SUCCEEDED,
+            attempts=job.attempts + 1,
+            locked_until=None,
+            finished_time=timezone.now()
+        ):
+            logger.warning('Job %s (%s) was claimed again once its lease ran out', job.pk, job.kind)
+            return
+        self.metrics.add(succeeded=1)
+
+    def fail(self, job, exc):
+        """Record a failed attempt, queueing the job again unless the error is permanent or it ran out of attempts"""
+
+        attempts = job.attempts + 1
+        error = ''.join(traceback.format_exception_only(type(exc), exc)).strip()
+        permanent = isinstance(exc, JOB_HANDLERS[job.kind].permanent_errors)
+        now = timezone.now()
+        if permanent or attempts >= job.max_attempts:
+            if not self.get_leased_job(job).update(
+                status=models.AudioJob.FAILED,
+                attempts=attempts,
+                last_error=error,
+                locked_until=None,
+                finished_time=now
+            ):
+                logger.warning('Job %s (%s) was claimed again once its lease ran out: %s', job.pk, job.kind, error)
+                return
+            logger.error('Job %s (%s) failed after %s attempts: %s', job.pk, job.kind, attempts, error)
+            self.metrics.add(failed=1)
+        else:
+            delay = min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+            if not self.get_leased_job(job).update(
+                status=models.AudioJob.QUEUED,
+                attempts=attempts,
+                last_error=error,
+                locked_until=None,
+                run_after=now + timedelta(seconds=delay)
+            ):
+                logger.warning('Job %s (%s) was claimed again once its lease ran out: %s', job.pk, job.kind, error)
+                return
+            logger.warning('Job %s (%s) failed, retrying in %s seconds: %s', job.pk, job.kind, delay, error)
+            self.metrics.add(retried=1)
+
+    def start(self, job, executor):
+        """
+        Prepare a claimed job and submit its run step, None when it completed without anything to run
+
+        The run step is skipped when the result of an earlier run on the same media was recorded.
+        """
+
+        handler = JOB_HANDLERS[job.kind]
+        try:
+            audiofile = self.get_audiofile(job)
+            result = args = None
+            if audiofile is not None:
+                result = handler.get_cached_result(job, audiofile)
+                if result is None:
+                    args = handler.prepare(job, audiofile)
+        except Exception as exc:
+            self.fail(job, exc)
+            return None
+        if result is None and args is None:
+            self.succeed(job)
+            return None
+        job.started_at = time.monotonic()
+        job.audiofile = audiofile
+        if result is not None:
+            future = futures.Future()
+            future.set_result(result)
+            return future
+        if executor is None:
+            future = futures.Future()
+            try:
+                future.set_result(run_job(job.kind, args))
+            except Exception as exc:
+                future.set_exception(exc)
+            return future
+        try:
+            return executor.submit(run_job, job.kind, args)
+        except BrokenProcessPool as exc:
+            # Failed like the jobs that were running when a worker process died, see `run`
+            future = futures.Future()
+            future.set_exception(exc)
+            return future
+
+    def complete(self, job, future):
+        """Record the outcome of the run step of a job"""
+
+        self.metrics.add(run_seconds=time.monotonic() - job.started_at)
+        try:
+            with transaction.atomic():
+                JOB_HANDLERS[job.kind].finish(job, job.audiofile, future.result())
+        except Exception as exc:
+            self.fail(job, exc)
+        else:
+            self.succeed(job)
+
+    def create_executor(self):
+
+        return futures.ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup
+        )
+
+    def run(self, once=False, max_jobs=None):
+        """
+        Process jobs until stopped, or until the queue is drained with `once`
+
+        A worker process dying, e.g. killed for running out of memory on a bad file, breaks the whole pool: every job
+        it was running fails an attempt and a new pool takes over.
+        """
+
+        executor = self.create_executor() if self.processes else None
+        running = {}
+        started = 0
+        try:
+            while not self.stopping:
+                free_slots = self.batch_size - len(running)
+                if max_jobs is not None:
+                    free_slots = min(free_slots, max_jobs - started)
+                jobs = self.claim(free_slots) if free_slots > 0 else []
+                for job in jobs:
+                    started += 1
+                    future = self.start(job, executor)
+                    if future is not None:
+                        running[future] = job
+
+                if not running:
+                    if (once and not jobs) or (max_jobs is not None and started >= max_jobs):
+                        break
+                    if not jobs:
+                        time.sleep(self.poll_interval)
+                    continue
+
+                done, _ = futures.wait(running, timeout=self.poll_interval, return_when=futures.FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    self.complete(running.pop(future), future)
+                    broken = broken or isinstance(future.exception(), BrokenProcessPool)
+                if broken and executor is not None:
+                    logger.error('A worker process died, starting a new pool')
+                    executor.shutdown(wait=False)
+                    executor = self.create_executor()
+        finally:
+            for future, job in running.items():
+                self.complete(job, future)
+            if executor is not None:
+                executor.shutdown()
+        return self.metrics.snapshot()
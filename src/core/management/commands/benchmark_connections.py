@@ -0,0 +1,48 @@
+import json
+
+from django.db import close_old_connections, connection
+from django.test import Client, override_settings
+from django.core.management.base import BaseCommand
+from rest_framework.reverse import reverse
+
+from core import benchmarks, constants, models
+from core.db_backends.postgresql import pool
+
+
+class Command(BaseCommand):
+    help = 'Compare request latency with and without the connection pool, each request closing its connection'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--repeat', type=int, default=500)
+
+    def handle(self, *args, **options):
+
+        pool_options = connection.settings_dict.get('POOL') or {}
+        report = {}
+
+        # Responses must not come from the cache, which would skip the database altogether
+        with benchmarks.benchmark_database(), override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        ):
+            song = models.Song.objects.create(name='Benchmark Song', duration=100)
+            url = reverse('common-actions-audio-file', kwargs={'audiofiletype': constants.SONG, 'audiofileid': song.pk})
+            client = Client()
+
+            def request():
+                client.get(url)
+                # What request_finished does outside of the test client, closing with CONN_MAX_AGE = 0
+                close_old_connections()
+
+            for mode, settings_pool in (('unpooled', None), ('pooled', pool_options)):
+                connection.close()
+                connection.settings_dict['POOL'] = settings_pool
+                request()
+                samples = benchmarks.time_calls(request, options['repeat'])
+                report[mode] = benchmarks.summarize(samples)
+
+            report['pools'] = pool.pool_stats()
+            connection.close()
+            connection.settings_dict['POOL'] = pool_options or None
+
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,220 @@
+import json
+import random
+import resource
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from rest_framework import status
+from rest_framework.reverse import reverse
+
+from core import benchmarks, constants, mixins, querybudget
+
+OPERATIONS = ['create', 'retrieve', 'list', 'update', 'delete']
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure create, retrieve, list, update and delete through the API routes on seeded tables, '
+        'failing when slower or erroring more than a baseline'
+    )
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--audiofiletype',
+            choices=[constants.SONG, constants.PODCAST, constants.AUDIOBOOK],
+            nargs='+',
+            default=[constants.SONG, constants.PODCAST, constants.AUDIOBOOK]
+        )
+        parser.add_argument('--rows', type=int, default=10000, help='Rows seeded per audiofiletype')
+        parser.add_argument('--repeat', type=int, default=200, help='Timed requests per operation')
+        parser.add_argument('--warmup', type=int, default=10, help='Untimed requests run before the timed ones')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the audiofiles picked by each request')
+        parser.add_argument('--cache', action='store_true', help='Keep the response cache, off by default')
+        parser.add_argument('--keepdb', action='store_true', help='Reuse an already seeded benchmark database')
+        parser.add_argument('--baseline', help='Report of an earlier run this one must not be slower than')
+        parser.add_argument('--tolerance', type=float, default=benchmarks.DEFAULT_TOLERANCE)
+        parser.add_argument('--save-baseline', help='Write the report to this file for later runs to compare with')
+        parser.add_argument(
+            '--metrics-overhead',
+            action='store_true',
+            help='Also report the share of the latency of every operation recording metrics adds'
+        )
+        parser.add_argument(
+            '--max-metrics-overhead',
+            type=float,
+            default=benchmarks.METRICS_OVERHEAD_BUDGET,
+            help='Fail when recording metrics adds more than this percent to an operation'
+        )
+
+    def handle(self, *args, **options):
+
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        cache_settings = {} if options['cache'] else {
+            'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        }
+        report = {'rows': options['rows'], 'repeat': options['repeat'], 'operations': {}}
+        with benchmarks.benchmark_database(keepdb=options['keepdb']), override_settings(**cache_settings):
+            for audiofiletype in options['audiofiletype']:
+                model = mixins.AudioFileModelSerializerMappingMixin.audio_type_serializer_model_mapping[
+                    audiofiletype
+                ]['model']
+                missing_rows = options['rows'] - model.objects.count()
+                if missing_rows > 0:
+                    benchmarks.seed_audiofiles(audiofiletype, missing_rows)
+                for operation, summary in self.run_operations(audiofiletype, model, options).items():
+                    report['operations'][f'{audiofiletype}.{operation}'] = summary
+                if options['metrics_overhead']:
+                    report.setdefault('metrics_overhead', {}).update(
+                        self.measure_metrics_overhead(audiofiletype, model, options)
+                    )
+        report['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as baseline_file:
+                json.dump(report, baseline_file, indent=2)
+        self.stdout.write(json.dumps(report, indent=2))
+
+        if baseline is not None:
+            regressions = benchmarks.find_regressions(
+                report['operations'],
+                baseline['operations'],
+                options['tolerance']
+            )
+            if regressions:
+                raise CommandError('Worse than the baseline:\n' + '\n'.join(regressions))
+        if options['metrics_overhead']:
+            excesses = benchmarks.find_metrics_overhead(report['metrics_overhead'], options['max_metrics_overhead'])
+            if excesses:
+                raise CommandError('Over the metrics overhead budget:\n' + '\n'.join(excesses))
+
+    def measure_metrics_overhead(self, audiofiletype, model, options):
+        """
+        Median latency of every operation without and with recording metrics, and the share recording adds
+
+        Requests without and with metrics alternate so that the table growing during the run weighs on both alike, but
+        their medians still differ by more than recording costs from one run to the next. The overhead is the time
+        recording takes for the queries of the operation, see `benchmarks.time_metrics_recording`, over the median
+        latency without metrics. Query budgets are off, the requests without metrics leave the middleware out entirely.
+        """
+
+        clients = {}
+        with override_settings(AUDIOFILE_QUERY_BUDGETS=querybudget.OFF):
+            for record_metrics in (False, True):
+                with override_settings(AUDIOFILE_METRICS=record_metrics):
+                    client = Client()
+                    client.handler.load_middleware()
+                    clients[record_metrics] = client
+            timings = self.time_operations(audiofiletype, model, options, clients)
+
+        overhead = {}
+        for operation in OPERATIONS:
+            without_metrics, query_count, _ = timings[False][operation]
+            baseline = statistics.median(without_metrics)
+            recording = benchmarks.time_metrics_recording(round(query_count / len(without_metrics)))
+            overhead[f'{audiofiletype}.{operation}'] = {
+                'p50_ms_without_metrics': round(baseline * 1000, 3),
+                'p50_ms_with_metrics': round(statistics.median(timings[True][operation][0]) * 1000, 3),
+                'recording_us': round(recording * 1e6, 1),
+                'overhead_percent': round(recording / baseline * 100, 2),
+            }
+        return overhead
+
+    def run_operations(self, audiofiletype, model, options):
+        """Summary of every operation on one audiofiletype"""
+
+        summaries = {}
+        timings = self.time_operations(audiofiletype, model, options)[None]
+        for operation, (samples, query_count, errors) in timings.items():
+            summary = benchmarks.summarize(samples)
+            summary['ops_per_second'] = round(len(samples) / sum(samples), 1)
+            summary['queries_per_request'] = round(query_count / len(samples), 2)
+            summary['errors'] = errors
+            summary['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            summaries[operation] = summary
+        return summaries
+
+    def time_operations(self, audiofiletype, model, options, clients=None):
+        """
+        Durations, number of queries and errors of the timed requests of every operation, by key of `clients`
+
+        Each request picks a seeded or created audiofile and is sent through every client of `clients`, a dict of
+        test clients, in turn. Without `clients` a single one is used, under the key None.
+        """
+
+        clients = clients or {None: Client()}
+        picker = random.Random(options['seed'])
+        seeded_ids = list(model.objects.order_by('pk').values_list('pk', flat=True)[:options['rows']])
+        created_ids = []
+
+        def get_detail_url(audiofileid):
+            return reverse(
+                'common-actions-audio-file',
+                kwargs={'audiofiletype': audiofiletype, 'audiofileid': audiofileid}
+            )
+
+        create_url = reverse('create-audio-file')
+        list_url = reverse('list-audio-files', kwargs={'audiofiletype': audiofiletype})
+        requests = {
+            'create': lambda client, index: client.post(
+                create_url,
+                {
+                    'audiofiletype': audiofiletype,
+                    'audiofilemetadata': benchmarks.get_seed_payload(audiofiletype, options['rows'] + index)
+                },
+                content_type='application/json'
+            ),
+            'retrieve': lambda client, index: client.get(get_detail_url(picker.choice(seeded_ids))),
+            'list': lambda client, index: client.get(list_url),
+            'update': lambda client, index: client.patch(
+                get_detail_url(picker.choice(seeded_ids)),
+                {'duration': index % 600 + 1},
+                content_type='application/json'
+            ),
+            # Without an audiofile left by a successful create the request misses, and counts as an error
+            'delete': lambda client, index: client.delete(get_detail_url(created_ids.pop() if created_ids else 0)),
+        }
+        expected_status = {'create': status.HTTP_201_CREATED, 'delete': status.HTTP_204_NO_CONTENT}
+
+        def send(operation, client, index):
+            """Response, duration and number of queries of one request"""
+
+            queries = 0
+
+            def count_query(execute, sql, params, many, context):
+                nonlocal queries
+                queries += 1
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count_query):
+                start = time.perf_counter()
+                response = requests[operation](client, index)
+                return response, time.perf_counter() - start, queries
+
+        timings = {key: {} for key in clients}
+        for operation in OPERATIONS:
+            samples = {key: [] for key in clients}
+            query_counts = {key: 0 for key in clients}
+            errors = {key: 0 for key in clients}
+            for index in range(options['warmup'] + options['repeat']):
+                # Which client goes first alternates, neither always runs on a cold or a warm cache
+                keys = list(clients) if index % 2 else list(reversed(list(clients)))
+                for key in keys:
+                    response, elapsed, queries = send(operation, clients[key], index)
+                    if response.status_code != expected_status.get(operation, status.HTTP_200_OK):
+                        errors[key] += 1
+                    elif operation == 'create':
+                        created_ids.append(response.json()['id'])
+                    if index >= options['warmup']:
+                        samples[key].append(elapsed)
+                        query_counts[key] += queries
+            for key in clients:
+                timings[key][operation] = (samples[key], query_counts[key], errors[key])
+        return timings
@@ -0,0 +1,48 @@
+import asyncio
+import json
+import resource
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Compare latency and throughput of running deployments, e.g. gunicorn (WSGI) against uvicorn (ASGI)'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--target',
+            action='append',
+            required=True,
+            help='NAME=URL of an endpoint of a running deployment, repeat to compare several'
+        )
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument('--duration', type=float, default=30, help='Seconds each target is loaded for')
+
+    def handle(self, *args, **options):
+
+        targets = []
+        for target in options['target']:
+            name, separator, url = target.partition('=')
+            if not separator or not url.startswith('http://'):
+                raise CommandError(f'Expected NAME=http://host:port/path, got {target}')
+            targets.append((name, url))
+
+        # Every connection is a file descriptor
+        soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted_limit = options['connections'] + 100
+        if soft_limit != resource.RLIM_INFINITY and soft_limit < wanted_limit:
+            if hard_limit != resource.RLIM_INFINITY and hard_limit < wanted_limit:
+                raise CommandError(f'Open file limit {hard_limit} is too low for {options["connections"]} connections')
+            resource.setrlimit(resource.RLIMIT_NOFILE, (wanted_limit, hard_limit))
+
+        report = {'connections': options['connections'], 'duration_seconds': options['duration'], 'targets': {}}
+        for name, url in targets:
+            report['targets'][name] = asyncio.run(
+                benchmarks.load_test(url, options['connections'], options['duration'])
+            )
+            report['targets'][name]['url'] = url
+
+        self.stdout.write(json.dumps(report, indent=2))
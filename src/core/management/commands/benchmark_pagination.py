@@ -0,0 +1,56 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from rest_framework.reverse import reverse
+
+from core import benchmarks, constants, mixins
+from core.pagination import AudioFileCursorPagination, Cursor
+
+
+class Command(BaseCommand):
+    help = 'Compare list-audio-files latency on the first page against a deep page on a seeded table'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--audiofiletype',
+            choices=[constants.SONG, constants.PODCAST, constants.AUDIOBOOK],
+            default=constants.SONG
+        )
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--page-size', type=int, default=AudioFileCursorPagination.page_size)
+        parser.add_argument('--pages', type=int, nargs='+', default=[1, 10000])
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--keepdb', action='store_true', help='Reuse an already seeded benchmark database')
+
+    def handle(self, *args, **options):
+
+        audiofiletype = options['audiofiletype']
+        page_size = options['page_size']
+        model = mixins.AudioFileModelSerializerMappingMixin.audio_type_serializer_model_mapping[audiofiletype]['model']
+
+        with benchmarks.benchmark_database(keepdb=options['keepdb']):
+            missing_rows = options['rows'] - model.objects.count()
+            if missing_rows > 0:
+                benchmarks.seed_audiofiles(audiofiletype, missing_rows)
+
+            client = Client()
+            url = reverse('list-audio-files', kwargs={'audiofiletype': audiofiletype})
+            paginator = AudioFileCursorPagination()
+            report = {'audiofiletype': audiofiletype, 'rows': model.objects.count(), 'pages': {}}
+
+            for page in options['pages']:
+                page_url = f'{url}?page_size={page_size}'
+                if page > 1:
+                    # The offset is only used once to find where the page starts, never by the endpoint itself
+                    value, pk = model.objects.order_by('uploaded_time', 'pk').values_list(
+                        'uploaded_time', 'pk'
+                    )[(page - 1) * page_size - 1]
+                    paginator.base_url = page_url
+                    page_url = paginator.encode_cursor(Cursor(reverse=False, value=value, pk=pk))
+
+                samples = benchmarks.time_calls(lambda: client.get(page_url), options['repeat'])
+                report['pages'][page] = benchmarks.summarize(samples)
+
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,54 @@
+import json
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from core import benchmarks, constants, mixins
+from core.fast_serializers import get_field_plan
+from core.renderers import FastJSONRenderer
+
+
+class Command(BaseCommand):
+    help = 'Compare serializing and rendering a list of audiofiles through the serializer and through the fast path'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--audiofiletype',
+            choices=[constants.SONG, constants.PODCAST, constants.AUDIOBOOK],
+            default=constants.SONG
+        )
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--keepdb', action='store_true', help='Reuse an already seeded benchmark database')
+
+    def handle(self, *args, **options):
+
+        audiofiletype = options['audiofiletype']
+        mapping = mixins.AudioFileModelSerializerMappingMixin.audio_type_serializer_model_mapping[audiofiletype]
+        model, serializer_class = mapping['model'], mapping['serializer']
+        field_plan = get_field_plan(serializer_class)
+
+        with benchmarks.benchmark_database(keepdb=options['keepdb']):
+            missing_rows = options['rows'] - model.objects.count()
+            if missing_rows > 0:
+                benchmarks.seed_audiofiles(audiofiletype, missing_rows)
+            queryset = model.objects.order_by('pk')[:options['rows']]
+
+            def serializer_path():
+                return JSONRenderer().render(serializer_class(queryset, many=True).data)
+
+            def fast_path():
+                return FastJSONRenderer().render(field_plan.to_representations(queryset.values(*field_plan.sources)))
+
+            if serializer_path() != fast_path():
+                raise AssertionError('The fast path output differs from the serializer output')
+
+            report = {
+                'audiofiletype': audiofiletype,
+                'rows': queryset.count(),
+                'serializer': benchmarks.summarize(benchmarks.time_calls(serializer_path, options['repeat'])),
+                'fast': benchmarks.summarize(benchmarks.time_calls(fast_path, options['repeat'])),
+            }
+
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import os
+import random
+import tempfile
+import threading
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.test import override_settings
+from rest_framework.reverse import reverse
+
+from core import benchmarks, constants, models
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Measure concurrent random Range requests against the media of a large uploaded file'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('--size', type=int, default=256 * 1024 * 1024, help='Size of the media file in bytes')
+        parser.add_argument('--range-size', type=int, default=64 * 1024, help='Bytes asked for by every request')
+        parser.add_argument('--connections', type=int, default=64)
+        parser.add_argument('--duration', type=float, default=10)
+
+    def handle(self, *args, **options):
+
+        size, range_size = options['size'], options['range_size']
+
+        with tempfile.TemporaryDirectory() as location, benchmarks.benchmark_database(), override_settings(
+            AUDIOFILE_STORAGE={'BACKEND': 'core.storage.FileSystemAudioStorage', 'OPTIONS': {'location': location}}
+        ):
+            with open(os.path.join(location, 'benchmark'), 'wb') as file:
+                for _ in range(0, size, 1024 * 1024):
+                    file.write(os.urandom(1024 * 1024))
+                file.truncate(size)
+            song = models.Song.objects.create(
+                name='Benchmark Song',
+                duration=1,
+                file='benchmark',
+                file_size=size,
+                content_type='audio/wav',
+                checksum='benchmark'
+            )
+
+            server = ThreadedWSGIServer(('127.0.0.1', 0), QuietWSGIRequestHandler)
+            server.daemon_threads = True
+            server.set_app(WSGIHandler())
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                path = reverse('stream-audio-file', kwargs={'audiofiletype': constants.SONG, 'audiofileid': song.pk})
+                url = f'http://127.0.0.1:{server.server_port}{path}'
+
+                def get_headers():
+                    start = random.randrange(0, size - range_size)
+                    return {'Range': f'bytes={start}-{start + range_size - 1}'}
+
+                report = asyncio.run(
+                    benchmarks.load_test(url, options['connections'], options['duration'], get_headers)
+                )
+            finally:
+                server.shutdown()
+                server.server_close()
+
+        report.update({'file_size': size, 'range_size': range_size, 'connections': options['connections']})
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,63 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import constants, exports
+
+
+class Command(BaseCommand):
+    help = 'Stream audiofiles with COPY into compressed CSV or NDJSON parts, exporting id ranges in parallel'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('output', help='Directory the parts and manifest.json are written to')
+        parser.add_argument(
+            '--audiofiletype',
+            choices=[constants.SONG, constants.PODCAST, constants.AUDIOBOOK],
+            nargs='+',
+            default=[constants.SONG, constants.PODCAST, constants.AUDIOBOOK]
+        )
+        parser.add_argument('--format', choices=exports.FORMATS, default=exports.CSV)
+        parser.add_argument('--compression', choices=exports.COMPRESSIONS, default=exports.GZIP)
+        parser.add_argument('--compress-level', type=int, default=6, help='gzip level, 1 is fastest')
+        parser.add_argument(
+            '--rows-per-part',
+            type=int,
+            default=exports.DEFAULT_ROWS_PER_PART,
+            help='Ids spanned by each part'
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count(),
+            help='Number of exporting processes, 0 exports in this process'
+        )
+
+    def handle(self, *args, **options):
+
+        if options['rows_per_part'] < 1:
+            raise CommandError('--rows-per-part must be at least 1')
+        if not 1 <= options['compress_level'] <= 9:
+            raise CommandError('--compress-level must be between 1 and 9')
+
+        os.makedirs(options['output'], exist_ok=True)
+        exporter = exports.Exporter(
+            options['output'],
+            output_format=options['format'],
+            compression=options['compression'],
+            compress_level=options['compress_level'],
+            processes=options['processes'],
+            rows_per_part=options['rows_per_part']
+        )
+        manifest = exporter.run(options['audiofiletype'])
+        report = {
+            audiofiletype: {key: value for key, value in type_report.items() if key not in ('columns', 'parts')}
+            for audiofiletype, type_report in manifest['types'].items()
+        }
+        self.stdout.write(json.dumps({
+            'rows': manifest['rows'],
+            'seconds': manifest['seconds'],
+            'rows_per_second': manifest['rows_per_second'],
+            'types': report,
+        }))
@@ -0,0 +1,78 @@
+import json
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import constants, imports
+
+
+class Command(BaseCommand):
+    help = 'Load audiofiles of one type from a CSV or NDJSON file with COPY, resuming an interrupted import'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument('path', help='CSV or NDJSON file, - reads standard input')
+        parser.add_argument(
+            '--audiofiletype',
+            choices=[constants.SONG, constants.PODCAST, constants.AUDIOBOOK],
+            required=True
+        )
+        parser.add_argument('--format', choices=imports.FORMATS, help='Guessed from the file extension by default')
+        parser.add_argument('--chunk-size', type=int, default=imports.DEFAULT_CHUNK_SIZE, help='Rows per COPY')
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count(),
+            help='Number of validating processes, 0 validates in this process'
+        )
+        parser.add_argument(
+            '--import-id',
+            help='Key of the progress of the import, derived from the file by default, required to resume from stdin'
+        )
+        parser.add_argument('--rejects', help='File the line numbers and errors of rejected rows are appended to')
+
+    def handle(self, *args, **options):
+
+        path = options['path']
+        input_format = options['format']
+        if input_format is None:
+            extension = os.path.splitext(path)[1].lower()
+            input_format = {'.csv': imports.CSV, '.ndjson': imports.NDJSON, '.jsonl': imports.NDJSON}.get(extension)
+            if input_format is None:
+                raise CommandError('Cannot guess the input format, use --format')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        key = options['import_id']
+        if key is None and path != '-':
+            key = imports.make_key(path, options['audiofiletype'], input_format, options['chunk_size'])
+
+        importer = imports.Importer(
+            options['audiofiletype'],
+            processes=options['processes'],
+            chunk_size=options['chunk_size'],
+            key=key,
+            source=path
+        )
+
+        def report_progress(report):
+            if options['verbosity'] > 1:
+                self.stdout.write(json.dumps(report))
+
+        input_file = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        rejects = open(options['rejects'], 'a') if options['rejects'] else None
+        try:
+            report = importer.run(
+                imports.read_rows(input_file, input_format),
+                rejects=rejects,
+                progress_callback=report_progress
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+        finally:
+            if input_file is not sys.stdin:
+                input_file.close()
+            if rejects is not None:
+                rejects.close()
+        self.stdout.write(json.dumps({'import_id': key, **report}))
@@ -0,0 +1,71 @@
+import functools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import constants, mixins, probing
+from core.storage import get_storage
+from core.cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Probe the uploaded media of existing audiofiles and record their duration and stream properties'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--audiofiletype',
+            choices=[constants.SONG, constants.PODCAST, constants.AUDIOBOOK],
+            action='append',
+            help='Only probe this audiofiletype, repeat for several, all of them by default'
+        )
+        parser.add_argument('--all', action='store_true', help='Probe again audiofiles that were already probed')
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+
+        mapping = mixins.AudioFileModelSerializerMappingMixin.audio_type_serializer_model_mapping
+        audiofiletypes = options['audiofiletype'] or list(mapping)
+        batch_size = options['batch_size']
+        probe = functools.partial(probing.probe_stored, storage=get_storage())
+
+        # Spawned rather than forked, workers only read files and must not share the database connections
+        mp_context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=mp_context) as executor:
+            for audiofiletype in audiofiletypes:
+                model = mapping[audiofiletype]['model']
+                queryset = model.objects.exclude(file='').order_by('pk')
+                if not options['all']:
+                    queryset = queryset.filter(sample_rate__isnull=True)
+
+                probed = failed = 0
+                last_pk = 0
+                while True:
+                    batch = list(queryset.filter(pk__gt=last_pk).only('pk', 'file')[:batch_size])
+                    if not batch:
+                        break
+                    last_pk = batch[-1].pk
+                    probed_batch = []
+                    names = [audiofile.file for audiofile in batch]
+                    chunksize = max(1, len(names) // (options['workers'] * 4))
+                    for audiofile, (info, error) in zip(batch, executor.map(probe, names, chunksize=chunksize)):
+                        if info is None:
+                            logger.warning('Could not probe %s: %s', audiofile.file, error)
+                            failed += 1
+                            continue
+                        probing.apply_info(audiofile, info)
+                        audiofile.last_modified = timezone.now()
+                        probed_batch.append(audiofile)
+                    model.objects.bulk_update(probed_batch, probing.PROBED_FIELDS + ['last_modified'])
+                    probed += len(probed_batch)
+
+                if probed:
+                    response_cache.invalidate(audiofiletype)
+                self.stdout.write(f'{audiofiletype}: {probed} probed, {failed} failed')
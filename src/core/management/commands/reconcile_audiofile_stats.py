@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from core import stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the statistics summary tables from the audiofile tables and report any drift'
+
+    def handle(self, *args, **options):
+
+        before, after = stats.rebuild()
+        for audiofiletype, totals in after.items():
+            previous = before[audiofiletype]
+            if (previous['count'], previous['total_duration']) == (totals['count'], totals['total_duration']):
+                self.stdout.write(f'{audiofiletype}: {totals["count"]} audiofiles, in sync')
+            else:
+                self.stdout.write(
+                    f'{audiofiletype}: {totals["count"]} audiofiles, fixed count {previous["count"]} -> '
+                    f'{totals["count"]} and total duration {previous["total_duration"]} -> {totals["total_duration"]}'
+                )
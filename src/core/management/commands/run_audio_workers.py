@@ -0,0 +1,60 @@
+import json
+import os
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued audio processing jobs on a pool of worker processes'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count(),
+            help='Number of worker processes, 0 runs the jobs in this process'
+        )
+        parser.add_argument('--batch-size', type=int, help='Jobs claimed at once, twice the processes by default')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait for new jobs')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is left to run')
+        parser.add_argument('--max-jobs', type=int, help='Exit after running this many jobs')
+        parser.add_argument(
+            '--stats-interval',
+            type=float,
+            default=60.0,
+            help='Seconds between two reports of the worker and queue counters, 0 to disable'
+        )
+
+    def handle(self, *args, **options):
+
+        worker = jobs.Worker(
+            processes=options['processes'],
+            batch_size=options['batch_size'],
+            poll_interval=options['poll_interval']
+        )
+
+        def stop(signum, frame):
+            worker.stopping = True
+
+        previous_handlers = {signum: signal.signal(signum, stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+
+        stopped = threading.Event()
+        if options['stats_interval']:
+            def report():
+                while not stopped.wait(options['stats_interval']):
+                    self.stdout.write(json.dumps(worker.metrics.snapshot()))
+
+            threading.Thread(target=report, daemon=True).start()
+
+        try:
+            metrics = worker.run(once=options['once'], max_jobs=options['max_jobs'])
+        finally:
+            stopped.set()
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write(json.dumps({**metrics, 'queue': jobs.queue_stats()}))
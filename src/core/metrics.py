@@ -0,0 +1,277 @@
+"""
+Request metrics exposed in the Prometheus text format
+
+`core.middleware.metrics_middleware` tracks every request in a `RequestMetrics` held by a context variable, which also
+reaches the database threads of the async views. Views, serializers and renderers time their phases with `phase`, and
+a wrapper installed on every database connection counts and times the queries. Once the response is ready the whole
+request is recorded into histograms with fixed buckets, taking a single lock.
+
+Metrics are kept per process, every worker of a multi-process server reports its own.
+"""
+import bisect
+import contextvars
+import threading
+import time
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from core import querybudget
+
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+current_request = contextvars.ContextVar('current_request', default=None)
+
+
+class RequestMetrics:
+    """
+    Time spent in each phase of a request and the queries it ran
+
+    `statements` counts each SQL statement of requests whose query budget is checked, see `core.querybudget`. Phases and
+    queries are only timed when `timed`, while the metrics are recorded.
+    """
+
+    __slots__ = ('phases', 'active_phases', 'queries', 'query_seconds', 'statements', 'timed')
+
+    def __init__(self, timed=True):
+
+        self.phases = {}
+        self.active_phases = set()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.statements = None
+        self.timed = timed
+
+
+class phase:
+    """
+    Context manager adding the time spent in its block to the `name` phase of the current request
+
+    Does nothing outside of timed requests or inside a block of the same phase. A class rather than a generator based
+    context manager, as it runs several times per request.
+    """
+
+    __slots__ = ('name', 'request_metrics', 'start')
+
+    def __init__(self, name):
+
+        self.name = name
+        self.request_metrics = None
+
+    def __enter__(self):
+
+        request_metrics = current_request.get()
+        if request_metrics is not None and request_metrics.timed and self.name not in request_metrics.active_phases:
+            request_metrics.active_phases.add(self.name)
+            self.request_metrics = request_metrics
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+
+        request_metrics = self.request_metrics
+        if request_metrics is not None:
+            request_metrics.phases[self.name] = (
+                request_metrics.phases.get(self.name, 0.0) + time.perf_counter() - self.start
+            )
+            request_metrics.active_phases.discard(self.name)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper counting and timing the queries of the current request"""
+
+    request_metrics = current_request.get()
+    if request_metrics is None:
+        return execute(sql, params, many, context)
+    if request_metrics.statements is not None:
+        request_metrics.statements[sql] += 1
+    if not request_metrics.timed:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        request_metrics.queries += 1
+        request_metrics.query_seconds += time.perf_counter() - start
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    """Wrap the queries of new connections, unless neither metrics nor query budgets would ever read them"""
+
+    if not settings.AUDIOFILE_METRICS and settings.AUDIOFILE_QUERY_BUDGETS == querybudget.OFF:
+        return
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Histogram:
+    """Observations counted in fixed buckets, along with their number and sum"""
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets):
+
+        self.buckets = buckets
+        # One more count for the observations above the last bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class RequestSeries:
+    """
+    Histograms of the requests of one set of endpoint labels
+
+    Looked up once per request, the labels of each status and phase are only built on their first observation.
+    """
+
+    __slots__ = ('registry', 'labels', 'durations', 'phases', 'queries', 'sizes')
+
+    def __init__(self, registry, labels):
+
+        self.registry = registry
+        self.labels = labels
+        self.durations = {}
+        self.phases = {}
+        self.queries = registry.get_histogram('audiofile_http_request_queries', labels)
+        self.sizes = None
+
+    def observe(self, status_code, duration, request_metrics, size):
+        """Record a finished request, the lock of the registry is held by the caller"""
+
+        histogram = self.durations.get(status_code)
+        if histogram is None:
+            histogram = self.durations[status_code] = self.registry.get_histogram(
+                'audiofile_http_request_duration_seconds', self.labels + (('status', str(status_code)),)
+            )
+        histogram.observe(duration)
+
+        for phase_name, seconds in request_metrics.phases.items():
+            self.observe_phase(phase_name, seconds)
+        if request_metrics.queries:
+            self.observe_phase('db', request_metrics.query_seconds)
+
+        self.queries.observe(request_metrics.queries)
+        if size is not None:
+            if self.sizes is None:
+                self.sizes = self.registry.get_histogram('audiofile_http_response_size_bytes', self.labels)
+            self.sizes.observe(size)
+
+    def observe_phase(self, phase_name, seconds):
+
+        histogram = self.phases.get(phase_name)
+        if histogram is None:
+            histogram = self.phases[phase_name] = self.registry.get_histogram(
+                'audiofile_http_request_phase_seconds', self.labels + (('phase', phase_name),)
+            )
+        histogram.observe(seconds)
+
+
+class MetricsRegistry:
+    """Histograms by metric name and labels, and the counters and gauges of registered collectors"""
+
+    metrics = {
+        'audiofile_http_request_duration_seconds': ('Duration of requests', DURATION_BUCKETS),
+        'audiofile_http_request_phase_seconds': (
+            'Time spent parsing, validating, serializing, rendering and in database queries per request',
+            DURATION_BUCKETS
+        ),
+        'audiofile_http_request_queries': ('Database queries per request', QUERY_COUNT_BUCKETS),
+        'audiofile_http_response_size_bytes': ('Size of response bodies', SIZE_BUCKETS),
+    }
+
+    def __init__(self):
+
+        self.histograms = {name: {} for name in self.metrics}
+        self.series = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def register_collector(self, collect):
+        """
+        Render the counters or gauges returned by `collect` along with the histograms
+
+        `collect` returns (name, type, description, samples) tuples, samples being (labels, value) pairs, and is
+        called on every scrape.
+        """
+
+        self.collectors.append(collect)
+
+    def get_histogram(self, name, labels):
+        """Histogram of a metric and its labels, created on first use, the lock is held by the caller"""
+
+        histograms = self.histograms[name]
+        histogram = histograms.get(labels)
+        if histogram is None:
+            histogram = histograms[labels] = Histogram(self.metrics[name][1])
+        return histogram
+
+    def record_request(self, labels, status_code, duration, request_metrics, size=None):
+        """
+        Record a finished request
+
+        `labels` is a tuple of (name, value) pairs identifying the endpoint, `size` is None for streamed bodies.
+        """
+
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = RequestSeries(self, labels)
+            series.observe(status_code, duration, request_metrics, size)
+
+    def reset(self):
+
+        with self._lock:
+            self.histograms = {name: {} for name in self.metrics}
+            self.series = {}
+
+    def render(self):
+        """Every histogram in the Prometheus text exposition format"""
+
+        with self._lock:
+            snapshot = {
+                name: [(labels, list(histogram.counts), histogram.count, histogram.sum)
+                       for labels, histogram in histograms.items()]
+                for name, histograms in self.histograms.items()
+            }
+
+        lines = []
+        for name, histograms in snapshot.items():
+            description, buckets = self.metrics[name]
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, counts, count, total in sorted(histograms):
+                label_text = ','.join(f'{key}="{escape_label_value(value)}"' for key, value in labels)
+                separator = ',' if label_text else ''
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{{label_text}{separator}le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{label_text}{separator}le="+Inf"}} {count}')
+                lines.append(f'{name}_count{{{label_text}}} {count}')
+                lines.append(f'{name}_sum{{{label_text}}} {total}')
+        for collect in self.collectors:
+            for name, metric_type, description, samples in collect():
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for labels, sample in samples:
+                    label_text = ','.join(f'{key}="{escape_label_value(value)}"' for key, value in labels)
+                    lines.append(f'{name}{{{label_text}}} {sample}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label_value(value):
+
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+registry = MetricsRegistry()
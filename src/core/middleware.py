@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+from core import metrics, querybudget
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """
+    Record the duration, phases, queries and response size of every request in `core.metrics`
+
+    Requests are labelled with their method, URL name and audiofiletype rather than their path, keeping the number of
+    series bounded. Bodies of streamed responses are produced after the request is recorded, their size and rendering
+    are not counted.
+
+    Also collects the queries checked against query budgets, when only those are on nothing is timed nor recorded.
+    """
+
+    if not settings.AUDIOFILE_METRICS and settings.AUDIOFILE_QUERY_BUDGETS == querybudget.OFF:
+        raise MiddlewareNotUsed
+    record_metrics = settings.AUDIOFILE_METRICS
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+
+            request_metrics = metrics.RequestMetrics(timed=record_metrics)
+            token = metrics.current_request.set(request_metrics)
+            start = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                metrics.current_request.reset(token)
+            if record_metrics:
+                record(request, response, time.perf_counter() - start, request_metrics)
+            return response
+    else:
+        def middleware(request):
+
+            request_metrics = metrics.RequestMetrics(timed=record_metrics)
+            token = metrics.current_request.set(request_metrics)
+            start = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                metrics.current_request.reset(token)
+            if record_metrics:
+                record(request, response, time.perf_counter() - start, request_metrics)
+            return response
+    return middleware
+
+
+def record(request, response, duration, request_metrics):
+
+    resolver_match = request.resolver_match
+    if resolver_match is None:
+        endpoint, audiofiletype = 'unmatched', ''
+    else:
+        endpoint = resolver_match.url_name or resolver_match.view_name
+        audiofiletype = resolver_match.kwargs.get('audiofiletype', '')
+    labels = (('method', request.method), ('endpoint', endpoint), ('audiofiletype', audiofiletype))
+
+    if response.streaming:
+        size = int(response['Content-Length']) if response.has_header('Content-Length') else None
+    else:
+        size = len(response.content)
+    metrics.registry.record_request(labels, response.status_code, duration, request_metrics, size)
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.1 on 2026-10-17 20:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_alter_podcast_participants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='audiobook',
+            index=models.Index(fields=['uploaded_time', 'id'], name='audiobook_uploaded_time_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='podcast',
+            index=models.Index(fields=['uploaded_time', 'id'], name='podcast_uploaded_time_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['uploaded_time', 'id'], name='song_uploaded_time_id_idx'),
+        ),
+    ]
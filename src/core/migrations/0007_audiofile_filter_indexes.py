@@ -0,0 +1,54 @@
+# Generated by Django 3.2.1 on 2026-10-17 20:15
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_audiofile_uploaded_time_id_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='audiobook',
+            index=models.Index(fields=['name', 'id'], name='audiobook_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='audiobook',
+            index=models.Index(fields=['duration', 'id'], name='audiobook_duration_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='audiobook',
+            index=models.Index(fields=['author', 'uploaded_time', 'id'], name='audiobook_author_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='audiobook',
+            index=models.Index(fields=['narrator', 'uploaded_time', 'id'], name='audiobook_narrator_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='podcast',
+            index=models.Index(fields=['name', 'id'], name='podcast_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='podcast',
+            index=models.Index(fields=['duration', 'id'], name='podcast_duration_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='podcast',
+            index=models.Index(fields=['host', 'uploaded_time', 'id'], name='podcast_host_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='podcast',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['participants'], name='podcast_participants_gin_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['name', 'id'], name='song_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['duration', 'id'], name='song_duration_id_idx'),
+        ),
+    ]
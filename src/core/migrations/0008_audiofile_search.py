@@ -0,0 +1,100 @@
+# Generated by Django 3.2.1 on 2026-10-17 20:16
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Weighted document of every searchable column of a table, `row` being either NEW in a trigger or the table itself
+SEARCH_DOCUMENTS = {
+    'song': "setweight(to_tsvector('english', coalesce({row}.name, '')), 'A')",
+    'podcast': (
+        "setweight(to_tsvector('english', coalesce({row}.name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce({row}.host, '')), 'B') || "
+        "setweight(to_tsvector('english', array_to_string({row}.participants, ' ')), 'B')"
+    ),
+    'audiobook': (
+        "setweight(to_tsvector('english', coalesce({row}.name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce({row}.author, '')), 'B') || "
+        "setweight(to_tsvector('english', coalesce({row}.narrator, '')), 'B')"
+    ),
+}
+
+CREATE_TRIGGER_SQL = """
+CREATE FUNCTION {table}_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {new_document};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER {table}_search_vector_update BEFORE INSERT OR UPDATE ON {table}
+FOR EACH ROW EXECUTE FUNCTION {table}_search_vector_update();
+
+UPDATE {table} SET search_vector = {document};
+"""
+
+DROP_TRIGGER_SQL = """
+DROP TRIGGER {table}_search_vector_update ON {table};
+DROP FUNCTION {table}_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_audiofile_filter_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='audiobook',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='podcast',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='audiobook',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='audiobook_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='audiobook',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='audiobook_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='podcast',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='podcast_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='podcast',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='podcast_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='song_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='song_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ] + [
+        migrations.RunSQL(
+            sql=CREATE_TRIGGER_SQL.format(
+                table=table,
+                new_document=document.format(row='NEW'),
+                document=document.format(row=table)
+            ),
+            reverse_sql=DROP_TRIGGER_SQL.format(table=table)
+        )
+        for table, document in SEARCH_DOCUMENTS.items()
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 3.2.1 on 2026-10-17 20:37
+
+import django.core.validators
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_audiofile_last_modified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('audiofiletype', models.CharField(choices=[('song', 'song'), ('podcast', 'podcast'), ('audiobook', 'audiobook')], max_length=20)),
+                ('audiofileid', models.BigIntegerField()),
+                ('size', models.BigIntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('offset', models.BigIntegerField(default=0)),
+                ('content_type', models.CharField(max_length=100)),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+                ('last_modified', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'audioupload',
+            },
+        ),
+        migrations.AddField(
+            model_name='audiobook',
+            name='checksum',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='audiobook',
+            name='content_type',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='audiobook',
+            name='file',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='audiobook',
+            name='file_size',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='podcast',
+            name='checksum',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='podcast',
+            name='content_type',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='podcast',
+            name='file',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='podcast',
+            name='file_size',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='checksum',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='content_type',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='file',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='file_size',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='audioupload',
+            index=models.Index(fields=['audiofiletype', 'audiofileid'], name='audioupload_audiofile_idx'),
+        ),
+    ]
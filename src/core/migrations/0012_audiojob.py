@@ -0,0 +1,47 @@
+# Generated by Django 3.2.1 on 2026-10-17 20:43
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_audiofile_probed_properties'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('audiofiletype', models.CharField(choices=[('song', 'song'), ('podcast', 'podcast'), ('audiobook', 'audiobook')], max_length=20)),
+                ('audiofileid', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('probe', 'probe')], max_length=20)),
+                ('status', models.CharField(choices=[('queued', 'queued'), ('running', 'running'), ('succeeded', 'succeeded'), ('failed', 'failed')], default='queued', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('max_attempts', models.PositiveSmallIntegerField(default=5)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+                ('started_time', models.DateTimeField(blank=True, null=True)),
+                ('finished_time', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'audiojob',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='audiojob',
+            index=models.Index(condition=models.Q(('status', 'queued')), fields=['run_after', 'id'], name='audiojob_queued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='audiojob',
+            index=models.Index(condition=models.Q(('status', 'running')), fields=['locked_until'], name='audiojob_running_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='audiojob',
+            index=models.Index(fields=['audiofiletype', 'audiofileid'], name='audiojob_audiofile_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.1 on 2026-10-17 20:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_audiojob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audiobook',
+            name='peaks',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='podcast',
+            name='peaks',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='peaks',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='audiojob',
+            name='kind',
+            field=models.CharField(choices=[('probe', 'probe'), ('peaks', 'peaks')], max_length=20),
+        ),
+    ]
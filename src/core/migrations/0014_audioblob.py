@@ -0,0 +1,31 @@
+# Generated by Django 3.2.1 on 2026-10-17 20:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_audiofile_peaks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioBlob',
+            fields=[
+                ('checksum', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField()),
+                ('references', models.PositiveIntegerField(default=0)),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('bitrate', models.PositiveIntegerField(blank=True, null=True)),
+                ('sample_rate', models.PositiveIntegerField(blank=True, null=True)),
+                ('channels', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('peaks', models.CharField(blank=True, default='', max_length=255)),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'audioblob',
+            },
+        ),
+    ]
@@ -0,0 +1,168 @@
+# Generated by Django 3.2.1 on 2026-10-17 20:54
+
+from django.db import migrations, models
+
+# Columns counted per name in core.models.AudioFileContributorStats
+CONTRIBUTOR_ROLES = {
+    'song': [],
+    'podcast': ['host'],
+    'audiobook': ['author', 'narrator'],
+}
+
+# Slots counts are spread over, must match core.stats.SLOTS
+SLOTS = 16
+
+# Add the rows of `changes`, each with a `sign` of 1 when added and -1 when removed, to the summary tables. Rows of an
+# update come in twice, so updates leaving the counted columns unchanged add nothing.
+APPLY_CHANGES_SQL = """
+INSERT INTO audiofilestats AS stats (audiofiletype, slot, count, total_duration)
+SELECT '{table}', pg_backend_pid() % {slots}, sum(sign), sum(sign * duration) FROM {changes} AS changes
+HAVING sum(sign) <> 0 OR sum(sign * duration) <> 0
+ON CONFLICT (audiofiletype, slot) DO UPDATE
+SET count = stats.count + EXCLUDED.count, total_duration = stats.total_duration + EXCLUDED.total_duration;
+
+INSERT INTO audiofiledailystats AS stats (day, audiofiletype, slot, uploads)
+SELECT (uploaded_time AT TIME ZONE 'UTC')::date, '{table}', pg_backend_pid() % {slots}, sum(sign)
+FROM {changes} AS changes
+GROUP BY 1 HAVING sum(sign) <> 0
+ON CONFLICT (day, audiofiletype, slot) DO UPDATE SET uploads = stats.uploads + EXCLUDED.uploads;
+"""
+
+APPLY_CONTRIBUTOR_CHANGES_SQL = """
+INSERT INTO audiofilecontributorstats AS stats (audiofiletype, role, name, count, total_duration)
+SELECT '{table}', '{role}', {role}, sum(sign), sum(sign * duration) FROM {changes} AS changes
+GROUP BY {role} HAVING sum(sign) <> 0 OR sum(sign * duration) <> 0
+ON CONFLICT (audiofiletype, role, name) DO UPDATE
+SET count = stats.count + EXCLUDED.count, total_duration = stats.total_duration + EXCLUDED.total_duration;
+
+DELETE FROM audiofilecontributorstats WHERE role = '{role}' AND count = 0 AND audiofiletype = '{table}';
+"""
+
+CREATE_TRIGGER_SQL = """
+CREATE FUNCTION {table}_stats_update() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        {insert_sql}
+    ELSIF TG_OP = 'UPDATE' THEN
+        {update_sql}
+    ELSIF TG_OP = 'DELETE' THEN
+        {delete_sql}
+    ELSE
+        DELETE FROM audiofilestats WHERE audiofiletype = '{table}';
+        DELETE FROM audiofiledailystats WHERE audiofiletype = '{table}';
+        DELETE FROM audiofilecontributorstats WHERE audiofiletype = '{table}';
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER {table}_stats_insert AFTER INSERT ON {table}
+REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION {table}_stats_update();
+CREATE TRIGGER {table}_stats_update AFTER UPDATE ON {table}
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION {table}_stats_update();
+CREATE TRIGGER {table}_stats_delete AFTER DELETE ON {table}
+REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION {table}_stats_update();
+CREATE TRIGGER {table}_stats_truncate AFTER TRUNCATE ON {table}
+FOR EACH STATEMENT EXECUTE FUNCTION {table}_stats_update();
+
+{backfill_sql}
+"""
+
+DROP_TRIGGER_SQL = """
+DROP TRIGGER {table}_stats_insert ON {table};
+DROP TRIGGER {table}_stats_update ON {table};
+DROP TRIGGER {table}_stats_delete ON {table};
+DROP TRIGGER {table}_stats_truncate ON {table};
+DROP FUNCTION {table}_stats_update();
+"""
+
+
+def get_apply_changes_sql(table, changes):
+
+    return APPLY_CHANGES_SQL.format(table=table, changes=changes, slots=SLOTS) + ''.join(
+        APPLY_CONTRIBUTOR_CHANGES_SQL.format(table=table, role=role, changes=changes)
+        for role in CONTRIBUTOR_ROLES[table]
+    )
+
+
+def get_create_trigger_sql(table):
+
+    columns = ', '.join(['duration', 'uploaded_time'] + CONTRIBUTOR_ROLES[table])
+    added = f'(SELECT 1 AS sign, {columns} FROM new_rows)'
+    removed = f'(SELECT -1 AS sign, {columns} FROM old_rows)'
+    return CREATE_TRIGGER_SQL.format(
+        table=table,
+        insert_sql=get_apply_changes_sql(table, added),
+        update_sql=get_apply_changes_sql(table, f'({added[1:-1]} UNION ALL {removed[1:-1]})'),
+        delete_sql=get_apply_changes_sql(table, removed),
+        backfill_sql=get_apply_changes_sql(table, f'(SELECT 1 AS sign, {columns} FROM {table})'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_audioblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioFileContributorStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('audiofiletype', models.CharField(max_length=20)),
+                ('role', models.CharField(max_length=20)),
+                ('name', models.CharField(max_length=100)),
+                ('count', models.BigIntegerField(default=0)),
+                ('total_duration', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'audiofilecontributorstats',
+            },
+        ),
+        migrations.CreateModel(
+            name='AudioFileDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('audiofiletype', models.CharField(max_length=20)),
+                ('day', models.DateField()),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('uploads', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'audiofiledailystats',
+            },
+        ),
+        migrations.CreateModel(
+            name='AudioFileStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('audiofiletype', models.CharField(max_length=20)),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('total_duration', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'audiofilestats',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='audiofilestats',
+            constraint=models.UniqueConstraint(fields=('audiofiletype', 'slot'), name='audiofilestats_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='audiofiledailystats',
+            constraint=models.UniqueConstraint(fields=('day', 'audiofiletype', 'slot'), name='audiofiledailystats_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='audiofilecontributorstats',
+            index=models.Index(fields=['role', '-count', 'name'], name='audiofilecontributorstats_top'),
+        ),
+        migrations.AddConstraint(
+            model_name='audiofilecontributorstats',
+            constraint=models.UniqueConstraint(fields=('audiofiletype', 'role', 'name'), name='audiofilecontributorstats_unique'),
+        ),
+    ] + [
+        migrations.RunSQL(sql=get_create_trigger_sql(table), reverse_sql=DROP_TRIGGER_SQL.format(table=table))
+        for table in CONTRIBUTOR_ROLES
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.1 on 2026-10-17 21:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_audiofile_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioImport',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('audiofiletype', models.CharField(choices=[('song', 'song'), ('podcast', 'podcast'), ('audiobook', 'audiobook')], max_length=20)),
+                ('source', models.CharField(max_length=1024)),
+                ('chunk_size', models.PositiveIntegerField()),
+                ('chunks', models.PositiveIntegerField(default=0)),
+                ('imported', models.BigIntegerField(default=0)),
+                ('rejected', models.BigIntegerField(default=0)),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+                ('last_modified', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'audioimport',
+            },
+        ),
+    ]
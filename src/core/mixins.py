@@ -1,4 +1,13 @@
-from core import models, serializers, constants
+import hashlib
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.permissions import SAFE_METHODS
+
+from core import metrics, models, querybudget, serializers, constants
 
 
 class AudioFileModelSerializerMappingMixin:
@@ -18,3 +27,125 @@ class AudioFileModelSerializerMappingMixin:
             'model': models.AudioBook
         }
     }
+    audio_type_serializer_mapping = {
+        audiofiletype: mapping['serializer'] for audiofiletype, mapping in audio_type_serializer_model_mapping.items()
+    }
+
+
+class AudioFileRecordMixin(AudioFileModelSerializerMappingMixin):
+    """
+    Views about the Audio File Record of the `audiofiletype` and `audiofileid` url parameters
+
+    Only the `record_fields` of the record are loaded, all of them when empty.
+    """
+
+    lookup_url_kwarg = 'audiofileid'
+    record_fields = []
+
+    def get_record_queryset(self):
+
+        model = self.audio_type_serializer_model_mapping[self.kwargs.get('audiofiletype')]['model']
+        return model.objects.only(*self.record_fields) if self.record_fields else model.objects.all()
+
+    def get_queryset(self):
+
+        return self.get_record_queryset()
+
+
+class RequestParsePhaseMixin:
+    """Parse the body of unsafe requests before their handler runs, timed as the parse phase of the request metrics"""
+
+    def initial(self, request, *args, **kwargs):
+
+        super().initial(request, *args, **kwargs)
+        if request.method not in SAFE_METHODS:
+            with metrics.phase('parse'):
+                request.data
+
+
+class QueryBudgetMixin:
+    """
+    Check the queries of each request against the budget of its action, see `core.querybudget`
+
+    `query_budgets` maps viewset actions, or lowercase HTTP methods for other views, to the most queries a request may
+    run. Requests of actions without a budget are not checked.
+    """
+
+    query_budgets = {}
+
+    def get_query_budget(self):
+
+        return self.query_budgets.get(getattr(self, 'action', None) or self.request.method.lower())
+
+    def initial(self, request, *args, **kwargs):
+
+        request_metrics = metrics.current_request.get()
+        if (
+            request_metrics is not None
+            and settings.AUDIOFILE_QUERY_BUDGETS != querybudget.OFF
+            and self.get_query_budget() is not None
+        ):
+            request_metrics.statements = Counter()
+        super().initial(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+
+        response = super().finalize_response(request, response, *args, **kwargs)
+        request_metrics = metrics.current_request.get()
+        if request_metrics is not None and request_metrics.statements is not None:
+            statements, request_metrics.statements = request_metrics.statements, None
+            view_name = f'{type(self).__name__}.{getattr(self, "action", None) or request.method.lower()}'
+            querybudget.check(view_name, self.get_query_budget(), statements, settings.AUDIOFILE_QUERY_BUDGETS)
+        return response
+
+
+class AudioFileConditionalRequestMixin:
+    """ETag and Last-Modified validators of audiofile resources, computed without fetching or serializing rows"""
+
+    def get_object_validators(self, lock=False):
+        """Validators of the requested audiofile read from its `last_modified` alone, `(None, None)` if it is missing"""
+
+        audiofileid = self.kwargs[self.lookup_url_kwarg]
+        queryset = self.filter_queryset(self.get_queryset()).filter(pk=audiofileid)
+        if lock:
+            queryset = queryset.select_for_update()
+        last_modified = queryset.values_list('last_modified', flat=True).first()
+        if last_modified is None:
+            return None, None
+        return self.make_etag(self.kwargs['audiofiletype'], audiofileid, last_modified.isoformat()), last_modified
+
+    def get_list_validators(self):
+        """Validators of a list computed from an aggregate of the filtered rows and the requested page"""
+
+        aggregate = self.filter_queryset(self.get_queryset()).aggregate(
+            last_modified=Max('last_modified'),
+            count=Count('pk')
+        )
+        last_modified = aggregate['last_modified']
+        etag = self.make_etag(
+            self.kwargs['audiofiletype'],
+            aggregate['count'],
+            last_modified.isoformat() if last_modified else '',
+            self.request.get_full_path()
+        )
+        return etag, last_modified
+
+    @staticmethod
+    def make_etag(*parts):
+
+        return quote_etag(hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest())
+
+    @staticmethod
+    def get_conditional_response(request, etag, last_modified):
+        """A 304 or 412 response when the validators satisfy the conditional headers of the request, else None"""
+
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+    @staticmethod
+    def set_validator_headers(response, etag, last_modified):
+
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
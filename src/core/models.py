@@ -1,5 +1,10 @@
+import uuid
+
 from django.db import models
+from django.utils import timezone
 from django.contrib.postgres import fields
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core import validators
 
 from core import constants
@@ -11,35 +16,252 @@ class AudioFile(models.Model):
     name = models.CharField(max_length=100)
     duration = models.PositiveIntegerField()
     uploaded_time = models.DateTimeField(validators=[past_validator], auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True)
+    # Maintained by a database trigger from the searchable text columns of each table
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Name of the uploaded media in the audio storage, see core.storage
+    file = models.CharField(max_length=255, blank=True, default='', editable=False)
+    file_size = models.BigIntegerField(null=True, blank=True, editable=False)
+    content_type = models.CharField(max_length=100, blank=True, default='', editable=False)
+    checksum = models.CharField(max_length=64, blank=True, default='', editable=False)
+    # Probed from the uploaded media, see core.probing, which also replaces the duration given by the client
+    bitrate = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    sample_rate = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    channels = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    # Name of the waveform peaks computed from the uploaded media, see core.peaks
+    peaks = models.CharField(max_length=255, blank=True, default='', editable=False)
 
     class Meta:
 
         abstract = True
+        indexes = [
+            models.Index(fields=['uploaded_time', 'id'], name='%(class)s_uploaded_time_id_idx'),
+            models.Index(fields=['name', 'id'], name='%(class)s_name_id_idx'),
+            models.Index(fields=['duration', 'id'], name='%(class)s_duration_id_idx'),
+            GinIndex(fields=['search_vector'], name='%(class)s_search_vector_idx'),
+            GinIndex(fields=['name'], name='%(class)s_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
 
 
 class Song(AudioFile):
 
-    class Meta:
+    audiofiletype = constants.SONG
+
+    class Meta(AudioFile.Meta):
 
         db_table = constants.SONG
 
 
 class Podcast(AudioFile):
 
+    audiofiletype = constants.PODCAST
+
     host = models.CharField(max_length=100)
     participants = fields.ArrayField(base_field=models.CharField(max_length=100), size=10, default=list)
     # participants = models.JSONField(validators=[validators.MaxLengthValidator(10)])
 
-    class Meta:
+    class Meta(AudioFile.Meta):
 
         db_table = constants.PODCAST
+        indexes = AudioFile.Meta.indexes + [
+            models.Index(fields=['host', 'uploaded_time', 'id'], name='podcast_host_idx'),
+            GinIndex(fields=['participants'], name='podcast_participants_gin_idx'),
+        ]
 
 
 class AudioBook(AudioFile):
 
+    audiofiletype = constants.AUDIOBOOK
+
     author = models.CharField(max_length=100)
     narrator = models.CharField(max_length=100)
 
-    class Meta:
+    class Meta(AudioFile.Meta):
 
         db_table = constants.AUDIOBOOK
+        indexes = AudioFile.Meta.indexes + [
+            models.Index(fields=['author', 'uploaded_time', 'id'], name='audiobook_author_idx'),
+            models.Index(fields=['narrator', 'uploaded_time', 'id'], name='audiobook_narrator_idx'),
+        ]
+
+
+class AudioFileStats(models.Model):
+    """
+    Number and total duration of the audiofiles of a type, maintained by database triggers, see core.stats
+
+    Every type has its counts spread over `slot`s picked by the writing connection, so that concurrent writes do not
+    all wait on the same row, the totals are the sums over the slots.
+    """
+
+    audiofiletype = models.CharField(max_length=20)
+    slot = models.PositiveSmallIntegerField()
+    count = models.BigIntegerField(default=0)
+    total_duration = models.BigIntegerField(default=0)
+
+    class Meta:
+
+        db_table = 'audiofilestats'
+        constraints = [
+            models.UniqueConstraint(fields=['audiofiletype', 'slot'], name='audiofilestats_unique'),
+        ]
+
+
+class AudioFileDailyStats(models.Model):
+    """Number of audiofiles of a type uploaded on a day (UTC), spread over slots like `AudioFileStats`"""
+
+    audiofiletype = models.CharField(max_length=20)
+    day = models.DateField()
+    slot = models.PositiveSmallIntegerField()
+    uploads = models.BigIntegerField(default=0)
+
+    class Meta:
+
+        db_table = 'audiofiledailystats'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'audiofiletype', 'slot'], name='audiofiledailystats_unique'),
+        ]
+
+
+class AudioFileContributorStats(models.Model):
+    """Number and total duration of the audiofiles of a host, author or narrator, rows are dropped at zero"""
+
+    audiofiletype = models.CharField(max_length=20)
+    role = models.CharField(max_length=20)
+    name = models.CharField(max_length=100)
+    count = models.BigIntegerField(default=0)
+    total_duration = models.BigIntegerField(default=0)
+
+    class Meta:
+
+        db_table = 'audiofilecontributorstats'
+        constraints = [
+            models.UniqueConstraint(fields=['audiofiletype', 'role', 'name'], name='audiofilecontributorstats_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['role', '-count', 'name'], name='audiofilecontributorstats_top'),
+        ]
+
+
+AUDIOFILETYPE_CHOICES = [
+    (constants.SONG, constants.SONG),
+    (constants.PODCAST, constants.PODCAST),
+    (constants.AUDIOBOOK, constants.AUDIOBOOK),
+]
+
+
+class AudioUpload(models.Model):
+    """Resumable upload of the media of an audiofile, written chunk by chunk until `offset` reaches `size`"""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    audiofiletype = models.CharField(max_length=20, choices=AUDIOFILETYPE_CHOICES)
+    audiofileid = models.BigIntegerField()
+    size = models.BigIntegerField(validators=[validators.MinValueValidator(1)])
+    offset = models.BigIntegerField(default=0)
+    content_type = models.CharField(max_length=100)
+    created_time = models.DateTimeField(auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+
+        db_table = 'audioupload'
+        indexes = [
+            models.Index(fields=['audiofiletype', 'audiofileid'], name='audioupload_audiofile_idx'),
+        ]
+
+    @property
+    def storage_name(self):
+        """Name the received bytes are stored under until the upload completes"""
+
+        return f'uploads/{self.id}'
+
+    @property
+    def complete(self):
+
+        return self.offset >= self.size
+
+
+class AudioBlob(models.Model):
+    """
+    Uploaded media stored once per content, shared by every audiofile whose upload had the same sha256 checksum
+
+    `references` counts the audiofiles pointing at the blob, which is deleted along with its files when it drops to
+    zero. Properties probed from the media and its peaks are recorded once for all of them, see core.blobs.
+    """
+
+    checksum = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField()
+    references = models.PositiveIntegerField(default=0)
+    duration = models.FloatField(null=True, blank=True)
+    bitrate = models.PositiveIntegerField(null=True, blank=True)
+    sample_rate = models.PositiveIntegerField(null=True, blank=True)
+    channels = models.PositiveSmallIntegerField(null=True, blank=True)
+    peaks = models.CharField(max_length=255, blank=True, default='')
+    created_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+
+        db_table = 'audioblob'
+
+
+class AudioJob(models.Model):
+    """
+    Processing of an audiofile run by the `run_audio_workers` command
+
+    Workers claim queued jobs whose `run_after` has passed, and running jobs whose `locked_until` lease ran out
+    because their worker died, with `SELECT ... FOR UPDATE SKIP LOCKED`.
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, QUEUED), (RUNNING, RUNNING), (SUCCEEDED, SUCCEEDED), (FAILED, FAILED)]
+
+    audiofiletype = models.CharField(max_length=20, choices=AUDIOFILETYPE_CHOICES)
+    audiofileid = models.BigIntegerField()
+    kind = models.CharField(
+        max_length=20,
+        choices=[(constants.PROBE_JOB, constants.PROBE_JOB), (constants.PEAKS_JOB, constants.PEAKS_JOB)]
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_time = models.DateTimeField(auto_now_add=True)
+    started_time = models.DateTimeField(null=True, blank=True)
+    finished_time = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+
+        db_table = 'audiojob'
+        indexes = [
+            models.Index(fields=['run_after', 'id'], name='audiojob_queued_idx', condition=models.Q(status='queued')),
+            models.Index(fields=['locked_until'], name='audiojob_running_idx', condition=models.Q(status='running')),
+            models.Index(fields=['audiofiletype', 'audiofileid'], name='audiojob_audiofile_idx'),
+        ]
+
+
+class AudioImport(models.Model):
+    """
+    Progress of an `import_audiofiles` run, see core.imports
+
+    Updated in the transaction copying each chunk of rows, so an interrupted import resumes after the last chunk it
+    committed without loading any row twice.
+    """
+
+    key = models.CharField(max_length=64, primary_key=True)
+    audiofiletype = models.CharField(max_length=20, choices=AUDIOFILETYPE_CHOICES)
+    source = models.CharField(max_length=1024)
+    chunk_size = models.PositiveIntegerField()
+    chunks = models.PositiveIntegerField(default=0)
+    imported = models.BigIntegerField(default=0)
+    rejected = models.BigIntegerField(default=0)
+    created_time = models.DateTimeField(auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+
+        db_table = 'audioimport'
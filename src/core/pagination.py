@@ -0,0 +1,274 @@
+import base64
+import datetime
+from collections import OrderedDict, namedtuple
+from urllib import parse
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import CharField, Q, Value
+from rest_framework import filters, pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+Cursor = namedtuple('Cursor', ['reverse', 'value', 'pk'])
+
+
+class AudioFileCursorPagination(pagination.BasePagination):
+    """
+    Keyset pagination over (ordering field, id) with opaque next and previous cursors
+
+    Every page is fetched with a `field >= value AND (field > value OR id > pk)` predicate on an indexed
+    (field, id) pair instead of an OFFSET, so page 10,000 costs the same as page 1.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = 'uploaded_time'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Return a single page of rows positioned after (or before) the cursor sent by the client"""
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+        self.field_name, self.descending = self.get_ordering(request, queryset, view)
+        self.model_field = queryset.model._meta.get_field(self.field_name)
+
+        reverse = self.cursor is not None and self.cursor.reverse
+        # Walking backwards is the same keyset query with the ordering flipped
+        scan_descending = self.descending != reverse
+        order_prefix = '-' if scan_descending else ''
+        queryset = queryset.order_by(f'{order_prefix}{self.field_name}', f'{order_prefix}pk')
+
+        if self.cursor is not None:
+            value = self.parse_position_value(self.cursor.value)
+            lookup = 'lt' if scan_descending else 'gt'
+            queryset = queryset.filter(**{f'{self.field_name}__{lookup}e': value}).filter(
+                Q(**{f'{self.field_name}__{lookup}': value}) | Q(**{f'pk__{lookup}': self.cursor.pk})
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        """Page size requested by the client, bounded by `max_page_size`"""
+
+        try:
+            return pagination._positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Return the field to paginate on and whether it is ordered descending
+
+        The first ordering term requested through an `OrderingFilter` of the view wins, ties are always broken on id.
+        """
+
+        ordering = self.ordering
+        for filter_cls in getattr(view, 'filter_backends', []):
+            if issubclass(filter_cls, filters.OrderingFilter):
+                requested_ordering = filter_cls().get_ordering(request, queryset, view)
+                if requested_ordering:
+                    ordering = requested_ordering[0]
+                break
+        return ordering.lstrip('-'), ordering.startswith('-')
+
+    def get_position(self, row):
+        """Return the (ordering value, id) pair a row sits at, rows being model instances or `values()` dicts"""
+
+        if isinstance(row, dict):
+            return row[self.field_name], row['id']
+        return getattr(row, self.field_name), row.pk
+
+    def parse_position_value(self, value):
+        """Convert the value stored in a cursor back to a python value of the ordering field"""
+
+        try:
+            return self.model_field.to_python(value)
+        except DjangoValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def parse_position_pk(self, value):
+        """Convert the tie breaker stored in a cursor back to the value `get_position` returned"""
+
+        return int(value)
+
+    def format_position_pk(self, pk):
+
+        return pk
+
+    def decode_cursor(self, request):
+        """Given a request with a cursor, return a `Cursor` instance"""
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            querystring = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            value = tokens['v'][0]
+            pk = self.parse_position_pk(tokens['p'][0])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return Cursor(reverse=reverse, value=value, pk=pk)
+
+    def encode_cursor(self, cursor):
+        """Given a `Cursor` instance, return a url with the encoded cursor"""
+
+        value = cursor.value
+        if isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        tokens = {'v': value, 'p': self.format_position_pk(cursor.pk)}
+        if cursor.reverse:
+            tokens['r'] = '1'
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = base64.urlsafe_b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        value, pk = self.get_position(self.page[-1])
+        return self.encode_cursor(Cursor(reverse=False, value=value, pk=pk))
+
+    def get_previous_link(self):
+
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        value, pk = self.get_position(self.page[0])
+        return self.encode_cursor(Cursor(reverse=True, value=value, pk=pk))
+
+    def get_paginated_response(self, data):
+
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class AudioFileFeedPagination(AudioFileCursorPagination):
+    """
+    Keyset pagination of the feed merging every audiofiletype, over (uploaded_time, audiofiletype, id)
+
+    Each table is positioned after the cursor and limited to one page on its own (uploaded_time, id) index, and the
+    merged page is taken from a single UNION ALL of these, so only a few pages of keys are ever sorted.
+    """
+
+    ordering = '-uploaded_time'
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """
+        Return the (audiofiletype, id, uploaded_time) rows of a page of the feed
+
+        `querysets` maps audiofiletypes to the filtered queryset of their model.
+        """
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+        self.field_name, self.descending = self.get_ordering(request, None, view)
+        self.has_next = self.has_previous = False
+        self.page = []
+        if not querysets:
+            return []
+
+        reverse = self.cursor is not None and self.cursor.reverse
+        scan_descending = self.descending != reverse
+        order_prefix = '-' if scan_descending else ''
+        branches = []
+        for audiofiletype, queryset in querysets.items():
+            self.model_field = queryset.model._meta.get_field(self.field_name)
+            queryset = queryset.annotate(audiofiletype=Value(audiofiletype, output_field=CharField()))
+            if self.cursor is not None:
+                queryset = queryset.filter(self.get_branch_filter(audiofiletype, scan_descending))
+            branches.append(
+                queryset.order_by(f'{order_prefix}{self.field_name}', f'{order_prefix}pk').values_list(
+                    'audiofiletype', 'pk', self.field_name
+                )[:self.page_size + 1]
+            )
+        merged, *other_branches = branches
+        if other_branches:
+            merged = merged.union(*other_branches, all=True).order_by(
+                f'{order_prefix}{self.field_name}', f'{order_prefix}audiofiletype', f'{order_prefix}pk'
+            )
+
+        results = list(merged[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        self.page = results
+        return results
+
+    def get_branch_filter(self, audiofiletype, scan_descending):
+        """Rows of an audiofiletype positioned after the cursor, the audiofiletype being constant in each table"""
+
+        value = self.parse_position_value(self.cursor.value)
+        cursor_audiofiletype, cursor_pk = self.cursor.pk
+        lookup = 'lt' if scan_descending else 'gt'
+        if audiofiletype == cursor_audiofiletype:
+            return Q(**{f'{self.field_name}__{lookup}e': value}) & (
+                Q(**{f'{self.field_name}__{lookup}': value}) | Q(**{f'pk__{lookup}': cursor_pk})
+            )
+        if (audiofiletype < cursor_audiofiletype) == scan_descending:
+            return Q(**{f'{self.field_name}__{lookup}e': value})
+        return Q(**{f'{self.field_name}__{lookup}': value})
+
+    def get_position(self, row):
+
+        audiofiletype, pk, value = row
+        return value, (audiofiletype, pk)
+
+    def parse_position_pk(self, value):
+
+        audiofiletype, pk = value.split(':')
+        return audiofiletype, int(pk)
+
+    def format_position_pk(self, pk):
+
+        return '{}:{}'.format(*pk)
@@ -0,0 +1,200 @@
+"""
+Multi-resolution waveform peaks of uploaded audio
+
+The samples of a file are read once, block by block, and reduced with NumPy to the minimum and maximum of every
+`SAMPLES_PER_PEAK` frames across all channels. Each coarser level halves the previous one, down to a few peaks for the
+whole file, so a player picks the level matching its width and reads nothing more.
+
+Peaks are stored in the audio storage as 16-bit little-endian (min, max) pairs after a header and a table of levels:
+
+    header  magic b'PEAK', version, number of levels, sample rate, samples per peak of the finest level
+    levels  number of peaks and byte offset of each level, finest first
+    data    the pairs of every level
+
+Only uncompressed PCM and IEEE float WAV files can be decoded.
+"""
+import io
+import struct
+from collections import namedtuple
+
+import numpy
+
+from core import probing
+
+MAGIC = b'PEAK'
+VERSION = 1
+HEADER = struct.Struct('<4sHHII')
+LEVEL = struct.Struct('<IQ')
+PAIR_SIZE = 4
+
+SAMPLES_PER_PEAK = 256
+MAX_LEVELS = 16
+# Coarsest level kept, a level with fewer peaks than this would not fill any waveform
+MIN_PEAKS = 64
+BLOCK_PEAKS = 1024
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xfffe
+
+WavFormat = namedtuple('WavFormat', ['format_tag', 'channels', 'sample_rate', 'bits', 'data_offset', 'data_size'])
+PeaksLevel = namedtuple('PeaksLevel', ['sample_rate', 'samples_per_peak', 'levels', 'data'])
+
+
+class PeaksError(ValueError):
+    """The file cannot be decoded or is not a peaks file"""
+
+
+def read_wav_format(file):
+    """Sample format and position of the samples of a WAV file, reading its chunk headers only"""
+
+    file.seek(0)
+    riff = file.read(12)
+    if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+        raise PeaksError('Peaks can only be computed from WAV files')
+
+    fmt = None
+    while True:
+        chunk_header = file.read(8)
+        if len(chunk_header) < 8:
+            raise PeaksError('WAV file without a data chunk')
+        chunk_id, chunk_size = chunk_header[:4], struct.unpack('<I', chunk_header[4:])[0]
+        if chunk_id == b'fmt ':
+            body = file.read(chunk_size + chunk_size % 2)
+            format_tag, channels, sample_rate, _, _, bits = struct.unpack_from('<HHIIHH', body)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                # The actual format is the first two bytes of the sub format GUID
+                format_tag = struct.unpack_from('<H', body, 24)[0]
+            fmt = (format_tag, channels, sample_rate, bits)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise PeaksError('WAV data chunk before its fmt chunk')
+            format_tag, channels, sample_rate, bits = fmt
+            supported = (format_tag == WAVE_FORMAT_PCM and bits in (8, 16, 24, 32)) or (
+                format_tag == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64)
+            )
+            if not supported or not channels:
+                raise PeaksError(f'Unsupported WAV sample format {format_tag:#06x} with {bits} bits')
+            data_offset = file.tell()
+            data_size = probing.get_wav_data_size(chunk_size, data_offset, file.seek(0, io.SEEK_END))
+            return WavFormat(format_tag, channels, sample_rate, bits, data_offset, data_size)
+        else:
+            file.seek(chunk_size + chunk_size % 2, 1)
+
+
+def to_int16(data, wav_format):
+    """Samples of raw WAV bytes scaled to 16-bit integers"""
+
+    if wav_format.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        samples = numpy.frombuffer(data, dtype=f'<f{wav_format.bits // 8}')
+        return (numpy.clip(samples, -1.0, 1.0) * 32767).astype(numpy.int16)
+    if wav_format.bits == 8:
+        return ((numpy.frombuffer(data, dtype=numpy.uint8).astype(numpy.int16) - 128) << 8).astype(numpy.int16)
+    if wav_format.bits == 16:
+        return numpy.frombuffer(data, dtype='<i2')
+    if wav_format.bits == 24:
+        # The two most significant bytes of every sample make a 16-bit sample
+        return numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, 3)[:, 1:].copy().view('<i2').ravel()
+    return (numpy.frombuffer(data, dtype='<i4') >> 16).astype(numpy.int16)
+
+
+def iter_blocks(file, wav_format, block_frames):
+    """Yield the interleaved samples of whole frames of a WAV file as arrays of 16-bit integers"""
+
+    frame_size = wav_format.channels * wav_format.bits // 8
+    block_size = block_frames * frame_size
+    file.seek(wav_format.data_offset)
+    remaining = wav_format.data_size
+    while remaining > 0:
+        data = file.read(min(block_size, remaining))
+        usable = len(data) - len(data) % frame_size
+        if not usable:
+            return
+        remaining -= len(data)
+        yield to_int16(data[:usable], wav_format)
+
+
+def reduce_peaks(minimums, maximums, factor):
+    """Minimum and maximum of every `factor` consecutive peaks, the last group possibly being shorter"""
+
+    count = len(minimums)
+    full = count - count % factor
+    reduced_minimums = minimums[:full].reshape(-1, factor).min(axis=1)
+    reduced_maximums = maximums[:full].reshape(-1, factor).max(axis=1)
+    if full < count:
+        reduced_minimums = numpy.append(reduced_minimums, minimums[full:].min())
+        reduced_maximums = numpy.append(reduced_maximums, maximums[full:].max())
+    return reduced_minimums, reduced_maximums
+
+
+def compute_peaks(file, samples_per_peak=SAMPLES_PER_PEAK, max_levels=MAX_LEVELS):
+    """Return the sample rate of a WAV file and its levels of (min, max) pairs, finest first"""
+
+    wav_format = read_wav_format(file)
+    minimums, maximums = [], []
+    for samples in iter_blocks(file, wav_format, samples_per_peak * BLOCK_PEAKS):
+        # Every block but the last holds a whole number of peaks, whose samples of all channels are reduced at once
+        block_minimums, block_maximums = reduce_peaks(samples, samples, samples_per_peak * wav_format.channels)
+        minimums.append(block_minimums)
+        maximums.append(block_maximums)
+    if not minimums:
+        raise PeaksError('WAV file without samples')
+
+    level_minimums, level_maximums = numpy.concatenate(minimums), numpy.concatenate(maximums)
+    levels = [interleave(level_minimums, level_maximums)]
+    while len(levels) < max_levels and len(level_minimums) >= 2 * MIN_PEAKS:
+        level_minimums, level_maximums = reduce_peaks(level_minimums, level_maximums, 2)
+        levels.append(interleave(level_minimums, level_maximums))
+    return wav_format.sample_rate, levels
+
+
+def interleave(minimums, maximums):
+
+    pairs = numpy.empty(len(minimums) * 2, dtype='<i2')
+    pairs[0::2] = minimums
+    pairs[1::2] = maximums
+    return pairs
+
+
+def encode_peaks(sample_rate, samples_per_peak, levels):
+    """Chunks of the peaks file of the levels returned by `compute_peaks`"""
+
+    offset = HEADER.size + LEVEL.size * len(levels)
+    table = []
+    for pairs in levels:
+        table.append(LEVEL.pack(len(pairs) // 2, offset))
+        offset += pairs.nbytes
+    yield HEADER.pack(MAGIC, VERSION, len(levels), sample_rate, samples_per_peak) + b''.join(table)
+    for pairs in levels:
+        yield pairs.tobytes()
+
+
+def read_level(file, zoom):
+    """
+    Return the `PeaksLevel` at `zoom` of a peaks file, reading its header and that level only
+
+    Zoom 0 is the coarsest level, each zoom level above it doubles the resolution. Zoom levels past the finest one
+    return the finest one.
+    """
+
+    header = file.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise PeaksError('Truncated peaks file')
+    magic, version, level_count, sample_rate, samples_per_peak = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise PeaksError('Not a peaks file')
+
+    index = max(level_count - 1 - zoom, 0)
+    file.seek(HEADER.size + LEVEL.size * index)
+    count, offset = LEVEL.unpack(file.read(LEVEL.size))
+    file.seek(offset)
+    data = file.read(count * PAIR_SIZE)
+    if len(data) < count * PAIR_SIZE:
+        raise PeaksError('Truncated peaks file')
+    return PeaksLevel(sample_rate, samples_per_peak << index, level_count, data)
+
+
+def decode_pairs(data):
+    """List of the alternating minimums and maximums of the pairs of a level"""
+
+    return numpy.frombuffer(data, dtype='<i2').tolist()
@@ -0,0 +1,237 @@
+"""
+Duration and stream properties of audio files read from their container headers
+
+WAV, FLAC, Ogg (Vorbis and Opus) and MP3 are recognised. Files are memory mapped where possible, so only the pages
+holding the headers, and for Ogg the last page, are ever read, however large the file is.
+"""
+import mmap
+import struct
+from collections import namedtuple
+
+from core import storage as audio_storage
+
+
+AudioInfo = namedtuple('AudioInfo', ['format', 'duration', 'bitrate', 'sample_rate', 'channels'])
+
+
+class ProbeError(ValueError):
+    """The file is not in a supported format or its headers are damaged"""
+
+
+def probe_file(file):
+    """Return the `AudioInfo` of an open binary file"""
+
+    try:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        # Empty files cannot be mapped, and files of remote storages have no file descriptor
+        file.seek(0)
+        data = file.read()
+    try:
+        return probe_bytes(data)
+    except (IndexError, struct.error, ZeroDivisionError) as exc:
+        raise ProbeError(f'Damaged headers: {exc}') from exc
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+
+def probe_bytes(data):
+    """Return the `AudioInfo` of the content of a file, given as bytes or a memory map"""
+
+    if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+        return probe_wav(data)
+    if data[:4] == b'fLaC':
+        return probe_flac(data)
+    if data[:4] == b'OggS':
+        return probe_ogg(data)
+    if data[:3] == b'ID3' or find_mp3_frame(data, 0, limit=1) is not None:
+        return probe_mp3(data)
+    raise ProbeError('Unsupported audio format')
+
+
+def probe_stored(name, storage=None):
+    """
+    `AudioInfo` of a file of the audio storage and None, or None and why it cannot be probed
+
+    For use in worker processes, whose logs do not reach the handlers of the process that runs them.
+    """
+
+    storage = storage or audio_storage.get_storage()
+    try:
+        with storage.open(name) as file:
+            return probe_file(file), None
+    except (OSError, ProbeError) as exc:
+        return None, str(exc)
+
+
+PROBED_FIELDS = ['duration', 'bitrate', 'sample_rate', 'channels']
+
+
+def apply_info(audiofile, info):
+    """Set the probed properties on an audiofile, the duration rounded to whole seconds"""
+
+    audiofile.duration = round(info.duration)
+    audiofile.bitrate = info.bitrate
+    audiofile.sample_rate = info.sample_rate
+    audiofile.channels = info.channels
+
+
+def make_info(format_name, duration, sample_rate, channels, size, bitrate=None):
+    """`AudioInfo` with the average bitrate of the whole file when the format does not tell it"""
+
+    if bitrate is None:
+        bitrate = round(size * 8 / duration) if duration else None
+    return AudioInfo(format_name, duration, bitrate, sample_rate, channels)
+
+
+def probe_wav(data):
+
+    offset = 12
+    fmt = None
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        chunk_size = struct.unpack_from('<I', data, offset + 4)[0]
+        body = offset + 8
+        if chunk_id == b'fmt ':
+            fmt = struct.unpack_from('<HHIIHH', data, body)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ProbeError('WAV data chunk before its fmt chunk')
+            _, channels, sample_rate, byte_rate, _, _ = fmt
+            data_size = get_wav_data_size(chunk_size, body, len(data))
+            return make_info('wav', data_size / byte_rate, sample_rate, channels, data_size, byte_rate * 8)
+        offset = body + chunk_size + chunk_size % 2
+    raise ProbeError('WAV file without a data chunk')
+
+
+def get_wav_data_size(chunk_size, data_offset, file_size):
+    """
+    Size of the samples of a WAV file, as given by its data chunk but bounded by the end of the file
+
+    Streams written before their length was known leave the size at its maximum.
+    """
+
+    return max(0, min(chunk_size, file_size - data_offset))
+
+
+def probe_flac(data):
+
+    header = data[4]
+    if header & 0x7f != 0:
+        raise ProbeError('FLAC file not starting with a STREAMINFO block')
+    streaminfo = int.from_bytes(data[18:26], 'big')
+    sample_rate = streaminfo >> 44
+    channels = ((streaminfo >> 41) & 0x07) + 1
+    total_samples = streaminfo & 0xfffffffff
+    if not sample_rate:
+        raise ProbeError('FLAC STREAMINFO without a sample rate')
+    return make_info('flac', total_samples / sample_rate, sample_rate, channels, len(data))
+
+
+def probe_ogg(data):
+
+    segment_count = data[26]
+    packet = data[27 + segment_count:27 + segment_count + 64]
+    last_page = data.rfind(b'OggS')
+    granule_position = struct.unpack_from('<q', data, last_page + 6)[0]
+
+    if packet[:7] == b'\x01vorbis':
+        channels, sample_rate, _, nominal_bitrate = struct.unpack_from('<BIiI', packet, 11)
+        duration = granule_position / sample_rate
+        return make_info('ogg', duration, sample_rate, channels, len(data), nominal_bitrate or None)
+    if packet[:8] == b'OpusHead':
+        channels, pre_skip, input_sample_rate = struct.unpack_from('<BHI', packet, 9)
+        # Opus granule positions always count samples at 48 kHz
+        duration = max(granule_position - pre_skip, 0) / 48000
+        return make_info('ogg', duration, input_sample_rate or 48000, channels, len(data))
+    raise ProbeError('Ogg stream that is neither Vorbis nor Opus')
+
+
+MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 2.5: [11025, 12000, 8000]}
+MP3_VERSIONS = {0b00: 2.5, 0b10: 2, 0b11: 1}
+MP3_LAYERS = {0b01: 3, 0b10: 2, 0b11: 1}
+
+Mp3Frame = namedtuple('Mp3Frame', ['offset', 'version', 'layer', 'bitrate', 'sample_rate', 'channels', 'length'])
+
+
+def parse_mp3_frame(data, offset):
+    """The MP3 frame header at `offset`, None if there is none"""
+
+    if offset + 4 > len(data):
+        return None
+    header = int.from_bytes(data[offset:offset + 4], 'big')
+    if header >> 21 != 0x7ff:
+        return None
+    version = MP3_VERSIONS.get((header >> 19) & 0b11)
+    layer = MP3_LAYERS.get((header >> 17) & 0b11)
+    bitrate_index = (header >> 12) & 0x0f
+    sample_rate_index = (header >> 10) & 0b11
+    if version is None or layer is None or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    bitrate = MP3_BITRATES[(min(version, 2), layer)][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][sample_rate_index]
+    padding = (header >> 9) & 1
+    channels = 1 if (header >> 6) & 0b11 == 0b11 else 2
+    if layer == 1:
+        length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 3 and version != 1:
+        length = 72 * bitrate // sample_rate + padding
+    else:
+        length = 144 * bitrate // sample_rate + padding
+    return Mp3Frame(offset, version, layer, bitrate, sample_rate, channels, length)
+
+
+def find_mp3_frame(data, start, limit=64 * 1024):
+    """First frame from `start` whose successor, when the file goes on, is a frame too"""
+
+    offset = data.find(b'\xff', start, start + limit)
+    while offset != -1:
+        frame = parse_mp3_frame(data, offset)
+        if frame is not None:
+            next_offset = offset + frame.length
+            if next_offset + 4 > len(data) or parse_mp3_frame(data, next_offset) is not None:
+                return frame
+        offset = data.find(b'\xff', offset + 1, start + limit)
+    return None
+
+
+def probe_mp3(data):
+
+    start = 0
+    if data[:3] == b'ID3':
+        tag_size = int.from_bytes(bytes(byte & 0x7f for byte in data[6:10]), 'big')
+        start = 10 + tag_size + (10 if data[5] & 0x10 else 0)
+    frame = find_mp3_frame(data, start)
+    if frame is None:
+        raise ProbeError('No MP3 frame found')
+
+    samples_per_frame = 384 if frame.layer == 1 else 576 if frame.layer == 3 and frame.version != 1 else 1152
+    end = len(data) - (128 if data[-128:-125] == b'TAG' else 0)
+    audio_size = end - frame.offset
+
+    # VBR files carry the frame count in a Xing/Info or VBRI header in their first frame
+    side_info = (32 if frame.channels == 2 else 17) if frame.version == 1 else (17 if frame.channels == 2 else 9)
+    xing = frame.offset + 4 + side_info
+    frames = None
+    if data[xing:xing + 4] in (b'Xing', b'Info'):
+        flags = struct.unpack_from('>I', data, xing + 4)[0]
+        if flags & 0x1:
+            frames = struct.unpack_from('>I', data, xing + 8)[0]
+    elif data[frame.offset + 36:frame.offset + 40] == b'VBRI':
+        frames = struct.unpack_from('>I', data, frame.offset + 50)[0]
+
+    if frames:
+        duration = frames * samples_per_frame / frame.sample_rate
+        return make_info('mp3', duration, frame.sample_rate, frame.channels, audio_size)
+    duration = audio_size * 8 / frame.bitrate
+    return make_info('mp3', duration, frame.sample_rate, frame.channels, audio_size, frame.bitrate)
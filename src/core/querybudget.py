@@ -0,0 +1,72 @@
+"""
+Query budgets of API views and detection of N+1 queries
+
+Views declare the most queries each of their actions may run in `query_budgets`, see
+`core.mixins.QueryBudgetMixin`. The statements of a budgeted request are collected by `core.metrics.record_query` and
+checked once its response is ready: running more queries than the budget, or the same statement shape several times,
+is logged, or raised as `QueryBudgetExceeded` when `AUDIOFILE_QUERY_BUDGETS` is 'raise' as in the tests.
+
+Savepoints are left out of the counts, the tests run every request inside a transaction where production opens none.
+Statements over lists of values, such as batched inserts and updates or `IN` lookups, are batches rather than N+1
+queries and are never reported as repeated.
+"""
+import logging
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+OFF, LOG, RAISE = 'off', 'log', 'raise'
+MODES = [OFF, LOG, RAISE]
+
+TRANSACTION_CONTROL_PREFIXES = ('SAVEPOINT ', 'RELEASE SAVEPOINT ', 'ROLLBACK TO SAVEPOINT ')
+PLACEHOLDER_LIST = re.compile(r'%s(?:, %s)+')
+# Statements run this many times in one request are reported as N+1 queries
+REPEATED_STATEMENT_THRESHOLD = 5
+
+
+class QueryBudgetExceeded(Exception):
+    """A request ran more queries than its view allows, or repeated the same statement"""
+
+
+def is_transaction_control(sql):
+
+    return sql.startswith(TRANSACTION_CONTROL_PREFIXES)
+
+
+def count_queries(statements):
+    """Number of queries of a request, given the count of each of its statements"""
+
+    return sum(count for sql, count in statements.items() if not is_transaction_control(sql))
+
+
+def find_repeated_statements(statements, threshold=REPEATED_STATEMENT_THRESHOLD):
+    """(sql, count) of the statements run at least `threshold` times that do not operate on lists of values"""
+
+    return sorted(
+        (
+            (sql, count) for sql, count in statements.items()
+            if count >= threshold and not is_transaction_control(sql) and not PLACEHOLDER_LIST.search(sql)
+        ),
+        key=lambda item: -item[1]
+    )
+
+
+def check(view_name, budget, statements, mode):
+    """Log or raise the problems of a request of `view_name` given the count of each of its statements"""
+
+    if mode not in MODES:
+        raise ImproperlyConfigured(f'AUDIOFILE_QUERY_BUDGETS must be one of {", ".join(MODES)}, not {mode!r}')
+    problems = []
+    query_count = count_queries(statements)
+    if query_count > budget:
+        problems.append(f'{view_name} ran {query_count} queries, its budget is {budget}')
+    for sql, count in find_repeated_statements(statements):
+        problems.append(f'{view_name} ran the same statement {count} times, a likely N+1 query: {sql}')
+    if not problems:
+        return
+    if mode == RAISE:
+        raise QueryBudgetExceeded('\n'.join(problems))
+    for problem in problems:
+        logger.warning(problem)
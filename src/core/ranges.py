@@ -0,0 +1,116 @@
+"""
+Byte ranges of HTTP Range requests, RFC 7233
+"""
+import re
+
+RANGE_SPEC_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+MAX_RANGES = 16
+
+
+def parse_range_header(header, size):
+    """
+    Return the `(start, end)` pairs, end inclusive, a `Range` header asks for within `size` bytes
+
+    None is returned when the header is to be ignored, because it is malformed, uses another unit or asks for more than
+    `MAX_RANGES` ranges, and an empty list when none of its ranges is satisfiable.
+    """
+
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs:
+        return None
+    specs = specs.split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        match = RANGE_SPEC_RE.match(spec)
+        if match is None:
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            end = min(int(last), size - 1) if last else size - 1
+        elif last:
+            # Suffix range, the last bytes of the file
+            start = max(size - int(last), 0)
+            end = size - 1
+            if not int(last):
+                continue
+        else:
+            return None
+        if start < size:
+            ranges.append((start, end))
+    return ranges
+
+
+class FileRange:
+    """
+    File object reading at most `length` bytes of a file from `start`
+
+    The underlying file is positioned at `start` and `fileno` is exposed, so WSGI servers sending files with
+    `os.sendfile`, which send `Content-Length` bytes from the current position, keep doing so for ranges.
+    """
+
+    def __init__(self, file, start, length):
+
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+
+        return self.file.fileno()
+
+    def close(self):
+
+        self.file.close()
+
+
+def iter_range(file, start, end, block_size):
+    """Yield the bytes of `file` from `start` to `end` inclusive in blocks"""
+
+    file.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        data = file.read(min(block_size, remaining))
+        if not data:
+            return
+        remaining -= len(data)
+        yield data
+
+
+def multipart_byteranges(file, ranges, size, content_type, boundary, block_size):
+    """Return the length and the iterator of a `multipart/byteranges` body of `ranges` of `file`"""
+
+    part_headers = [
+        (
+            f'--{boundary}\r\nContent-Type: {content_type}\r\nContent-Range: bytes {start}-{end}/{size}\r\n\r\n'
+        ).encode('latin-1')
+        for start, end in ranges
+    ]
+    closing = f'--{boundary}--\r\n'.encode('latin-1')
+    length = sum(len(headers) + end - start + 1 + 2 for headers, (start, end) in zip(part_headers, ranges))
+    length += len(closing)
+
+    def iterator():
+        try:
+            for headers, (start, end) in zip(part_headers, ranges):
+                yield headers
+                yield from iter_range(file, start, end, block_size)
+                yield b'\r\n'
+            yield closing
+        finally:
+            file.close()
+
+    return length, iterator()
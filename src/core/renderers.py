@@ -0,0 +1,105 @@
+from rest_framework import renderers
+
+from core import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSON renderer producing the same bytes as `JSONRenderer`, using orjson for compact output when it is installed
+
+    Types orjson does not handle the way DRF's encoder does (datetimes, non JSON native types) are handed back to the
+    DRF encoder, and U+2028/U+2029 are escaped like `JSONRenderer` does.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+
+        with metrics.phase('render'):
+            return self.render_json(data, accepted_media_type, renderer_context)
+
+    def render_json(self, data, accepted_media_type=None, renderer_context=None):
+
+        if orjson is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        rendered = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        )
+        return rendered.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class StreamingJSONRenderer(FastJSONRenderer):
+    """JSON renderer that can also render an iterable of items as a JSON array without building it in memory"""
+
+    def render_stream(self, items, chunk_size):
+        """Yield the JSON array of `items` in chunks of at most `chunk_size` items"""
+
+        chunk = [b'[']
+        for index, item in enumerate(items):
+            if index:
+                chunk.append(b',')
+            chunk.append(self.render(item))
+            if len(chunk) >= 2 * chunk_size:
+                yield b''.join(chunk)
+                chunk = []
+        chunk.append(b']')
+        yield b''.join(chunk)
+
+
+class NDJSONRenderer(FastJSONRenderer):
+    """Newline delimited JSON, one item per line"""
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+
+        rendered = super().render(data, accepted_media_type, renderer_context)
+        return rendered + b'\n' if rendered else rendered
+
+    def render_stream(self, items, chunk_size):
+        """Yield one line per item in chunks of at most `chunk_size` lines"""
+
+        chunk = []
+        for item in items:
+            chunk.append(self.render(item))
+            if len(chunk) >= chunk_size:
+                yield b''.join(chunk)
+                chunk = []
+        if chunk:
+            yield b''.join(chunk)
+
+
+class PeaksRenderer(renderers.BaseRenderer):
+    """Waveform peaks as the raw 16-bit little-endian (min, max) pairs of a peaks file level"""
+
+    media_type = 'application/octet-stream'
+    format = 'peaks'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+
+        return data
+
+
+class PrometheusRenderer(renderers.BaseRenderer):
+    """Metrics already formatted in the Prometheus text exposition format"""
+
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+
+        return data.encode(self.charset)
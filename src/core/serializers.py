@@ -1,32 +1,181 @@
-from core import models, constants
+from django.conf import settings
+
+from core import metrics, models, constants
 
 from rest_framework import serializers
 
 
-class SongSerializer(serializers.ModelSerializer):
+class MetricsPhasesMixin:
+    """Time validation and representation as the validation and serialization phases of the request metrics"""
+
+    def is_valid(self, raise_exception=False):
+
+        with metrics.phase('validation'):
+            return super().is_valid(raise_exception=raise_exception)
+
+    @property
+    def data(self):
+
+        with metrics.phase('serialization'):
+            return super().data
+
+
+class AudioFileListSerializer(MetricsPhasesMixin, serializers.ListSerializer):
+    """
+    List serializer that writes all of its items with batched bulk inserts
+
+    With `skip_invalid` set in the context, invalid items are reported in `item_errors` instead of failing the
+    validation of the whole list.
+    """
+
+    batch_size = 1000
+
+    def to_internal_value(self, data):
+
+        if not self.context.get('skip_invalid') or not isinstance(data, list):
+            return super().to_internal_value(data)
+
+        validated_items = []
+        self.item_errors = []
+        for item in data:
+            try:
+                validated_items.append(self.child.run_validation(item))
+            except serializers.ValidationError as exc:
+                self.item_errors.append(exc.detail)
+            else:
+                self.item_errors.append({})
+        return validated_items
+
+    def create(self, validated_data):
+
+        model = self.child.Meta.model
+        return model.objects.bulk_create([model(**attrs) for attrs in validated_data], batch_size=self.batch_size)
+
+
+class SongSerializer(MetricsPhasesMixin, serializers.ModelSerializer):
 
     class Meta:
 
         model = models.Song
-        fields = '__all__'
+        exclude = ['search_vector', 'file', 'peaks']
+        list_serializer_class = AudioFileListSerializer
 
 
-class PodcastSerializer(serializers.ModelSerializer):
+class PodcastSerializer(MetricsPhasesMixin, serializers.ModelSerializer):
 
     class Meta:
 
         model = models.Podcast
-        fields = '__all__'
+        exclude = ['search_vector', 'file', 'peaks']
+        list_serializer_class = AudioFileListSerializer
 
 
-class AudioBookSerializer(serializers.ModelSerializer):
+class AudioBookSerializer(MetricsPhasesMixin, serializers.ModelSerializer):
 
     class Meta:
 
         model = models.AudioBook
-        fields = '__all__'
+        exclude = ['search_vector', 'file', 'peaks']
+        list_serializer_class = AudioFileListSerializer
 
 
-class AudioFileTypeSerializer(serializers.Serializer):
+class AudioFileTypeSerializer(MetricsPhasesMixin, serializers.Serializer):
 
     audiofiletype = serializers.ChoiceField(choices=[constants.AUDIOBOOK, constants.SONG, constants.PODCAST])
+
+
+class AudioFileIdListSerializer(MetricsPhasesMixin, serializers.Serializer):
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=50000,
+        required=False
+    )
+
+
+class AudioFileBulkUpdateItemSerializer(serializers.Serializer):
+    """An item of a bulk update, the `id` of an audiofile along with its own metadata, validated by the view"""
+
+    id = serializers.IntegerField(min_value=1)
+
+    def to_internal_value(self, data):
+
+        attrs = super().to_internal_value(data)
+        return {**data, **attrs}
+
+
+class AudioFileBulkUpdateSerializer(MetricsPhasesMixin, serializers.Serializer):
+    """Either one `audiofilemetadata` applied to every filtered row or id in `ids`, or `items` with their own `id`"""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=50000,
+        required=False
+    )
+    audiofilemetadata = serializers.DictField(required=False)
+    items = serializers.ListField(
+        child=AudioFileBulkUpdateItemSerializer(),
+        allow_empty=False,
+        max_length=10000,
+        required=False
+    )
+
+    def validate(self, attrs):
+
+        if 'items' in attrs:
+            if 'ids' in attrs or 'audiofilemetadata' in attrs:
+                raise serializers.ValidationError('Send either items or ids with audiofilemetadata, not both')
+            return attrs
+
+        if 'audiofilemetadata' not in attrs:
+            raise serializers.ValidationError({'audiofilemetadata': ['This field is required']})
+        return attrs
+
+
+class AudioFileSearchSerializer(MetricsPhasesMixin, serializers.Serializer):
+
+    q = serializers.CharField(max_length=200)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class AudioFileStatsSerializer(MetricsPhasesMixin, serializers.Serializer):
+
+    top = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    days = serializers.IntegerField(min_value=1, max_value=366, default=30)
+
+
+class AudioUploadSerializer(MetricsPhasesMixin, serializers.ModelSerializer):
+    """State of a resumable upload, `size` and `content_type` of the audio are given when starting it"""
+
+    class Meta:
+
+        model = models.AudioUpload
+        fields = ['id', 'audiofiletype', 'audiofileid', 'size', 'offset', 'content_type', 'created_time']
+        read_only_fields = ['audiofiletype', 'audiofileid', 'offset']
+
+    def validate_size(self, value):
+
+        if value > settings.AUDIOFILE_MAX_UPLOAD_SIZE:
+            raise serializers.ValidationError(
+                f'Ensure this value is less than or equal to {settings.AUDIOFILE_MAX_UPLOAD_SIZE}.'
+            )
+        return value
+
+    def validate_content_type(self, value):
+
+        if not value.startswith('audio/'):
+            raise serializers.ValidationError('Only audio content types are accepted.')
+        return value
+
+
+class AudioJobSerializer(MetricsPhasesMixin, serializers.ModelSerializer):
+
+    class Meta:
+
+        model = models.AudioJob
+        fields = [
+            'id', 'kind', 'status', 'attempts', 'max_attempts', 'run_after', 'last_error',
+            'created_time', 'started_time', 'finished_time'
+        ]
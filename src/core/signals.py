@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core import models, uploads
+from core.cache import response_cache
+
+
+@receiver(post_save, sender=models.Song)
+@receiver(post_save, sender=models.Podcast)
+@receiver(post_save, sender=models.AudioBook)
+@receiver(post_delete, sender=models.Song)
+@receiver(post_delete, sender=models.Podcast)
+@receiver(post_delete, sender=models.AudioBook)
+def invalidate_cached_responses(sender, **kwargs):
+    """Drop the cached responses of the audiofiletype a saved or deleted record belongs to"""
+
+    response_cache.invalidate(sender.audiofiletype)
+
+
+@receiver(post_delete, sender=models.Song)
+@receiver(post_delete, sender=models.Podcast)
+@receiver(post_delete, sender=models.AudioBook)
+def release_audiofile(sender, instance, **kwargs):
+    """Release the uploaded media, jobs and unfinished uploads of a deleted record"""
+
+    uploads.release_audiofiles(sender.audiofiletype, [instance.pk], [(instance.file, instance.peaks)])
@@ -0,0 +1,118 @@
+"""
+Aggregate statistics of audiofiles read from summary tables
+
+Triggers on the song, podcast and audiobook tables add the rows every statement inserts, updates or deletes to
+`AudioFileStats`, `AudioFileDailyStats` and `AudioFileContributorStats` (see migration 0015), whether written through
+the API, the ORM, bulk operations or raw SQL. Reading statistics costs a few index lookups on these small tables
+instead of scans of the audiofile tables. `rebuild` recomputes them from scratch, should they ever drift.
+"""
+import datetime
+
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from core import models
+
+# Slots the per type and per day counts are spread over by the triggers
+SLOTS = 16
+
+CONTRIBUTOR_ROLES = {
+    'host': 'podcast',
+    'author': 'audiobook',
+    'narrator': 'audiobook',
+}
+
+REBUILD_SQL = """
+DELETE FROM audiofilestats WHERE audiofiletype = '{table}';
+DELETE FROM audiofiledailystats WHERE audiofiletype = '{table}';
+DELETE FROM audiofilecontributorstats WHERE audiofiletype = '{table}';
+
+INSERT INTO audiofilestats (audiofiletype, slot, count, total_duration)
+SELECT '{table}', 0, count(*), coalesce(sum(duration), 0) FROM {table};
+
+INSERT INTO audiofiledailystats (day, audiofiletype, slot, uploads)
+SELECT (uploaded_time AT TIME ZONE 'UTC')::date, '{table}', 0, count(*) FROM {table} GROUP BY 1;
+"""
+
+REBUILD_CONTRIBUTORS_SQL = """
+INSERT INTO audiofilecontributorstats (audiofiletype, role, name, count, total_duration)
+SELECT '{table}', '{role}', {role}, count(*), sum(duration) FROM {table} GROUP BY {role};
+"""
+
+
+def get_type_totals():
+    """Number, total and average duration of the audiofiles of every type"""
+
+    totals = {
+        audiofiletype: {'count': 0, 'total_duration': 0, 'average_duration': None}
+        for audiofiletype, _ in models.AUDIOFILETYPE_CHOICES
+    }
+    rows = models.AudioFileStats.objects.values('audiofiletype').annotate(
+        count=Sum('count'),
+        total_duration=Sum('total_duration')
+    ).order_by()
+    for row in rows:
+        totals[row['audiofiletype']] = {
+            'count': row['count'],
+            'total_duration': row['total_duration'],
+            'average_duration': row['total_duration'] / row['count'] if row['count'] else None,
+        }
+    return totals
+
+
+def get_top_contributors(role, limit):
+    """Hosts, authors or narrators with the most audiofiles"""
+
+    return list(
+        models.AudioFileContributorStats.objects.filter(role=role).order_by('-count', 'name').values(
+            'name', 'count', 'total_duration'
+        )[:limit]
+    )
+
+
+def get_uploads_per_day(days):
+    """Audiofiles of every type uploaded on each of the last `days` days (UTC) that had any upload"""
+
+    first_day = timezone.now().astimezone(datetime.timezone.utc).date() - datetime.timedelta(days=days - 1)
+    rows = models.AudioFileDailyStats.objects.filter(day__gte=first_day).values('day', 'audiofiletype').annotate(
+        uploads=Sum('uploads')
+    ).filter(uploads__gt=0).order_by('day')
+
+    uploads_per_day = {}
+    for row in rows:
+        counts = uploads_per_day.setdefault(
+            row['day'],
+            {audiofiletype: 0 for audiofiletype, _ in models.AUDIOFILETYPE_CHOICES}
+        )
+        counts[row['audiofiletype']] = row['uploads']
+    return [{'day': day, **counts} for day, counts in uploads_per_day.items()]
+
+
+def get_stats(top=10, days=30):
+
+    return {
+        'types': get_type_totals(),
+        **{f'top_{role}s': get_top_contributors(role, top) for role in CONTRIBUTOR_ROLES},
+        'uploads_per_day': get_uploads_per_day(days),
+    }
+
+
+def rebuild():
+    """
+    Recompute the summary tables from the audiofile tables and return the type totals before and after
+
+    The audiofile tables are locked against writes meanwhile, so that no change is counted twice or missed.
+    """
+
+    tables = [audiofiletype for audiofiletype, _ in models.AUDIOFILETYPE_CHOICES]
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {", ".join(tables)} IN SHARE MODE')
+            before = get_type_totals()
+            for table in tables:
+                cursor.execute(REBUILD_SQL.format(table=table))
+                for role, role_table in CONTRIBUTOR_ROLES.items():
+                    if role_table == table:
+                        cursor.execute(REBUILD_CONTRIBUTORS_SQL.format(table=table, role=role))
+        return before, get_type_totals()
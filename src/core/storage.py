@@ -0,0 +1,111 @@
+"""
+Storages the media of audiofiles is written to
+
+Django's `Storage` API only saves whole files. Uploads are written chunk by chunk at a given offset instead, so that
+an interrupted upload can carry on where it stopped, which needs the narrower interface of `AudioStorage`. The
+storage in use is configured with `AUDIOFILE_STORAGE`.
+"""
+import os
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class AudioStorage:
+    """Interface of an audio storage, names are relative slash separated paths"""
+
+    def write(self, name, chunks, offset=0):
+        """Write `chunks` at `offset` of `name`, dropping anything stored past them, and return the bytes written"""
+
+        raise NotImplementedError
+
+    def move(self, source, target):
+        """Rename `source` to `target`, replacing it"""
+
+        raise NotImplementedError
+
+    def open(self, name):
+        """Open `name` for reading as a binary file object"""
+
+        raise NotImplementedError
+
+    def size(self, name):
+
+        raise NotImplementedError
+
+    def exists(self, name):
+
+        raise NotImplementedError
+
+    def delete(self, name):
+        """Delete `name`, doing nothing when it does not exist"""
+
+        raise NotImplementedError
+
+    def path(self, name):
+        """Local filesystem path of `name`, for storages that have one"""
+
+        raise NotImplementedError(f'{type(self).__name__} does not store files on the local filesystem')
+
+
+class FileSystemAudioStorage(AudioStorage):
+    """Audio storage in a directory of the local filesystem"""
+
+    def __init__(self, location):
+
+        self.location = os.path.abspath(location)
+
+    def path(self, name):
+
+        path = os.path.abspath(os.path.join(self.location, name))
+        if os.path.commonpath([path, self.location]) != self.location:
+            raise ValueError(f'{name} is outside of the storage location')
+        return path
+
+    def write(self, name, chunks, offset=0):
+
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        written = 0
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as file:
+            file.seek(offset)
+            try:
+                for chunk in chunks:
+                    file.write(chunk)
+                    written += len(chunk)
+            finally:
+                # Whatever was received is kept, so that an interrupted upload can resume right after it
+                file.truncate(offset + written)
+        return written
+
+    def move(self, source, target):
+
+        target_path = self.path(target)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        os.replace(self.path(source), target_path)
+
+    def open(self, name):
+
+        return open(self.path(name), 'rb')
+
+    def size(self, name):
+
+        return os.path.getsize(self.path(name))
+
+    def exists(self, name):
+
+        return os.path.exists(self.path(name))
+
+    def delete(self, name):
+
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+
+def get_storage():
+    """Audio storage configured with `AUDIOFILE_STORAGE`"""
+
+    storage_settings = settings.AUDIOFILE_STORAGE
+    return import_string(storage_settings['BACKEND'])(**storage_settings.get('OPTIONS', {}))
@@ -1,15 +1,59 @@
+import asyncio
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import pickle
 import string
+import struct
+import statistics
 import random
-
-from rest_framework import status
+import shutil
+import tempfile
+import threading
+import time
+import wave
+from collections import Counter
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+import psycopg2
+from asgiref.sync import async_to_sync
+from rest_framework import serializers, status
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.db import connection
+from django.db.models import Count, Sum
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.http import HttpResponse, UnreadablePostError
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
-from rest_framework.test import APITestCase
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, APITestCase
 from rest_framework.reverse import reverse
 
-from core.constants import PODCAST, SONG, AUDIOBOOK
-from core.models import AudioBook, Song, Podcast
-from core.serializers import PodcastSerializer, AudioBookSerializer, SongSerializer
+from core.constants import PODCAST, SONG, AUDIOBOOK, PEAKS_JOB, PROBE_JOB
+from core import benchmarks, blobs, exports, imports, jobs, metrics, peaks, probing, querybudget, ranges, stats, uploads
+from core.models import AudioBlob, AudioBook, AudioFileStats, AudioImport, AudioJob, AudioUpload, Song, Podcast
+from core.async_views import AsyncAudioFileCreateAPIView, AsyncAudioFileViewSet
+from core.cache import response_cache
+from core.db import database_sync_to_async
+from core.db_backends.postgresql.pool import ConnectionPool
+from core.fast_serializers import get_field_plan
+from core.middleware import metrics_middleware
+from core.mixins import AudioFileModelSerializerMappingMixin
+from core.renderers import FastJSONRenderer
+from core.pagination import AudioFileCursorPagination
+from core.views import AudioFileViewSet
+from core.serializers import PodcastSerializer, AudioBookSerializer, SongSerializer, AudioFileTypeSerializer
 
 
 def create_audiofile_objects():
@@ -301,6 +345,26 @@ class AudioFileCreateTests(APITestCase):
         self.assertGreater(parse_datetime(response.data.get('uploaded_time')), now)
         self.assertEqual(AudioBook.objects.count(), 1)
 
+    def test_create_dispatches_and_validates_once(self):
+
+        data = {"audiofiletype": SONG, "audiofilemetadata": {"name": "Rolex", "duration": 249}}
+        with mock.patch.object(AudioFileTypeSerializer, 'is_valid') as audiofiletype_is_valid, \
+                mock.patch.object(SongSerializer, 'run_validation', autospec=True,
+                                  side_effect=SongSerializer.run_validation) as run_validation, \
+                mock.patch.object(SongSerializer, 'to_representation', autospec=True,
+                                  side_effect=SongSerializer.to_representation) as to_representation:
+            response = self.client.post(path=self.url, data=data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        audiofiletype_is_valid.assert_not_called()
+        self.assertEqual(run_validation.call_count, 1)
+        self.assertEqual(to_representation.call_count, 1)
+
+    def test_create_with_non_object_body(self):
+
+        response = self.client.post(path=self.url, data=[SONG])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {"non_field_errors": ["Invalid data. Expected a dictionary, but got list."]})
+
 
 class AudioFileDeleteTests(APITestCase):
 
@@ -385,21 +449,30 @@ class AudioFileGetTests(APITestCase):
 
         url = reverse('list-audio-files', kwargs={'audiofiletype': SONG})
         response = self.client.get(url)
-        self.assertEqual(response.data, SongSerializer(Song.objects.all(), many=True).data)
+        self.assertEqual(
+            response.data['results'],
+            SongSerializer(Song.objects.order_by('uploaded_time', 'id'), many=True).data
+        )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
     def test_list_podcasts(self):
 
         url = reverse('list-audio-files', kwargs={'audiofiletype': PODCAST})
         response = self.client.get(url)
-        self.assertEqual(response.data, PodcastSerializer(Podcast.objects.all(), many=True).data)
+        self.assertEqual(
+            response.data['results'],
+            PodcastSerializer(Podcast.objects.order_by('uploaded_time', 'id'), many=True).data
+        )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
     def test_list_audiobooks(self):
 
         url = reverse('list-audio-files', kwargs={'audiofiletype': AUDIOBOOK})
         response = self.client.get(url)
-        self.assertEqual(response.data, AudioBookSerializer(AudioBook.objects.all(), many=True).data)
+        self.assertEqual(
+            response.data['results'],
+            AudioBookSerializer(AudioBook.objects.order_by('uploaded_time', 'id'), many=True).data
+        )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
@@ -488,3 +561,2765 @@ class AudioFileUpdateTests(APITestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, PodcastSerializer(instance=Podcast.objects.get()).data)
+
+
+class AudioFilePaginationTests(APITestCase):
+
+    def setUp(self):
+
+        self.songs = [Song.objects.create(name=f'Song {index}', duration=200 + index) for index in range(5)]
+        self.url = reverse('list-audio-files', kwargs={'audiofiletype': SONG})
+
+    def test_list_first_page(self):
+
+        response = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], SongSerializer(self.songs[:2], many=True).data)
+        self.assertIsNotNone(response.data['next'])
+        self.assertIsNone(response.data['previous'])
+
+    def test_walk_forward_and_back_with_cursors(self):
+
+        seen_ids = []
+        next_url = f'{self.url}?page_size=2'
+        while next_url:
+            response = self.client.get(next_url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen_ids.extend(item['id'] for item in response.data['results'])
+            last_page, next_url = response.data, response.data['next']
+        self.assertEqual(seen_ids, [song.id for song in self.songs])
+
+        response = self.client.get(last_page['previous'])
+        self.assertEqual([item['id'] for item in response.data['results']], [song.id for song in self.songs[2:4]])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([item['id'] for item in response.data['results']], [song.id for song in self.songs[:2]])
+        self.assertIsNone(response.data['previous'])
+
+    def test_deep_page_does_not_use_offset(self):
+
+        response = self.client.get(self.url, {'page_size': 1})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'], SongSerializer(self.songs[1:2], many=True).data)
+        self.assertNotIn('OFFSET', queries.captured_queries[-1]['sql'])
+
+    def test_rows_with_same_uploaded_time_are_not_skipped(self):
+
+        Song.objects.update(uploaded_time=timezone.now())
+        seen_ids = []
+        next_url = f'{self.url}?page_size=2'
+        while next_url:
+            response = self.client.get(next_url)
+            seen_ids.extend(item['id'] for item in response.data['results'])
+            next_url = response.data['next']
+        self.assertEqual(seen_ids, sorted(song.id for song in self.songs))
+
+    def test_page_size_is_bounded(self):
+
+        with mock.patch.object(AudioFileCursorPagination, 'max_page_size', 3):
+            response = self.client.get(self.url, {'page_size': 100000})
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_invalid_cursor(self):
+
+        response = self.client.get(self.url, {'cursor': 'notacursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AudioFileExportTests(APITestCase):
+
+    def setUp(self):
+
+        self.song, self.podcast, self.audiobook = create_audiofile_objects()
+        Song.objects.create(name='Another Song', duration=120)
+
+    def test_export_songs_as_json(self):
+
+        url = reverse('export-audio-files', kwargs={'audiofiletype': SONG})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(
+            json.loads(b''.join(response.streaming_content)),
+            SongSerializer(Song.objects.order_by('pk'), many=True).data
+        )
+
+    def test_export_podcasts_as_ndjson(self):
+
+        url = reverse('export-audio-files', kwargs={'audiofiletype': PODCAST})
+        response = self.client.get(url, {'format': 'ndjson'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [PodcastSerializer(self.podcast).data])
+
+    def test_export_chunks_rows(self):
+
+        url = reverse('export-audio-files', kwargs={'audiofiletype': SONG})
+        with mock.patch.object(AudioFileViewSet, 'export_chunk_size', 1):
+            response = self.client.get(url, HTTP_ACCEPT='application/x-ndjson')
+            chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), Song.objects.count())
+
+    def test_export_empty_table(self):
+
+        Song.objects.all().delete()
+        url = reverse('export-audio-files', kwargs={'audiofiletype': SONG})
+        response = self.client.get(url)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [])
+
+
+class AudioFileBulkCreateTests(APITestCase):
+
+    def setUp(self):
+
+        self.url = reverse('bulk-create-audio-files')
+        self.items = [
+            {"audiofiletype": SONG, "audiofilemetadata": {"name": "Rolex", "duration": 240}},
+            {
+                "audiofiletype": PODCAST,
+                "audiofilemetadata": {"name": "The Python Podcast", "duration": 240, "host": "Somebody"}
+            },
+            {"audiofiletype": SONG, "audiofilemetadata": {"name": "Another Song", "duration": 120}},
+            {
+                "audiofiletype": AUDIOBOOK,
+                "audiofilemetadata": {"name": "Some Audiobook", "duration": 240, "author": "A", "narrator": "B"}
+            },
+        ]
+
+    def test_bulk_create_mixed_audio_types(self):
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data=self.items)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Song.objects.count(), 2)
+        self.assertEqual(Podcast.objects.count(), 1)
+        self.assertEqual(AudioBook.objects.count(), 1)
+        self.assertEqual(
+            response.data,
+            [
+                SongSerializer(Song.objects.get(name='Rolex')).data,
+                PodcastSerializer(Podcast.objects.get()).data,
+                SongSerializer(Song.objects.get(name='Another Song')).data,
+                AudioBookSerializer(AudioBook.objects.get()).data,
+            ]
+        )
+        inserts = [query for query in queries.captured_queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 3)
+
+    def test_bulk_create_rejects_everything_when_an_item_is_invalid(self):
+
+        self.items[2]['audiofilemetadata'] = {"name": "Missing duration"}
+        self.items.append({"audiofiletype": "somethingrandom"})
+        self.items.append({"audiofiletype": SONG})
+        response = self.client.post(self.url, data=self.items)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data,
+            [
+                {},
+                {},
+                {"duration": ["This field is required."]},
+                {},
+                {"audiofiletype": ["\"somethingrandom\" is not a valid choice."]},
+                {"audiofilemetadata": ["This field is required"]},
+            ]
+        )
+        self.assertEqual(Song.objects.count(), 0)
+        self.assertEqual(Podcast.objects.count(), 0)
+
+    def test_partial_bulk_create_keeps_valid_items(self):
+
+        self.items[2]['audiofilemetadata'] = {"name": "Missing duration"}
+        response = self.client.post(f'{self.url}?partial=true', data=self.items)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['errors'], [{}, {}, {"duration": ["This field is required."]}, {}])
+        self.assertIsNone(response.data['results'][2])
+        self.assertEqual(response.data['results'][0], SongSerializer(Song.objects.get()).data)
+        self.assertEqual(Song.objects.count(), 1)
+        self.assertEqual(AudioBook.objects.count(), 1)
+
+    def test_partial_bulk_create_without_valid_items(self):
+
+        response = self.client.post(f'{self.url}?partial=true', data=[{"audiofiletype": SONG}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['errors'], [{"audiofilemetadata": ["This field is required"]}])
+
+    def test_bulk_create_requires_a_list(self):
+
+        response = self.client.post(self.url, data=self.items[0])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {"non_field_errors": ["Expected a list of audio files"]})
+
+
+class AudioFileBulkActionsTests(APITestCase):
+
+    def setUp(self):
+
+        self.podcasts = [
+            Podcast.objects.create(name=f'Podcast {index}', duration=100 + index, host='Host', participants=['A'])
+            for index in range(4)
+        ]
+        self.url = reverse('bulk-actions-audio-files', kwargs={'audiofiletype': PODCAST})
+
+    def test_bulk_update_same_values(self):
+
+        ids = [podcast.id for podcast in self.podcasts[:3]]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.url, data={'ids': ids, 'audiofilemetadata': {'host': 'New Host'}})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'updated': 3})
+        self.assertEqual(Podcast.objects.filter(host='New Host').count(), 3)
+        self.assertEqual(len(queries), 1)
+
+    def test_bulk_update_validates_metadata(self):
+
+        ids = [podcast.id for podcast in self.podcasts]
+        response = self.client.patch(self.url, data={'ids': ids, 'audiofilemetadata': {'duration': 'abc'}})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'duration': ['A valid integer is required.']})
+
+    def test_bulk_update_per_item_values(self):
+
+        items = [
+            {'id': self.podcasts[0].id, 'name': 'First'},
+            {'id': self.podcasts[1].id, 'duration': 999, 'participants': ['B', 'C']},
+        ]
+        response = self.client.patch(self.url, data={'items': items})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'updated': 2})
+        first, second = Podcast.objects.filter(pk__in=[item['id'] for item in items]).order_by('pk')
+        self.assertEqual((first.name, first.duration), ('First', 100))
+        self.assertEqual((second.name, second.duration, second.participants), ('Podcast 1', 999, ['B', 'C']))
+
+    def test_bulk_update_per_item_errors(self):
+
+        missing_id = max(podcast.id for podcast in self.podcasts) + 1000
+        items = [{'id': self.podcasts[0].id, 'name': 'First'}, {'id': missing_id, 'name': 'Missing'}]
+        response = self.client.patch(self.url, data={'items': items})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'items': [{}, {'id': ['Not found.']}]})
+        self.assertFalse(Podcast.objects.filter(name='First').exists())
+
+    def test_bulk_update_validates_item_ids(self):
+
+        items = [{'id': True, 'name': 'First'}, {'id': 0}, {'name': 'No id'}, {'id': self.podcasts[0].id}]
+        response = self.client.patch(self.url, data={'items': items})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'items': {
+            0: {'id': ['A valid integer is required.']},
+            1: {'id': ['Ensure this value is greater than or equal to 1.']},
+            2: {'id': ['This field is required.']},
+        }})
+        self.assertFalse(Podcast.objects.filter(name='First').exists())
+
+    def test_bulk_update_requires_ids_or_items(self):
+
+        response = self.client.patch(self.url, data={'audiofilemetadata': {'host': 'New Host'}})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'ids': ['Either ids or a filter is required']})
+        self.assertFalse(Podcast.objects.filter(host='New Host').exists())
+
+    def test_bulk_delete(self):
+
+        ids = [podcast.id for podcast in self.podcasts[1:]]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(self.url, data={'ids': ids})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'deleted': 3})
+        self.assertEqual(list(Podcast.objects.all()), self.podcasts[:1])
+        deletes = [query for query in queries.captured_queries if query['sql'].startswith('DELETE FROM "podcast"')]
+        self.assertEqual(len(deletes), 1)
+
+    def test_bulk_delete_requires_ids(self):
+
+        response = self.client.delete(self.url, data={})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Podcast.objects.count(), 4)
+
+
+class AudioFileFilterTests(APITestCase):
+
+    def setUp(self):
+
+        self.podcasts = [
+            Podcast.objects.create(name='Talk Python', duration=100, host='Michael', participants=['Brian', 'Anna']),
+            Podcast.objects.create(name='Python Bytes', duration=200, host='Brian', participants=['Michael']),
+            Podcast.objects.create(name='Real Python', duration=300, host='Michael', participants=['Anna']),
+        ]
+        self.url = reverse('list-audio-files', kwargs={'audiofiletype': PODCAST})
+
+    def get_ids(self, params):
+
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in response.data['results']]
+
+    def test_filter_by_name(self):
+
+        self.assertEqual(self.get_ids({'name': 'Python Bytes'}), [self.podcasts[1].id])
+
+    def test_filter_by_duration_range(self):
+
+        self.assertEqual(
+            self.get_ids({'duration_min': 150, 'duration_max': 300}),
+            [self.podcasts[1].id, self.podcasts[2].id]
+        )
+
+    def test_filter_by_uploaded_time_range(self):
+
+        uploaded_time = self.podcasts[1].uploaded_time.isoformat()
+        self.assertEqual(self.get_ids({'uploaded_after': uploaded_time}), [self.podcasts[1].id, self.podcasts[2].id])
+        self.assertEqual(self.get_ids({'uploaded_before': uploaded_time}), [self.podcasts[0].id, self.podcasts[1].id])
+
+    def test_filter_by_host(self):
+
+        self.assertEqual(self.get_ids({'host': 'Michael'}), [self.podcasts[0].id, self.podcasts[2].id])
+
+    def test_filter_by_participants_containment(self):
+
+        self.assertEqual(self.get_ids({'participants': 'Anna'}), [self.podcasts[0].id, self.podcasts[2].id])
+        self.assertEqual(self.get_ids({'participants': 'Anna,Brian'}), [self.podcasts[0].id])
+
+    def test_filter_by_author_and_narrator(self):
+
+        audiobook = AudioBook.objects.create(name='Some Audiobook', duration=240, author='Someone', narrator='Vishal')
+        AudioBook.objects.create(name='Other Audiobook', duration=240, author='Someone', narrator='Other')
+        url = reverse('list-audio-files', kwargs={'audiofiletype': AUDIOBOOK})
+        response = self.client.get(url, {'author': 'Someone', 'narrator': 'Vishal'})
+        self.assertEqual([item['id'] for item in response.data['results']], [audiobook.id])
+
+    def test_filters_of_other_audio_types_are_ignored(self):
+
+        song = Song.objects.create(name='Rolex', duration=240)
+        url = reverse('list-audio-files', kwargs={'audiofiletype': SONG})
+        response = self.client.get(url, {'host': 'Michael'})
+        self.assertEqual([item['id'] for item in response.data['results']], [song.id])
+
+    def test_invalid_filter_value(self):
+
+        response = self.client.get(self.url, {'duration_min': 'abc', 'uploaded_after': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {'duration_min', 'uploaded_after'})
+
+    def test_ordering_with_cursor_pagination(self):
+
+        self.assertEqual(
+            self.get_ids({'ordering': 'name'}),
+            [self.podcasts[1].id, self.podcasts[2].id, self.podcasts[0].id]
+        )
+        self.assertEqual(
+            self.get_ids({'ordering': '-duration'}),
+            [self.podcasts[2].id, self.podcasts[1].id, self.podcasts[0].id]
+        )
+
+        response = self.client.get(self.url, {'ordering': '-duration', 'page_size': 1})
+        response = self.client.get(response.data['next'])
+        self.assertEqual([item['id'] for item in response.data['results']], [self.podcasts[1].id])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([item['id'] for item in response.data['results']], [self.podcasts[2].id])
+
+    def test_bulk_delete_with_filter(self):
+
+        url = reverse('bulk-actions-audio-files', kwargs={'audiofiletype': PODCAST})
+        response = self.client.delete(f'{url}?host=Michael')
+        self.assertEqual(response.data, {'deleted': 2})
+        self.assertEqual(list(Podcast.objects.all()), [self.podcasts[1]])
+
+    def test_bulk_update_with_filter(self):
+
+        url = reverse('bulk-actions-audio-files', kwargs={'audiofiletype': PODCAST})
+        response = self.client.patch(f'{url}?duration_max=200', data={'audiofilemetadata': {'host': 'Guest'}})
+        self.assertEqual(response.data, {'updated': 2})
+        self.assertEqual(Podcast.objects.filter(host='Guest').count(), 2)
+
+
+class AudioFileFilterIndexTests(APITestCase):
+    """Every supported filter has to be answerable from an index rather than a sequential scan"""
+
+    def get_plan(self, audiofiletype, params):
+
+        url = reverse('list-audio-files', kwargs={'audiofiletype': audiofiletype})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, params)
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f"EXPLAIN {queries.captured_queries[-1]['sql']}")
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def test_filters_use_indexes(self):
+
+        cases = [
+            (SONG, {'name': 'Rolex'}, 'song_name_id_idx'),
+            (SONG, {'duration_min': 100, 'ordering': 'duration'}, 'song_duration_id_idx'),
+            (SONG, {'uploaded_after': '2021-01-01T00:00:00Z'}, 'song_uploaded_time_id_idx'),
+            (PODCAST, {'host': 'Michael'}, 'podcast_host_idx'),
+            (PODCAST, {'participants': 'Anna'}, 'podcast_participants_gin_idx'),
+            (AUDIOBOOK, {'author': 'Someone'}, 'audiobook_author_idx'),
+            (AUDIOBOOK, {'narrator': 'Vishal'}, 'audiobook_narrator_idx'),
+        ]
+        for audiofiletype, params, index_name in cases:
+            with self.subTest(params=params):
+                self.assertIn(index_name, self.get_plan(audiofiletype, params))
+
+
+class AudioFileSearchTests(APITestCase):
+
+    def setUp(self):
+
+        self.song, self.podcast, self.audiobook = create_audiofile_objects()
+        self.python_song = Song.objects.create(name='Python Blues', duration=180)
+        self.url = reverse('search-audio-files')
+
+    def search(self, text, **params):
+
+        response = self.client.get(self.url, {'q': text, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(hit['audiofiletype'], hit['audiofile']['id']) for hit in response.data]
+
+    def test_search_across_audio_types(self):
+
+        self.assertEqual(
+            set(self.search('python')),
+            {(PODCAST, self.podcast.id), (SONG, self.python_song.id)}
+        )
+
+    def test_search_by_people(self):
+
+        self.assertEqual(self.search('Vishal'), [(PODCAST, self.podcast.id), (AUDIOBOOK, self.audiobook.id)])
+        self.assertEqual(self.search('somebody'), [(PODCAST, self.podcast.id)])
+
+    def test_search_tolerates_typos_in_names(self):
+
+        self.assertEqual(self.search('Rolexx'), [(SONG, self.song.id)])
+
+    def test_search_vector_follows_updates(self):
+
+        Song.objects.filter(pk=self.song.pk).update(name='Completely Different')
+        self.assertEqual(self.search('different'), [(SONG, self.song.id)])
+        self.assertEqual(self.search('rolex'), [])
+
+    def test_search_results_are_ranked_and_limited(self):
+
+        response = self.client.get(self.url, {'q': 'python', 'limit': 1})
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['audiofile'], SongSerializer(self.python_song).data)
+        self.assertGreater(response.data[0]['rank'], 0)
+
+    def test_search_requires_text(self):
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'q': ['This field is required.']})
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'audiofile-cache-tests',
+        'OPTIONS': {'MAX_ENTRIES': 100},
+    }
+})
+class AudioFileResponseCacheTests(APITestCase):
+
+    def setUp(self):
+
+        self.song, self.podcast, self.audiobook = create_audiofile_objects()
+        self.detail_url = reverse(
+            'common-actions-audio-file',
+            kwargs={'audiofiletype': SONG, 'audiofileid': self.song.pk}
+        )
+        self.list_url = reverse('list-audio-files', kwargs={'audiofiletype': SONG})
+
+    def tearDown(self):
+
+        response_cache.cache.clear()
+
+    def test_retrieve_is_served_from_cache(self):
+
+        self.client.get(self.detail_url)
+        hits = response_cache.hits
+        with self.assertNumQueries(0):
+            response = self.client.get(self.detail_url)
+        self.assertEqual(response.data, SongSerializer(self.song).data)
+        self.assertEqual(response_cache.hits, hits + 1)
+
+    def test_list_is_cached_per_query_params(self):
+
+        self.client.get(self.list_url)
+        with self.assertNumQueries(0):
+            self.client.get(self.list_url)
+        # The validators aggregate and the page itself
+        with self.assertNumQueries(2):
+            response = self.client.get(self.list_url, {'name': 'Nothing'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_update_invalidates_cached_responses(self):
+
+        self.client.get(self.detail_url)
+        self.client.get(self.list_url)
+        self.client.patch(self.detail_url, data={'name': 'Changed'})
+        self.assertEqual(self.client.get(self.detail_url).data['name'], 'Changed')
+        self.assertEqual(self.client.get(self.list_url).data['results'][0]['name'], 'Changed')
+
+    def test_create_and_delete_invalidate_cached_list(self):
+
+        self.client.get(self.list_url)
+        self.client.post(
+            reverse('create-audio-file'),
+            data={'audiofiletype': SONG, 'audiofilemetadata': {'name': 'New', 'duration': 10}}
+        )
+        self.assertEqual(len(self.client.get(self.list_url).data['results']), 2)
+        self.client.delete(self.detail_url)
+        self.assertEqual(len(self.client.get(self.list_url).data['results']), 1)
+
+    def test_bulk_actions_invalidate_cached_list(self):
+
+        bulk_url = reverse('bulk-actions-audio-files', kwargs={'audiofiletype': SONG})
+        self.client.get(self.list_url)
+        self.client.patch(bulk_url, data={'ids': [self.song.pk], 'audiofilemetadata': {'name': 'Bulk'}})
+        self.assertEqual(self.client.get(self.list_url).data['results'][0]['name'], 'Bulk')
+        self.client.delete(bulk_url, data={'ids': [self.song.pk]})
+        self.assertEqual(self.client.get(self.list_url).data['results'], [])
+
+    def test_writes_outside_the_api_invalidate_through_signals(self):
+
+        self.client.get(self.detail_url)
+        self.song.name = 'Saved Elsewhere'
+        self.song.save()
+        self.assertEqual(self.client.get(self.detail_url).data['name'], 'Saved Elsewhere')
+
+    def test_lookups_are_counted_in_metrics(self):
+
+        hits, misses = response_cache.hits, response_cache.misses
+        self.client.get(self.detail_url)
+        self.client.get(self.detail_url)
+        content = self.client.get('/metrics').content.decode()
+        self.assertIn(f'audiofile_response_cache_lookups_total{{result="hit"}} {hits + 1}', content)
+        self.assertIn(f'audiofile_response_cache_lookups_total{{result="miss"}} {misses + 1}', content)
+
+    def test_responses_cached_before_a_write_commits_are_dropped(self):
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.song.name = 'Changed'
+            self.song.save()
+            # Stands for a concurrent request caching what it read before the commit
+            self.client.get(self.detail_url)
+            version = response_cache.get_version(SONG)
+        self.assertNotEqual(response_cache.get_version(SONG), version)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.detail_url)
+        self.assertGreater(len(queries), 0)
+
+    def test_evicted_version_does_not_resurrect_stale_responses(self):
+
+        self.client.get(self.detail_url)
+        response_cache.cache.delete(response_cache.get_version_key(SONG))
+        Song.objects.filter(pk=self.song.pk).update(name='Changed')
+        response_cache.invalidate(SONG)
+        self.assertEqual(self.client.get(self.detail_url).data['name'], 'Changed')
+
+    def test_other_audio_types_stay_cached(self):
+
+        podcast_url = reverse(
+            'common-actions-audio-file',
+            kwargs={'audiofiletype': PODCAST, 'audiofileid': self.podcast.pk}
+        )
+        self.client.get(podcast_url)
+        self.client.patch(self.detail_url, data={'name': 'Changed'})
+        with self.assertNumQueries(0):
+            self.client.get(podcast_url)
+
+
+class StandInRedisCache(BaseCache):
+    """
+    Local stand-in for a Redis cache backend
+
+    Entries live outside of the cache instances as they would on a Redis server, values are stored as pickled bytes
+    and `incr` updates the stored counter in place, failing on missing keys.
+    """
+
+    entries = {}
+    lock = threading.Lock()
+
+    def __init__(self, location, params):
+
+        super().__init__(params)
+
+    def get_entry(self, key):
+        """Pickled value of a key that has not expired, the lock is held by the caller"""
+
+        value, expiry = self.entries.get(key, (None, None))
+        if expiry is not None and expiry <= time.time():
+            del self.entries[key]
+            return None
+        return value
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+
+        key = self.make_key(key, version)
+        with self.lock:
+            if self.get_entry(key) is not None:
+                return False
+            self.entries[key] = (pickle.dumps(value), self.get_backend_timeout(timeout))
+            return True
+
+    def get(self, key, default=None, version=None):
+
+        with self.lock:
+            value = self.get_entry(self.make_key(key, version))
+        return default if value is None else pickle.loads(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+
+        with self.lock:
+            self.entries[self.make_key(key, version)] = (pickle.dumps(value), self.get_backend_timeout(timeout))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+
+        key = self.make_key(key, version)
+        with self.lock:
+            value = self.get_entry(key)
+            if value is None:
+                return False
+            self.entries[key] = (value, self.get_backend_timeout(timeout))
+            return True
+
+    def incr(self, key, delta=1, version=None):
+
+        key = self.make_key(key, version)
+        with self.lock:
+            value = self.get_entry(key)
+            if value is None:
+                raise ValueError(f'Key {key!r} not found')
+            value = pickle.loads(value) + delta
+            self.entries[key] = (pickle.dumps(value), self.entries[key][1])
+        return value
+
+    def delete(self, key, version=None):
+
+        with self.lock:
+            return self.entries.pop(self.make_key(key, version), None) is not None
+
+    def clear(self):
+
+        with self.lock:
+            self.entries.clear()
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'core.tests.StandInRedisCache'}})
+class AudioFileResponseCacheStandInRedisTests(AudioFileResponseCacheTests):
+    """The response cache tests against a local stand-in for a Redis backend"""
+
+    def test_responses_are_stored_in_the_stand_in(self):
+
+        self.client.get(self.detail_url)
+        self.assertIsInstance(response_cache.cache, StandInRedisCache)
+        self.assertGreater(len(StandInRedisCache.entries), 1)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class AudioFileConditionalRequestTests(APITestCase):
+
+    def setUp(self):
+
+        self.song, self.podcast, self.audiobook = create_audiofile_objects()
+        self.detail_url = reverse(
+            'common-actions-audio-file',
+            kwargs={'audiofiletype': SONG, 'audiofileid': self.song.pk}
+        )
+        self.list_url = reverse('list-audio-files', kwargs={'audiofiletype': SONG})
+
+    def test_retrieve_sets_validators(self):
+
+        response = self.client.get(self.detail_url)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertEqual(response['Last-Modified'], http_date(self.song.last_modified.timestamp()))
+
+    def test_retrieve_not_modified_without_serializing(self):
+
+        etag = self.client.get(self.detail_url)['ETag']
+        with mock.patch.object(SongSerializer, 'to_representation') as to_representation:
+            with self.assertNumQueries(1):
+                response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        to_representation.assert_not_called()
+
+    def test_retrieve_if_modified_since(self):
+
+        last_modified = self.client.get(self.detail_url)['Last-Modified']
+        response = self.client.get(self.detail_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(self.detail_url, HTTP_IF_MODIFIED_SINCE=http_date(0))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_retrieve_after_change_returns_new_payload(self):
+
+        etag = self.client.get(self.detail_url)['ETag']
+        self.client.patch(self.detail_url, data={'name': 'Changed'})
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'Changed')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_not_modified(self):
+
+        etag = self.client.get(self.list_url)['ETag']
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_validator_changes_on_create_and_delete(self):
+
+        etag = self.client.get(self.list_url)['ETag']
+        Song.objects.create(name='New', duration=10)
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        etag = response['ETag']
+        Song.objects.filter(name='New').delete()
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_list_validator_depends_on_query_params(self):
+
+        etag = self.client.get(self.list_url)['ETag']
+        response = self.client.get(self.list_url, {'page_size': 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_update_with_matching_if_match(self):
+
+        etag = self.client.get(self.detail_url)['ETag']
+        response = self.client.patch(self.detail_url, data={'name': 'Changed'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.detail_url)['ETag'], response['ETag'])
+
+    def test_update_with_stale_if_match(self):
+
+        etag = self.client.get(self.detail_url)['ETag']
+        self.client.patch(self.detail_url, data={'name': 'Changed'})
+        response = self.client.put(
+            self.detail_url,
+            data={'name': 'Lost Update', 'duration': 10},
+            HTTP_IF_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(Song.objects.get().name, 'Changed')
+
+    def test_bulk_update_touches_last_modified(self):
+
+        etag = self.client.get(self.detail_url)['ETag']
+        bulk_url = reverse('bulk-actions-audio-files', kwargs={'audiofiletype': SONG})
+        self.client.patch(bulk_url, data={'ids': [self.song.pk], 'audiofilemetadata': {'duration': 1}})
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class AudioFileFastSerializationTests(APITestCase):
+
+    def setUp(self):
+
+        self.song, self.podcast, self.audiobook = create_audiofile_objects()
+        Podcast.objects.create(name='Nobody On It', duration=1, host='Someone', participants=[])
+        AudioBook.objects.create(name='Ünïcödé \u2028 Book', duration=2, narrator='N', author='A')
+        Song.objects.create(name='Another Song', duration=120)
+
+    def test_field_plan_matches_serializer(self):
+
+        for model, serializer_class in ((Song, SongSerializer), (Podcast, PodcastSerializer),
+                                        (AudioBook, AudioBookSerializer)):
+            plan = get_field_plan(serializer_class)
+            self.assertIsNotNone(plan)
+            queryset = model.objects.order_by('pk')
+            self.assertEqual(
+                plan.to_representations(queryset.values(*plan.sources)),
+                serializer_class(queryset, many=True).data
+            )
+
+    def test_field_plan_uses_current_timezone(self):
+
+        plan = get_field_plan(SongSerializer)
+        with timezone.override('Asia/Kolkata'):
+            self.assertEqual(
+                plan.to_representation(Song.objects.values(*plan.sources).get(pk=self.song.pk)),
+                SongSerializer(self.song).data
+            )
+
+    def test_fast_renderer_output_matches_json_renderer(self):
+
+        for model, serializer_class in ((Song, SongSerializer), (Podcast, PodcastSerializer),
+                                        (AudioBook, AudioBookSerializer)):
+            data = serializer_class(model.objects.order_by('pk'), many=True).data
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_list_is_the_same_without_fast_path(self):
+
+        for audiofiletype in (SONG, PODCAST, AUDIOBOOK):
+            url = reverse('list-audio-files', kwargs={'audiofiletype': audiofiletype})
+            with override_settings(AUDIOFILE_FAST_SERIALIZATION=True):
+                fast_response = self.client.get(url, {'page_size': 1})
+                fast_next = self.client.get(fast_response.data['next'])
+            with override_settings(AUDIOFILE_FAST_SERIALIZATION=False):
+                response = self.client.get(url, {'page_size': 1})
+                next_response = self.client.get(response.data['next'])
+            self.assertEqual(fast_response.content, response.content)
+            self.assertEqual(fast_next.content, next_response.content)
+
+    def test_export_is_the_same_without_fast_path(self):
+
+        url = reverse('export-audio-files', kwargs={'audiofiletype': PODCAST})
+        with override_settings(AUDIOFILE_FAST_SERIALIZATION=True):
+            fast_content = b''.join(self.client.get(url).streaming_content)
+        with override_settings(AUDIOFILE_FAST_SERIALIZATION=False):
+            content = b''.join(self.client.get(url).streaming_content)
+        self.assertEqual(fast_content, content)
+
+
+@override_settings(AUDIOFILE_ASYNC_DB_THREADS=0)
+class AudioFileAsyncViewTests(APITestCase):
+
+    def setUp(self):
+
+        self.song, self.podcast, self.audiobook = create_audiofile_objects()
+        self.factory = APIRequestFactory()
+        self.detail_view = AsyncAudioFileViewSet.as_view(
+            actions={'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+        )
+        self.detail_url = reverse('common-actions-audio-file', kwargs={'audiofiletype': SONG, 'audiofileid': 1})
+
+    def call(self, view, request, **kwargs):
+
+        response = async_to_sync(view)(request, **kwargs)
+        response.render()
+        return response
+
+    def test_views_are_coroutines(self):
+
+        self.assertTrue(asyncio.iscoroutinefunction(AsyncAudioFileCreateAPIView.as_view()))
+        self.assertTrue(asyncio.iscoroutinefunction(self.detail_view))
+
+    def test_retrieve_matches_sync_view(self):
+
+        url = reverse('common-actions-audio-file', kwargs={'audiofiletype': PODCAST, 'audiofileid': self.podcast.pk})
+        response = self.call(
+            self.detail_view,
+            self.factory.get(url),
+            audiofiletype=PODCAST,
+            audiofileid=self.podcast.pk
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, self.client.get(url).content)
+
+    def test_list_matches_sync_view(self):
+
+        url = reverse('list-audio-files', kwargs={'audiofiletype': SONG})
+        response = self.call(
+            AsyncAudioFileViewSet.as_view(actions={'get': 'list'}),
+            self.factory.get(url),
+            audiofiletype=SONG
+        )
+        self.assertEqual(response.content, self.client.get(url).content)
+
+    def test_create(self):
+
+        view = AsyncAudioFileCreateAPIView.as_view()
+        data = {'audiofiletype': SONG, 'audiofilemetadata': {'name': 'Async Song', 'duration': 10}}
+        response = self.call(view, self.factory.post(reverse('create-audio-file'), data, format='json'))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Song.objects.filter(name='Async Song').exists())
+
+        response = self.call(view, self.factory.post(reverse('create-audio-file'), {}, format='json'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'audiofiletype': ['This field is required.']})
+
+    def test_update_and_delete(self):
+
+        kwargs = {'audiofiletype': SONG, 'audiofileid': self.song.pk}
+        request = self.factory.patch(self.detail_url, {'name': 'Renamed'}, format='json')
+        response = self.call(self.detail_view, request, **kwargs)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Song.objects.get(pk=self.song.pk).name, 'Renamed')
+
+        response = self.call(self.detail_view, self.factory.delete(self.detail_url), **kwargs)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Song.objects.filter(pk=self.song.pk).exists())
+
+    def test_missing_audiofile(self):
+
+        response = self.call(
+            self.detail_view,
+            self.factory.get(self.detail_url),
+            audiofiletype=SONG,
+            audiofileid=self.song.pk + 1000
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(AUDIOFILE_ASYNC_DB_THREADS=2)
+    def test_database_calls_run_in_the_pool(self):
+
+        thread = async_to_sync(database_sync_to_async(threading.current_thread))()
+        self.assertTrue(thread.name.startswith('audiofile-db'))
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def make_connection(self):
+
+        fake_connection = mock.Mock(closed=False, autocommit=True)
+        fake_connection.info.transaction_status = 0
+        return fake_connection
+
+    def make_pool(self, **options):
+
+        return ConnectionPool(self.make_connection, **options)
+
+    def test_connections_are_reused(self):
+
+        pool = self.make_pool()
+        first = pool.getconn()
+        pool.putconn(first)
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(pool.stats()['opened'], 1)
+        self.assertEqual(pool.stats()['checkouts'], 2)
+
+    def test_min_size_is_opened_upfront(self):
+
+        pool = self.make_pool(min_size=3)
+        self.assertEqual(pool.stats()['idle'], 3)
+
+    def test_wait_times_out_when_all_connections_are_in_use(self):
+
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        pool.getconn()
+        with self.assertRaises(psycopg2.OperationalError):
+            pool.getconn()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+        self.assertGreater(pool.stats()['wait_seconds'], 0)
+
+    def test_waiting_caller_gets_a_handed_back_connection(self):
+
+        pool = self.make_pool(max_size=1, timeout=5)
+        first = pool.getconn()
+        timer = threading.Timer(0.05, pool.putconn, args=[first])
+        timer.start()
+        self.assertIs(pool.getconn(), first)
+        timer.join()
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_open_transaction_is_rolled_back(self):
+
+        pool = self.make_pool()
+        fake_connection = pool.getconn()
+        fake_connection.info.transaction_status = 2
+        pool.putconn(fake_connection)
+        fake_connection.rollback.assert_called_once_with()
+        self.assertEqual(pool.stats()['idle'], 1)
+
+    def test_broken_and_expired_connections_are_discarded(self):
+
+        pool = self.make_pool(max_lifetime=0)
+        first = pool.getconn()
+        pool.putconn(first)
+        self.assertIsNot(pool.getconn(), first)
+
+        pool = self.make_pool()
+        first = pool.getconn()
+        first.closed = True
+        pool.putconn(first)
+        self.assertEqual(pool.stats()['discarded'], 1)
+
+    def test_stale_idle_connection_is_health_checked(self):
+
+        pool = self.make_pool(health_check_interval=0)
+        first = pool.getconn()
+        pool.putconn(first)
+        first.cursor.side_effect = Exception('server closed the connection unexpectedly')
+        self.assertIsNot(pool.getconn(), first)
+        self.assertEqual(pool.stats()['discarded'], 1)
+
+    def test_health_checks_do_not_hold_up_other_callers(self):
+
+        pool = self.make_pool(max_size=2, health_check_interval=0)
+        stale = pool.getconn()
+        pool.putconn(stale)
+        checking, resume = threading.Event(), threading.Event()
+
+        def hung_health_check(*args):
+            checking.set()
+            resume.wait(5)
+
+        stale.cursor.return_value = mock.MagicMock()
+        stale.cursor.return_value.__enter__.return_value.execute.side_effect = hung_health_check
+        checker = threading.Thread(target=pool.getconn)
+        checker.start()
+        self.assertTrue(checking.wait(5))
+        # Opening another connection does not wait for the health check
+        self.assertIsNot(pool.getconn(), stale)
+        self.assertEqual(pool.stats()['in_use'], 1)
+        resume.set()
+        checker.join(5)
+        self.assertEqual(pool.stats()['in_use'], 2)
+
+    def test_discarded_connections_are_replaced_up_to_min_size(self):
+
+        pool = self.make_pool(min_size=2)
+        first = pool.getconn()
+        pool.putconn(first, discard=True)
+        pool.refill_thread.join(5)
+        self.assertEqual((pool.stats()['idle'], pool.stats()['opened'], pool.stats()['discarded']), (2, 3, 1))
+
+
+class PooledDatabaseBackendTests(SimpleTestCase):
+
+    databases = {'default'}
+
+    def test_closed_connection_goes_back_to_the_pool(self):
+
+        connection.close()
+        connection.ensure_connection()
+        raw_connection = connection.connection
+        connection.close()
+        self.assertFalse(raw_connection.closed)
+        connection.ensure_connection()
+        self.assertIs(connection.connection, raw_connection)
+        self.assertIsNotNone(connection.connection_pool)
+
+    def test_pool_stats_are_served_with_the_metrics(self):
+
+        connection.ensure_connection()
+        content = metrics.registry.render()
+        self.assertIn('# TYPE audiofile_db_pool_waits_total counter', content)
+        self.assertRegex(content, r'audiofile_db_pool_connections\{database="[^"]+",state="in_use"\} [1-9]')
+
+
+class TemporaryStorageMixin:
+    """Store media in a temporary directory, `media_dir`, along with the `storage_settings` overrides"""
+
+    storage_settings = {}
+
+    def setUp(self):
+
+        super().setUp()
+        media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(media_dir.cleanup)
+        self.media_dir = media_dir.name
+        settings_override = override_settings(
+            AUDIOFILE_STORAGE={
+                'BACKEND': 'core.storage.FileSystemAudioStorage',
+                'OPTIONS': {'location': self.media_dir},
+            },
+            **self.storage_settings
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class AudioFileUploadTests(TemporaryStorageMixin, APITestCase):
+
+    storage_settings = {'AUDIOFILE_UPLOAD_CHUNK_SIZE': 100, 'AUDIOFILE_MAX_UPLOAD_SIZE': 10000}
+
+    def setUp(self):
+
+        super().setUp()
+        self.song = Song.objects.create(name='Rolex', duration=240)
+        self.url = reverse('upload-audio-file', kwargs={'audiofiletype': SONG, 'audiofileid': self.song.pk})
+        self.content = bytes(range(256)) * 10
+
+    def start_upload(self, body=b'', size=None, content_type='audio/mpeg'):
+
+        return self.client.post(
+            self.url,
+            data=body,
+            content_type=content_type,
+            HTTP_UPLOAD_LENGTH=str(len(self.content) if size is None else size)
+        )
+
+    def read_media(self, audiofile):
+
+        with open(f'{self.media_dir}/{audiofile.file}', 'rb') as file:
+            return file.read()
+
+    def test_upload_in_a_single_request(self):
+
+        response = self.start_upload(self.content)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.song.refresh_from_db()
+        self.assertEqual(self.read_media(self.song), self.content)
+        self.assertEqual(self.song.file_size, len(self.content))
+        self.assertEqual(self.song.content_type, 'audio/mpeg')
+        self.assertEqual(self.song.checksum, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(response.data['audiofile'], SongSerializer(self.song).data)
+        self.assertFalse(AudioUpload.objects.exists())
+
+    def test_resumable_upload(self):
+
+        response = self.start_upload(self.content[:1000])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['offset'], 1000)
+        upload_url = response['Location']
+
+        response = self.client.patch(
+            upload_url,
+            data=self.content[1000:],
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET='500'
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response['Upload-Offset'], '1000')
+
+        self.assertEqual(self.client.get(upload_url)['Upload-Offset'], '1000')
+        response = self.client.patch(
+            upload_url,
+            data=self.content[1000:],
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET='1000'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.song.refresh_from_db()
+        self.assertEqual(self.read_media(self.song), self.content)
+        self.assertEqual(self.song.checksum, hashlib.sha256(self.content).hexdigest())
+
+    def test_interrupted_upload_keeps_received_bytes(self):
+
+        upload_url = self.start_upload()['Location']
+        upload = AudioUpload.objects.get()
+
+        class DroppedStream(io.BytesIO):
+
+            def read(self, size=-1):
+                if self.tell() >= 700:
+                    raise UnreadablePostError('connection reset')
+                return super().read(size)
+
+        self.assertTrue(uploads.append(upload, DroppedStream(self.content)))
+        self.assertEqual(AudioUpload.objects.get().offset, 700)
+
+        # Resuming on another process rebuilds the checksum from the stored bytes
+        uploads.hashers.discard(upload)
+        self.client.patch(
+            upload_url,
+            data=self.content[700:],
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET='700'
+        )
+        self.song.refresh_from_db()
+        self.assertEqual(self.read_media(self.song), self.content)
+        self.assertEqual(self.song.checksum, hashlib.sha256(self.content).hexdigest())
+
+    def test_body_past_the_declared_size_is_ignored(self):
+
+        self.start_upload(self.content + b'extra')
+        self.song.refresh_from_db()
+        self.assertEqual(self.read_media(self.song), self.content)
+
+    def test_invalid_upload(self):
+
+        response = self.start_upload(content_type='text/plain')
+        self.assertEqual(response.data, {'content_type': ['Only audio content types are accepted.']})
+        response = self.start_upload(size=10001)
+        self.assertEqual(response.data, {'size': ['Ensure this value is less than or equal to 10000.']})
+        response = self.client.post(self.url, data=b'', content_type='audio/mpeg')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(AudioUpload.objects.exists())
+
+        url = reverse('upload-audio-file', kwargs={'audiofiletype': SONG, 'audiofileid': self.song.pk + 1})
+        self.assertEqual(self.client.post(url, HTTP_UPLOAD_LENGTH='10').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_abort_upload(self):
+
+        upload_url = self.start_upload(self.content[:10])['Location']
+        self.assertEqual(self.client.delete(upload_url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(AudioUpload.objects.exists())
+        self.assertEqual(self.client.get(upload_url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_new_upload_replaces_previous_media(self):
+
+        self.start_upload(self.content)
+        self.song.refresh_from_db()
+        previous_name = self.song.file
+        with self.captureOnCommitCallbacks(execute=True):
+            self.start_upload(self.content[::-1])
+        self.song.refresh_from_db()
+        self.assertNotEqual(self.song.file, previous_name)
+        self.assertEqual(self.read_media(self.song), self.content[::-1])
+        self.assertFalse(os.path.exists(f'{self.media_dir}/{previous_name}'))
+
+    def test_deleting_audiofiles_drops_their_unfinished_uploads(self):
+
+        self.start_upload(self.content[:10])
+        other = Song.objects.create(name='Other', duration=10)
+        self.url = reverse('upload-audio-file', kwargs={'audiofiletype': SONG, 'audiofileid': other.pk})
+        self.start_upload(self.content[:10])
+        names = [upload.storage_name for upload in AudioUpload.objects.all()]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('common-actions-audio-file', kwargs={'audiofiletype': SONG,
+                                                                            'audiofileid': self.song.pk}))
+        self.assertEqual(AudioUpload.objects.get().audiofileid, other.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(
+                reverse('bulk-actions-audio-files', kwargs={'audiofiletype': SONG}),
+                data={'ids': [other.pk]}
+            )
+        self.assertEqual(response.data, {'deleted': 1})
+        self.assertFalse(AudioUpload.objects.exists())
+        for name in names:
+            self.assertFalse(os.path.exists(f'{self.media_dir}/{name}'))
+
+    def test_deleting_audiofile_deletes_media(self):
+
+        self.start_upload(self.content)
+        self.song.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('common-actions-audio-file', kwargs={'audiofiletype': SONG,
+                                                                            'audiofileid': self.song.pk}))
+        self.assertFalse(os.path.exists(f'{self.media_dir}/{self.song.file}'))
+
+
+class AudioFileConcurrentUploadTests(TemporaryStorageMixin, TransactionTestCase):
+
+    storage_settings = {'AUDIOFILE_UPLOAD_CHUNK_SIZE': 100}
+
+    def setUp(self):
+
+        super().setUp()
+        self.song = Song.objects.create(name='Rolex', duration=240)
+
+    def test_overlapping_appends_at_the_same_offset(self):
+
+        upload = AudioUpload.objects.create(
+            audiofiletype=SONG, audiofileid=self.song.pk, size=2000, content_type='audio/mpeg'
+        )
+        first_read, resume_first = threading.Event(), threading.Event()
+        results = {}
+
+        class SlowStream(io.BytesIO):
+
+            def read(self, size=-1):
+                first_read.set()
+                resume_first.wait(5)
+                return super().read(size)
+
+        def append(name, stream):
+            try:
+                results[name] = uploads.append(AudioUpload.objects.get(pk=upload.pk), stream)
+            finally:
+                connection.close()
+
+        first = threading.Thread(target=append, args=('first', SlowStream(b'a' * 1000)))
+        first.start()
+        self.assertTrue(first_read.wait(5))
+        second = threading.Thread(target=append, args=('second', io.BytesIO(b'b' * 1000)))
+        second.start()
+        # The second request waits for the first one to be done with the upload
+        second.join(0.5)
+        self.assertTrue(second.is_alive())
+        resume_first.set()
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual(results, {'first': True, 'second': False})
+        upload.refresh_from_db()
+        self.assertEqual(upload.offset, 1000)
+        with open(f'{self.media_dir}/{upload.storage_name}', 'rb') as file:
+            self.assertEqual(file.read(), b'a' * 1000)
+
+
+class AudioFileStreamTests(TemporaryStorageMixin, APITestCase):
+
+    def setUp(self):
+
+        super().setUp()
+        self.content = bytes(range(256)) * 40
+        self.song = Song.objects.create(name='Rolex', duration=240)
+        self.client.post(
+            reverse('upload-audio-file', kwargs={'audiofiletype': SONG, 'audiofileid': self.song.pk}),
+            data=self.content,
+            content_type='audio/wav',
+            HTTP_UPLOAD_LENGTH=str(len(self.content))
+        )
+        self.url = reverse('stream-audio-file', kwargs={'audiofiletype': SONG, 'audiofileid': self.song.pk})
+
+    def get(self, **headers):
+
+        response = self.client.get(self.url, HTTP_ACCEPT='audio/*', **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_file(self):
+
+        response, body = self.get()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['Content-Type'], 'audio/wav')
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(self.content).hexdigest()}"')
+
+    def test_single_range(self):
+
+        for range_header, start, end in (('bytes=100-199', 100, 199), ('bytes=10000-', 10000, 10239),
+                                         ('bytes=-40', 10200, 10239), ('bytes=10200-99999', 10200, 10239)):
+            response, body = self.get(HTTP_RANGE=range_header)
+            self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+            self.assertEqual(body, self.content[start:end + 1])
+            self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{len(self.content)}')
+            self.assertEqual(response['Content-Length'], str(end - start + 1))
+
+    def test_multiple_ranges(self):
+
+        response, body = self.get(HTTP_RANGE='bytes=0-9, 500-509')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        content_type, boundary = response['Content-Type'].split('; boundary=')
+        self.assertEqual(content_type, 'multipart/byteranges')
+        self.assertEqual(len(body), int(response['Content-Length']))
+        parts = body.split(f'--{boundary}'.encode())[1:-1]
+        self.assertEqual(len(parts), 2)
+        headers, _, data = parts[1].partition(b'\r\n\r\n')
+        self.assertIn(f'Content-Range: bytes 500-509/{len(self.content)}'.encode(), headers)
+        self.assertEqual(data, self.content[500:510] + b'\r\n')
+
+    def test_unsatisfiable_and_ignored_ranges(self):
+
+        response, _ = self.get(HTTP_RANGE='bytes=20000-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+        for range_header in ('bytes=abc', 'items=0-1', 'bytes=9-1'):
+            response, body = self.get(HTTP_RANGE=range_header)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(body, self.content)
+
+    def test_if_range(self):
+
+        response, _ = self.get()
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        for if_range in (etag, last_modified):
+            response, body = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=if_range)
+            self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        for if_range in ('"stale"', 'Wed, 21 Oct 2015 07:28:00 GMT'):
+            response, body = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=if_range)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(body, self.content)
+
+    def test_conditional_get(self):
+
+        response, _ = self.get()
+        response, _ = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_range_file_exposes_fileno_at_range_start(self):
+
+        with tempfile.TemporaryFile() as file:
+            file.write(self.content)
+            file_range = ranges.FileRange(file, 100, 10)
+            self.assertEqual(os.lseek(file_range.fileno(), 0, os.SEEK_CUR), 100)
+            self.assertEqual(file_range.read(), self.content[100:110])
+            self.assertEqual(file_range.read(), b'')
+
+    def test_missing_media(self):
+
+        song = Song.objects.create(name='Silent', duration=1)
+        url = reverse('stream-audio-file', kwargs={'audiofiletype': SONG, 'audiofileid': song.pk})
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT='audio/*').status_code, status.HTTP_404_NOT_FOUND)
+
+
+def make_wav(seconds=2, sample_rate=8000, channels=1):
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(b'\x00\x00' * channels * sample_rate * seconds)
+    return buffer.getvalue()
+
+
+def make_pcm_wav(samples, sample_width=2, channels=1, sample_rate=8000):
+    """WAV file of interleaved integer samples"""
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(sample_width)
+        wav.setframerate(sample_rate)
+        if sample_width == 1:
+            wav.writeframes(bytes(sample + 128 for sample in samples))
+        else:
+            wav.writeframes(b''.join(sample.to_bytes(sample_width, 'little', signed=True) for sample in samples))
+    return buffer.getvalue()
+
+
+def make_flac(total_samples=441000, sample_rate=44100, channels=2):
+
+    streaminfo = struct.pack('>HH', 4096, 4096) + b'\x00' * 6
+    streaminfo += ((sample_rate << 44) | ((channels - 1) << 41) | (15 << 36) | total_samples).to_bytes(8, 'big')
+    streaminfo += b'\x00' * 16
+    return b'fLaC' + bytes([0x80]) + len(streaminfo).to_bytes(3, 'big') + streaminfo + b'\x00' * 1000
+
+
+def make_ogg_page(packet, granule_position, header_type=0):
+
+    return (
+        b'OggS' + bytes([0, header_type]) + struct.pack('<qIII', granule_position, 1, 0, 0)
+        + bytes([1, len(packet)]) + packet
+    )
+
+
+def make_mp3_frames(count, header=b'\xff\xfb\x90\x00', first_frame_payload=b''):
+    """MPEG 1 layer III frames at 128 kbps and 44.1 kHz, 417 bytes long"""
+
+    first_frame = header + first_frame_payload
+    frames = first_frame + b'\x00' * (417 - len(first_frame))
+    return frames + (header + b'\x00' * 413) * (count - 1)
+
+
+class AudioProbingTests(TemporaryStorageMixin, APITestCase):
+
+    def test_wav(self):
+
+        info = probing.probe_bytes(make_wav(seconds=2, sample_rate=8000, channels=2))
+        self.assertEqual(info, probing.AudioInfo('wav', 2.0, 256000, 8000, 2))
+
+    def test_flac(self):
+
+        info = probing.probe_bytes(make_flac(total_samples=441000, sample_rate=44100, channels=2))
+        self.assertEqual((info.format, info.duration, info.sample_rate, info.channels), ('flac', 10.0, 44100, 2))
+
+    def test_ogg_vorbis_and_opus(self):
+
+        identification = b'\x01vorbis' + struct.pack('<IBIiIiB', 0, 2, 44100, 0, 128000, 0, 0xb8) + b'\x01'
+        data = make_ogg_page(identification, 0, header_type=2) + make_ogg_page(b'\x00' * 100, 441000, 4)
+        self.assertEqual(probing.probe_bytes(data), probing.AudioInfo('ogg', 10.0, 128000, 44100, 2))
+
+        head = b'OpusHead' + struct.pack('<BBHIhB', 1, 1, 312, 48000, 0, 0)
+        data = make_ogg_page(head, 0, header_type=2) + make_ogg_page(b'\x00' * 100, 96312, 4)
+        info = probing.probe_bytes(data)
+        self.assertEqual((info.format, info.duration, info.sample_rate, info.channels), ('ogg', 2.0, 48000, 1))
+
+    def test_mp3_cbr(self):
+
+        id3_tag = b'ID3\x03\x00\x00' + bytes([0, 0, 0, 20]) + b'\x00' * 20
+        data = id3_tag + make_mp3_frames(100)
+        info = probing.probe_bytes(data)
+        self.assertEqual(info.format, 'mp3')
+        self.assertAlmostEqual(info.duration, 41700 * 8 / 128000)
+        self.assertEqual((info.bitrate, info.sample_rate, info.channels), (128000, 44100, 2))
+
+    def test_mp3_vbr(self):
+
+        xing = b'\x00' * 32 + b'Xing' + struct.pack('>II', 1, 1000)
+        info = probing.probe_bytes(make_mp3_frames(10, first_frame_payload=xing))
+        self.assertAlmostEqual(info.duration, 1000 * 1152 / 44100)
+
+    def test_unsupported_or_damaged_file(self):
+
+        with tempfile.TemporaryFile() as file:
+            file.write(b'not audio at all' * 10)
+            with self.assertRaises(probing.ProbeError):
+                probing.probe_file(file)
+        with tempfile.TemporaryFile() as file:
+            file.write(make_wav()[:30])
+            with self.assertRaises(probing.ProbeError):
+                probing.probe_file(file)
+        with tempfile.TemporaryFile() as file:
+            with self.assertRaises(probing.ProbeError):
+                probing.probe_file(file)
+
+    def test_upload_records_probed_properties(self):
+
+        song = Song.objects.create(name='Untrusted', duration=9999)
+        content = make_wav(seconds=3, sample_rate=8000, channels=1)
+        self.client.post(
+            reverse('upload-audio-file', kwargs={'audiofiletype': SONG, 'audiofileid': song.pk}),
+            data=content,
+            content_type='audio/wav',
+            HTTP_UPLOAD_LENGTH=str(len(content))
+        )
+        song.refresh_from_db()
+        self.assertEqual((song.duration, song.sample_rate), (9999, None))
+        jobs.Worker().run(once=True)
+        song.refresh_from_db()
+        self.assertEqual((song.duration, song.bitrate, song.sample_rate, song.channels), (3, 128000, 8000, 1))
+
+    def test_backfill_command(self):
+
+        for name, content in (('song.wav', make_wav(seconds=2)), ('book.flac', make_flac()), ('bad', b'bad')):
+            with open(os.path.join(self.media_dir, name), 'wb') as file:
+                file.write(content)
+        song = Song.objects.create(name='Song', duration=1, file='song.wav')
+        audiobook = AudioBook.objects.create(name='Book', duration=1, author='A', narrator='N', file='book.flac')
+        broken = Song.objects.create(name='Broken', duration=7, file='bad')
+        Song.objects.create(name='No Media', duration=5)
+
+        output = io.StringIO()
+        with self.assertLogs('core.management.commands.probe_audiofiles', 'WARNING') as logs:
+            call_command('probe_audiofiles', workers=2, batch_size=1, stdout=output)
+        self.assertEqual(logs.output, [
+            'WARNING:core.management.commands.probe_audiofiles:Could not probe bad: Unsupported audio format'
+        ])
+
+        song.refresh_from_db()
+        audiobook.refresh_from_db()
+        broken.refresh_from_db()
+        self.assertEqual((song.duration, song.sample_rate), (2, 8000))
+        self.assertEqual((audiobook.duration, audiobook.sample_rate, audiobook.channels), (10, 44100, 2))
+        self.assertEqual((broken.duration, broken.sample_rate), (7, None))
+        self.assertIn('song: 1 probed, 1 failed', output.getvalue())
+
+
+class AudioJobQueueTests(TemporaryStorageMixin, APITestCase):
+
+    def create_song(self, content, name='song.wav'):
+
+        with open(os.path.join(self.media_dir, name), 'wb') as file:
+            file.write(content)
+        return Song.objects.create(name='Song', duration=1, file=name)
+
+    def test_enqueue_reuses_queued_job(self):
+
+        song = self.create_song(make_wav())
+        job = jobs.enqueue(song, PROBE_JOB)
+        self.assertEqual(jobs.enqueue(song, PROBE_JOB), job)
+        AudioJob.objects.filter(pk=job.pk).update(status=AudioJob.RUNNING)
+        self.assertNotEqual(jobs.enqueue(song, PROBE_JOB), job)
+
+    def test_claim_skips_locked_rows_and_leases_jobs(self):
+
+        song = self.create_song(make_wav())
+        job = jobs.enqueue(song, PROBE_JOB)
+        later = jobs.enqueue(Song.objects.create(name='Later', duration=1), PROBE_JOB)
+        AudioJob.objects.filter(pk=later.pk).update(run_after=timezone.now() + timezone.timedelta(hours=1))
+
+        worker = jobs.Worker()
+        with CaptureQueriesContext(connection) as queries:
+            claimed = worker.claim(10)
+        self.assertEqual(claimed, [job])
+        self.assertTrue(any('FOR UPDATE SKIP LOCKED' in query['sql'] for query in queries.captured_queries))
+        job.refresh_from_db()
+        self.assertEqual(job.status, AudioJob.RUNNING)
+        self.assertGreater(job.locked_until, timezone.now())
+        self.assertEqual(worker.claim(10), [])
+
+        # The lease of a worker that died runs out and the job is claimed again, counting the attempt that died
+        AudioJob.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timezone.timedelta(seconds=1))
+        stale_job = claimed[0]
+        reclaimed = worker.claim(10)
+        self.assertEqual(reclaimed, [job])
+        job.refresh_from_db()
+        self.assertEqual((job.attempts, job.locked_until), (1, reclaimed[0].locked_until))
+
+        # The worker that lost the lease cannot record its outcome
+        with self.assertLogs('core.jobs', 'WARNING'):
+            worker.succeed(stale_job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, AudioJob.RUNNING)
+        worker.succeed(reclaimed[0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (AudioJob.SUCCEEDED, 2))
+
+    def test_jobs_killing_their_workers_fail_once_out_of_attempts(self):
+
+        job = jobs.enqueue(self.create_song(make_wav()), PROBE_JOB)
+        AudioJob.objects.filter(pk=job.pk).update(
+            status=AudioJob.RUNNING,
+            attempts=job.max_attempts - 1,
+            locked_until=timezone.now() - timezone.timedelta(seconds=1)
+        )
+
+        worker = jobs.Worker()
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.assertEqual(worker.claim(10), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_until), (AudioJob.FAILED, job.max_attempts, None))
+        self.assertIn('lease', job.last_error)
+        self.assertEqual(worker.metrics.snapshot()['failed'], 1)
+
+    def test_dead_worker_process_fails_its_jobs_and_is_replaced(self):
+
+        songs = [self.create_song(make_wav(seconds=seconds), name=f'{seconds}.wav') for seconds in (1, 2)]
+        broken_job, job = [jobs.enqueue(song, PROBE_JOB) for song in songs]
+
+        class InlineExecutor(futures.Executor):
+            """Runs submitted calls right away, its first one dying like a killed worker process"""
+
+            broken = True
+
+            def submit(self, fn, *args):
+                future = futures.Future()
+                if InlineExecutor.broken:
+                    InlineExecutor.broken = False
+                    future.set_exception(BrokenProcessPool('A process in the process pool was terminated abruptly'))
+                else:
+                    future.set_result(fn(*args))
+                return future
+
+        worker = jobs.Worker(processes=1, batch_size=1)
+        with mock.patch.object(worker, 'create_executor', side_effect=InlineExecutor) as create_executor:
+            with self.assertLogs('core.jobs', 'WARNING') as logs:
+                worker.run(max_jobs=2)
+        self.assertEqual(create_executor.call_count, 2)
+        self.assertIn('A worker process died', '\n'.join(logs.output))
+
+        broken_job.refresh_from_db()
+        job.refresh_from_db()
+        self.assertEqual((broken_job.status, broken_job.attempts), (AudioJob.QUEUED, 1))
+        self.assertIn('BrokenProcessPool', broken_job.last_error)
+        self.assertEqual(job.status, AudioJob.SUCCEEDED)
+
+    def test_run_records_result(self):
+
+        song = self.create_song(make_wav(seconds=2, sample_rate=8000))
+        job = jobs.enqueue(song, PROBE_JOB)
+        metrics = jobs.Worker().run(once=True)
+
+        song.refresh_from_db()
+        job.refresh_from_db()
+        self.assertEqual((song.duration, song.sample_rate), (2, 8000))
+        self.assertEqual((job.status, job.attempts, job.last_error), (AudioJob.SUCCEEDED, 1, ''))
+        self.assertIsNotNone(job.finished_time)
+        self.assertEqual((metrics['claimed'], metrics['succeeded'], metrics['failed']), (1, 1, 0))
+
+    def test_transient_error_is_retried_with_backoff(self):
+
+        song = Song.objects.create(name='Missing', duration=1, file='missing.wav')
+        job = jobs.enqueue(song, PROBE_JOB)
+        worker = jobs.Worker()
+
+        for attempt in range(1, job.max_attempts):
+            before = timezone.now()
+            with self.assertLogs('core.jobs', 'WARNING'):
+                worker.run(once=True)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (AudioJob.QUEUED, attempt))
+            self.assertIn('FileNotFoundError', job.last_error)
+            self.assertGreaterEqual(job.run_after, before + timezone.timedelta(seconds=10 * 2 ** (attempt - 1)))
+            AudioJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+
+        with self.assertLogs('core.jobs', 'ERROR'):
+            metrics = worker.run(once=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (AudioJob.FAILED, job.max_attempts))
+        self.assertEqual((metrics['retried'], metrics['failed']), (job.max_attempts - 1, 1))
+
+    def test_permanent_error_is_not_retried(self):
+
+        job = jobs.enqueue(self.create_song(b'not audio', name='bad'), PROBE_JOB)
+        with self.assertLogs('core.jobs', 'ERROR'):
+            jobs.Worker().run(once=True)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (AudioJob.FAILED, 1))
+        self.assertIn('ProbeError', job.last_error)
+
+    def test_jobs_of_deleted_audiofiles_are_dropped(self):
+
+        song = self.create_song(make_wav())
+        jobs.enqueue(song, PROBE_JOB)
+        other = self.create_song(make_wav(), name='other.wav')
+        other_job = jobs.enqueue(other, PROBE_JOB)
+        song.delete()
+        self.assertEqual(list(AudioJob.objects.all()), [other_job])
+        jobs.Worker().run(once=True)
+
+        other_job.refresh_from_db()
+        self.assertEqual(other_job.status, AudioJob.SUCCEEDED)
+
+    def test_jobs_endpoint(self):
+
+        song = self.create_song(make_wav())
+        job = jobs.enqueue(song, PROBE_JOB)
+
+        response = self.client.get(reverse('audio-file-jobs', kwargs={'audiofiletype': SONG, 'audiofileid': song.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(item['id'], item['status']) for item in response.data], [(job.pk, AudioJob.QUEUED)])
+
+        response = self.client.get(reverse('audio-file-jobs', kwargs={'audiofiletype': SONG, 'audiofileid': 0}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_command_runs_jobs_on_worker_processes(self):
+
+        songs = [self.create_song(make_wav(seconds=seconds), name=f'{seconds}.wav') for seconds in (1, 2, 3)]
+        for song in songs:
+            jobs.enqueue(song, PROBE_JOB)
+
+        output = io.StringIO()
+        call_command('run_audio_workers', processes=2, once=True, stats_interval=0, stdout=output)
+
+        self.assertEqual([song.duration for song in Song.objects.order_by('pk')], [1, 2, 3])
+        report = json.loads(output.getvalue())
+        self.assertEqual(report['succeeded'], 3)
+        self.assertEqual(report['queue'][AudioJob.SUCCEEDED], 3)
+
+
+class AudioPeaksTests(TemporaryStorageMixin, APITestCase):
+
+    def test_compute_peaks(self):
+
+        rng = random.Random(7)
+        samples = [rng.randint(-32768, 32767) for _ in range(2 * 100000)]
+        sample_rate, levels = peaks.compute_peaks(io.BytesIO(make_pcm_wav(samples, channels=2)), samples_per_peak=256)
+
+        self.assertEqual(sample_rate, 8000)
+        frames = [samples[index:index + 2] for index in range(0, len(samples), 2)]
+        expected = []
+        for start in range(0, len(frames), 256):
+            window = [sample for frame in frames[start:start + 256] for sample in frame]
+            expected += [min(window), max(window)]
+        self.assertEqual(levels[0].tolist(), expected)
+        # 391 peaks, the last one over the 160 remaining frames, halved while more than 64 peaks are left
+        self.assertEqual([len(level) // 2 for level in levels], [391, 196, 98])
+        self.assertEqual(levels[1][:4].tolist(), [min(expected[0], expected[2]), max(expected[1], expected[3]),
+                                                  min(expected[4], expected[6]), max(expected[5], expected[7])])
+
+    def test_sample_formats(self):
+
+        for sample_width, samples, expected in (
+            (1, [-128, 127, 0], [-32768, 32512]),
+            (2, [-32768, 32767, 0], [-32768, 32767]),
+            (3, [-8388608, 8388607, 0], [-32768, 32767]),
+            (4, [-2 ** 31, 2 ** 31 - 1, 0], [-32768, 32767]),
+        ):
+            with self.subTest(sample_width=sample_width):
+                content = make_pcm_wav(samples, sample_width=sample_width)
+                _, levels = peaks.compute_peaks(io.BytesIO(content))
+                self.assertEqual(levels[0].tolist(), expected)
+
+        content = make_wav(seconds=1)
+        fmt_offset = content.index(b'fmt ') + 8
+        float_wav = bytearray(content[:fmt_offset]) + struct.pack('<HHIIHH', 3, 1, 8000, 32000, 4, 32)
+        float_wav += b'data' + struct.pack('<I', 12) + struct.pack('<fff', -2.0, 0.5, 1.0)
+        _, levels = peaks.compute_peaks(io.BytesIO(bytes(float_wav)))
+        self.assertEqual(levels[0].tolist(), [-32767, 32767])
+
+    def test_unsupported_files(self):
+
+        for content in (make_flac(), b'not audio', make_wav(seconds=0)):
+            with self.assertRaises(peaks.PeaksError):
+                peaks.compute_peaks(io.BytesIO(content))
+
+    def test_read_level(self):
+
+        samples = list(range(-20000, 20000, 2))
+        _, levels = peaks.compute_peaks(io.BytesIO(make_pcm_wav(samples)), samples_per_peak=16)
+        file = io.BytesIO(b''.join(peaks.encode_peaks(8000, 16, levels)))
+
+        self.assertEqual(len(levels), 5)
+        for zoom, level in enumerate(reversed(levels)):
+            file.seek(0)
+            peaks_level = peaks.read_level(file, zoom)
+            self.assertEqual(peaks_level.data, level.tobytes())
+            self.assertEqual(peaks_level.samples_per_peak, 16 * 2 ** (len(levels) - 1 - zoom))
+        file.seek(0)
+        self.assertEqual(peaks.read_level(file, 99).data, levels[0].tobytes())
+        with self.assertRaises(peaks.PeaksError):
+            peaks.read_level(io.BytesIO(b'PEAK'), 0)
+
+    def test_upload_computes_peaks(self):
+
+        song = Song.objects.create(name='Song', duration=1)
+        content = make_pcm_wav([index % 1000 - 500 for index in range(200000)])
+        url = reverse('audio-file-peaks', kwargs={'audiofiletype': SONG, 'audiofileid': song.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('upload-audio-file', kwargs={'audiofiletype': SONG, 'audiofileid': song.pk}),
+                data=content,
+                content_type='audio/wav',
+                HTTP_UPLOAD_LENGTH=str(len(content))
+            )
+        self.assertEqual(AudioJob.objects.filter(kind=PEAKS_JOB, status=AudioJob.QUEUED).count(), 1)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+        jobs.Worker().run(once=True)
+        song.refresh_from_db()
+        self.assertTrue(os.path.exists(os.path.join(self.media_dir, song.peaks)))
+
+        response = self.client.get(url, HTTP_ACCEPT='*/*')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertEqual(response['X-Peaks-Samples-Per-Peak'], str(peaks.SAMPLES_PER_PEAK * 8))
+        self.assertEqual(response['X-Peaks-Levels'], '4')
+        self.assertEqual(len(response.content), 98 * peaks.PAIR_SIZE)
+        self.assertEqual(struct.unpack_from('<hh', response.content), (-500, 499))
+
+        response = self.client.get(url, {'zoom': 1, 'format': 'json'})
+        self.assertEqual(response.data['samples_per_peak'], peaks.SAMPLES_PER_PEAK * 4)
+        self.assertEqual(len(response.data['data']), 196 * 2)
+        self.assertEqual(response.data['data'][:2], [-500, 499])
+
+        response = self.client.get(url, {'zoom': 1, 'format': 'json'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(url, {'zoom': 'in'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('zoom', response.json())
+
+        peaks_path = os.path.join(self.media_dir, song.peaks)
+        with self.captureOnCommitCallbacks(execute=True):
+            song.delete()
+        self.assertFalse(os.path.exists(peaks_path))
+
+    def test_peaks_of_replaced_media_are_dropped(self):
+
+        song = Song.objects.create(name='Song', duration=1, file='old.wav')
+        with open(os.path.join(self.media_dir, 'old.wav'), 'wb') as file:
+            file.write(make_wav())
+        job = jobs.enqueue(song, PEAKS_JOB)
+        worker = jobs.Worker()
+        claimed = worker.claim(1)
+        future = worker.start(claimed[0], None)
+        Song.objects.filter(pk=song.pk).update(file='new.wav')
+        with self.captureOnCommitCallbacks(execute=True):
+            worker.complete(claimed[0], future)
+
+        song.refresh_from_db()
+        job.refresh_from_db()
+        self.assertEqual((song.peaks, job.status), ('', AudioJob.SUCCEEDED))
+        self.assertFalse(os.path.exists(os.path.join(self.media_dir, 'old.wav.peaks')))
+
+
+class AudioBlobTests(TemporaryStorageMixin, APITestCase):
+
+    def setUp(self):
+
+        super().setUp()
+        self.content = make_wav(seconds=3)
+        self.checksum = hashlib.sha256(self.content).hexdigest()
+
+    def upload(self, audiofile, content=None):
+
+        content = content or self.content
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse(
+                    'upload-audio-file',
+                    kwargs={'audiofiletype': audiofile.audiofiletype, 'audiofileid': audiofile.pk}
+                ),
+                data=content,
+                content_type='audio/wav',
+                HTTP_UPLOAD_LENGTH=str(len(content))
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        audiofile.refresh_from_db()
+
+    def stored_files(self):
+
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), self.media_dir)
+            for directory, _, names in os.walk(self.media_dir) for name in names
+        )
+
+    def test_identical_uploads_share_a_blob(self):
+
+        first = Song.objects.create(name='Song', duration=1)
+        second = Podcast.objects.create(name='Same Song', duration=1, host='Host')
+        self.upload(first)
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.Worker().run(once=True)
+        first.refresh_from_db()
+
+        self.upload(second)
+
+        blob = AudioBlob.objects.get()
+        self.assertEqual((blob.checksum, blob.name, blob.references), (self.checksum, blobs.get_name(self.checksum), 2))
+        self.assertEqual((first.file, second.file), (blob.name, blob.name))
+        # The duplicate took what was probed and computed from the first upload without queueing any job
+        self.assertEqual((second.duration, second.sample_rate, second.peaks), (3, 8000, first.peaks))
+        self.assertFalse(AudioJob.objects.filter(audiofiletype=PODCAST).exists())
+        self.assertEqual(self.stored_files(), [blob.name, first.peaks])
+
+    def test_jobs_of_duplicates_reuse_results(self):
+
+        songs = [Song.objects.create(name=f'Song {index}', duration=1) for index in range(3)]
+        for song in songs:
+            self.upload(song)
+        self.assertEqual(AudioJob.objects.count(), 6)
+
+        with mock.patch('core.probing.probe_file', wraps=probing.probe_file) as probe_file:
+            with self.captureOnCommitCallbacks(execute=True):
+                metrics = jobs.Worker(batch_size=1).run(once=True)
+
+        self.assertEqual(probe_file.call_count, 1)
+        self.assertEqual(metrics['succeeded'], 6)
+        blob = AudioBlob.objects.get()
+        self.assertEqual((blob.duration, blob.sample_rate, blob.references), (3.0, 8000, 3))
+        self.assertEqual(
+            list(Song.objects.values_list('duration', 'sample_rate', 'peaks').distinct()),
+            [(3, 8000, blob.peaks)]
+        )
+        self.assertEqual(self.stored_files(), [blob.name, blob.peaks])
+
+    def test_destroy_collects_unreferenced_blobs(self):
+
+        songs = [Song.objects.create(name=f'Song {index}', duration=1) for index in range(2)]
+        for song in songs:
+            self.upload(song)
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.Worker().run(once=True)
+        blob_files = self.stored_files()
+        self.assertEqual(len(blob_files), 2)
+
+        for song, references in zip(songs, (1, 0)):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete(
+                    reverse('common-actions-audio-file', kwargs={'audiofiletype': SONG, 'audiofileid': song.pk})
+                )
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+            self.assertEqual(AudioBlob.objects.filter(references=references).count(), int(references > 0))
+            self.assertEqual(self.stored_files(), blob_files if references else [])
+
+    def test_bulk_destroy_releases_references(self):
+
+        songs = [Song.objects.create(name=f'Song {index}', duration=1) for index in range(3)]
+        for song in songs:
+            self.upload(song)
+        other = make_wav(seconds=1)
+        self.upload(songs[2], other)
+        self.assertEqual(dict(AudioBlob.objects.values_list('checksum', 'references')), {
+            self.checksum: 2,
+            hashlib.sha256(other).hexdigest(): 1,
+        })
+
+        url = reverse('bulk-actions-audio-files', kwargs={'audiofiletype': SONG})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(url, {'ids': [songs[0].pk, songs[2].pk]})
+        self.assertEqual(response.data, {'deleted': 2})
+        self.assertEqual(list(AudioBlob.objects.values_list('checksum', 'references')), [(self.checksum, 1)])
+        self.assertEqual(self.stored_files(), [blobs.get_name(self.checksum)])
+
+    def test_reupload_of_the_same_content(self):
+
+        song = Song.objects.create(name='Song', duration=1)
+        self.upload(song)
+        self.upload(song)
+        self.assertEqual(AudioBlob.objects.get().references, 1)
+        self.assertEqual(self.stored_files(), [song.file])
+
+    def test_blob_uploaded_again_before_its_files_are_deleted_is_kept(self):
+
+        first = Song.objects.create(name='Song', duration=1)
+        second = Song.objects.create(name='Same Song', duration=1)
+        self.upload(first)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.delete(
+                reverse('common-actions-audio-file', kwargs={'audiofiletype': SONG, 'audiofileid': first.pk})
+            )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(AudioBlob.objects.exists())
+
+        # The same content comes back before the deletion of the released blob runs
+        self.upload(second)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(AudioBlob.objects.get().references, 1)
+        self.assertEqual(self.stored_files(), [second.file])
+
+    def test_media_stored_before_blobs_is_deleted(self):
+
+        os.makedirs(os.path.join(self.media_dir, 'song'))
+        for name in ('song/old.wav', 'song/old.wav.peaks'):
+            with open(os.path.join(self.media_dir, name), 'wb') as file:
+                file.write(b'old')
+        song = Song.objects.create(name='Song', duration=1, file='song/old.wav', peaks='song/old.wav.peaks')
+        self.upload(song)
+        self.assertEqual(self.stored_files(), [song.file])
+
+
+class AudioFileFeedTests(APITestCase):
+
+    def setUp(self):
+
+        self.url = reverse('audio-file-feed')
+        base_time = timezone.now() - timezone.timedelta(days=1)
+        self.items = []
+        for index in range(4):
+            uploaded_time = base_time + timezone.timedelta(minutes=index // 2)
+            for audiofile in (
+                Song.objects.create(name=f'Song {index}', duration=100),
+                Podcast.objects.create(name=f'Podcast {index}', duration=200, host=f'Host {index % 2}'),
+                AudioBook.objects.create(name=f'Book {index}', duration=300, author='Author', narrator='Narrator'),
+            ):
+                type(audiofile).objects.filter(pk=audiofile.pk).update(uploaded_time=uploaded_time)
+                self.items.append((uploaded_time, audiofile.audiofiletype, audiofile.pk))
+        # Most recent first, ties broken on audiofiletype then id
+        self.items.sort(reverse=True)
+
+    def get_keys(self, response):
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(item['audiofiletype'], item['audiofile']['id']) for item in response.data['results']]
+
+    def test_pages_follow_upload_order(self):
+
+        expected = [(audiofiletype, pk) for _, audiofiletype, pk in self.items]
+        pages = []
+        response = self.client.get(self.url, {'page_size': 5})
+        while True:
+            pages.append(self.get_keys(response))
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        self.assertEqual(sum(pages, []), expected)
+
+        previous_pages = []
+        while response.data['previous'] is not None:
+            response = self.client.get(response.data['previous'])
+            previous_pages.insert(0, self.get_keys(response))
+        self.assertEqual(previous_pages, pages[:-1])
+
+    def test_ascending_order(self):
+
+        response = self.client.get(self.url, {'ordering': 'uploaded_time', 'page_size': 7})
+        keys = self.get_keys(response)
+        keys += self.get_keys(self.client.get(response.data['next']))
+        self.assertEqual(keys, [(audiofiletype, pk) for _, audiofiletype, pk in reversed(self.items)])
+
+    def test_items_are_serialized_by_their_type(self):
+
+        response = self.client.get(self.url, {'page_size': 3})
+        for item in response.data['results']:
+            mapping = AudioFileViewSet.audio_type_serializer_model_mapping[item['audiofiletype']]
+            instance = mapping['model'].objects.get(pk=item['audiofile']['id'])
+            self.assertEqual(item['audiofile'], mapping['serializer'](instance).data)
+
+    def test_filters(self):
+
+        response = self.client.get(self.url, {'audiofiletype': f'{SONG},{AUDIOBOOK}'})
+        self.assertEqual({audiofiletype for audiofiletype, _ in self.get_keys(response)}, {SONG, AUDIOBOOK})
+        self.assertEqual(len(response.data['results']), 8)
+
+        response = self.client.get(self.url, {'host': 'Host 1'})
+        self.assertEqual(self.get_keys(response), [
+            (PODCAST, pk) for _, audiofiletype, pk in self.items
+            if audiofiletype == PODCAST and Podcast.objects.get(pk=pk).host == 'Host 1'
+        ])
+
+        response = self.client.get(self.url, {'host': 'Host 1', 'author': 'Author'})
+        self.assertEqual(response.data['results'], [])
+
+        response = self.client.get(self.url, {'audiofiletype': 'video'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_single_union_query_on_indexes(self):
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'page_size': 5})
+        self.assertEqual(len(response.data['results']), 5)
+        union_queries = [query['sql'] for query in queries.captured_queries if 'UNION ALL' in query['sql']]
+        self.assertEqual(len(union_queries), 1)
+        # The union, then the rows of each audiofiletype on the page
+        self.assertLessEqual(len(queries.captured_queries), 4)
+
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {union_queries[0]}')
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        for audiofiletype in (SONG, PODCAST, AUDIOBOOK):
+            self.assertIn(f'{audiofiletype}_uploaded_time_id_idx', plan)
+
+
+class AudioFileStatsTests(APITestCase):
+
+    def setUp(self):
+
+        self.url = reverse('audio-file-stats')
+
+    def expected_totals(self):
+
+        totals = {}
+        for audiofiletype, mapping in AudioFileViewSet.audio_type_serializer_model_mapping.items():
+            aggregate = mapping['model'].objects.aggregate(count=Count('pk'), total_duration=Sum('duration'))
+            count, total_duration = aggregate['count'], aggregate['total_duration'] or 0
+            totals[audiofiletype] = {
+                'count': count,
+                'total_duration': total_duration,
+                'average_duration': total_duration / count if count else None,
+            }
+        return totals
+
+    def assert_in_sync(self):
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['types'], self.expected_totals())
+        self.assertEqual(response.data['top_hosts'], [
+            {'name': row['host'], 'count': row['count'], 'total_duration': row['total_duration']}
+            for row in Podcast.objects.values('host').annotate(
+                count=Count('pk'),
+                total_duration=Sum('duration')
+            ).order_by('-count', 'host')[:10]
+        ])
+        return response.data
+
+    def test_counters_follow_every_kind_of_write(self):
+
+        create_url = reverse('create-audio-file')
+        self.client.post(create_url, {'audiofiletype': SONG, 'audiofilemetadata': {'name': 'One', 'duration': 100}})
+        self.client.post(reverse('bulk-create-audio-files'), [
+            {'audiofiletype': PODCAST, 'audiofilemetadata': {'name': 'P1', 'duration': 60, 'host': 'Ann'}},
+            {'audiofiletype': PODCAST, 'audiofilemetadata': {'name': 'P2', 'duration': 90, 'host': 'Ann'}},
+            {'audiofiletype': PODCAST, 'audiofilemetadata': {'name': 'P3', 'duration': 30, 'host': 'Bob'}},
+            {
+                'audiofiletype': AUDIOBOOK,
+                'audiofilemetadata': {'name': 'B1', 'duration': 500, 'author': 'Cy', 'narrator': 'Di'}
+            },
+        ])
+        self.assert_in_sync()
+
+        song = Song.objects.get()
+        self.client.patch(
+            reverse('common-actions-audio-file', kwargs={'audiofiletype': SONG, 'audiofileid': song.pk}),
+            {'duration': 250}
+        )
+        bulk_url = reverse('bulk-actions-audio-files', kwargs={'audiofiletype': PODCAST})
+        self.client.patch(f'{bulk_url}?host=Ann', {'audiofilemetadata': {'host': 'Bob'}})
+        data = self.assert_in_sync()
+        self.assertEqual(data['top_hosts'], [{'name': 'Bob', 'count': 3, 'total_duration': 180}])
+        self.assertEqual(data['top_authors'], [{'name': 'Cy', 'count': 1, 'total_duration': 500}])
+
+        self.client.delete(reverse('common-actions-audio-file', kwargs={'audiofiletype': SONG, 'audiofileid': song.pk}))
+        self.client.delete(bulk_url, {'ids': list(Podcast.objects.values_list('pk', flat=True)[:2])})
+        self.assert_in_sync()
+        AudioBook.objects.all().delete()
+        data = self.assert_in_sync()
+        self.assertEqual((data['top_authors'], data['top_narrators']), ([], []))
+
+    def test_uploads_per_day(self):
+
+        today = timezone.now().date()
+        for index in range(3):
+            Song.objects.create(name=f'Song {index}', duration=10)
+        Podcast.objects.create(name='Podcast', duration=10, host='Host')
+        Song.objects.filter(name='Song 0').update(uploaded_time=timezone.now() - timezone.timedelta(days=3))
+        Song.objects.filter(name='Song 1').update(uploaded_time=timezone.now() - timezone.timedelta(days=40))
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['uploads_per_day'], [
+            {'day': today - timezone.timedelta(days=3), SONG: 1, PODCAST: 0, AUDIOBOOK: 0},
+            {'day': today, SONG: 1, PODCAST: 1, AUDIOBOOK: 0},
+        ])
+        response = self.client.get(self.url, {'days': 1})
+        self.assertEqual(len(response.data['uploads_per_day']), 1)
+        response = self.client.get(self.url, {'top': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_reads_do_not_depend_on_table_size(self):
+
+        Song.objects.bulk_create([Song(name=f'Song {index}', duration=index) for index in range(2000)])
+        with CaptureQueriesContext(connection) as queries:
+            data = self.assert_in_sync()
+        self.assertEqual(data['types'][SONG]['count'], 2000)
+        # Totals, three top lists and uploads per day, plus the aggregates of the assertion itself
+        self.assertEqual(len(queries), 5 + 4)
+        for query in queries.captured_queries[:5]:
+            self.assertNotIn('"song"', query['sql'])
+
+    def test_reconcile_command(self):
+
+        Podcast.objects.create(name='Podcast', duration=10, host='Host')
+        AudioFileStats.objects.filter(audiofiletype=PODCAST).update(count=7)
+
+        output = io.StringIO()
+        call_command('reconcile_audiofile_stats', stdout=output)
+        self.assertIn('podcast: 1 audiofiles, fixed count 7 -> 1', output.getvalue())
+        self.assertIn('song: 0 audiofiles, in sync', output.getvalue())
+        self.assert_in_sync()
+        self.assertEqual(stats.rebuild()[0], stats.rebuild()[1])
+
+        with connection.cursor() as cursor:
+            cursor.execute('TRUNCATE podcast')
+        self.assertEqual(stats.get_type_totals()[PODCAST]['count'], 0)
+
+
+class RequestMetricsTests(APITestCase):
+
+    def setUp(self):
+
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+
+    def get_samples(self):
+        """Samples of the metrics endpoint by metric name and labels"""
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if line.startswith('#'):
+                continue
+            series, value = line.rsplit(' ', 1)
+            name, _, labels = series.partition('{')
+            labels = frozenset(tuple(label.split('=', 1)) for label in labels.rstrip('}').split(',') if label)
+            samples[name, labels] = float(value)
+        return samples
+
+    @staticmethod
+    def get_value(samples, name, **labels):
+
+        return samples.get((name, frozenset((key, f'"{value}"') for key, value in labels.items())))
+
+    def test_requests_are_recorded_by_endpoint_and_phase(self):
+
+        response = self.client.post(
+            reverse('create-audio-file'),
+            {'audiofiletype': SONG, 'audiofilemetadata': {'name': 'Song', 'duration': 100}}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        detail_url = reverse(
+            'common-actions-audio-file',
+            kwargs={'audiofiletype': SONG, 'audiofileid': response.data['id']}
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(detail_url)
+        size, query_count = len(response.content), len(queries)
+        self.client.get(reverse('list-audio-files', kwargs={'audiofiletype': SONG}))
+
+        samples = self.get_samples()
+        create = {'method': 'POST', 'endpoint': 'create-audio-file', 'audiofiletype': ''}
+        retrieve = {'method': 'GET', 'endpoint': 'common-actions-audio-file', 'audiofiletype': SONG}
+        listing = {'method': 'GET', 'endpoint': 'list-audio-files', 'audiofiletype': SONG}
+        self.assertEqual(
+            self.get_value(samples, 'audiofile_http_request_duration_seconds_count', **create, status=201), 1
+        )
+        for phase in ('parse', 'validation', 'serialization', 'render', 'db'):
+            self.assertEqual(
+                self.get_value(samples, 'audiofile_http_request_phase_seconds_count', **create, phase=phase), 1
+            )
+        for phase in ('serialization', 'render', 'db'):
+            self.assertEqual(
+                self.get_value(samples, 'audiofile_http_request_phase_seconds_count', **listing, phase=phase), 1
+            )
+        self.assertIsNone(
+            self.get_value(samples, 'audiofile_http_request_phase_seconds_count', **listing, phase='parse')
+        )
+
+        self.assertEqual(self.get_value(samples, 'audiofile_http_request_queries_sum', **retrieve), query_count)
+        self.assertEqual(self.get_value(samples, 'audiofile_http_response_size_bytes_sum', **retrieve), size)
+        self.assertEqual(self.get_value(samples, 'audiofile_http_response_size_bytes_bucket', **retrieve, le=1000), 1)
+        self.assertEqual(self.get_value(samples, 'audiofile_http_response_size_bytes_bucket', **retrieve, le=100), 0)
+        self.assertEqual(
+            self.get_value(samples, 'audiofile_http_response_size_bytes_bucket', **retrieve, le='+Inf'), 1
+        )
+
+    def test_unmatched_paths_share_one_series(self):
+
+        self.client.get('/nothing/here')
+        self.client.get('/nothing/there')
+        samples = self.get_samples()
+        self.assertEqual(
+            self.get_value(
+                samples, 'audiofile_http_request_duration_seconds_count',
+                method='GET', endpoint='unmatched', audiofiletype='', status=404
+            ),
+            2
+        )
+
+    def test_phases_outside_requests_and_nested_phases(self):
+
+        with metrics.phase('render'):
+            pass
+        self.assertIsNone(metrics.current_request.get())
+
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current_request.set(request_metrics)
+        self.addCleanup(metrics.current_request.reset, token)
+        with metrics.phase('render'):
+            with metrics.phase('render'):
+                FastJSONRenderer().render({'a': 1})
+            with metrics.phase('serialization'):
+                pass
+        self.assertEqual(set(request_metrics.phases), {'render', 'serialization'})
+        self.assertEqual(request_metrics.active_phases, set())
+
+    def test_async_requests_record_queries_of_database_threads(self):
+
+        async def get_response(request):
+            return await database_sync_to_async(self.count_songs)()
+
+        request = APIRequestFactory().get('/')
+        request.resolver_match = None
+        async_to_sync(metrics_middleware(get_response))(request)
+
+        samples = self.get_samples()
+        labels = {'method': 'GET', 'endpoint': 'unmatched', 'audiofiletype': ''}
+        self.assertEqual(self.get_value(samples, 'audiofile_http_request_queries_sum', **labels), 1)
+        self.assertEqual(
+            self.get_value(samples, 'audiofile_http_request_phase_seconds_count', **labels, phase='serialization'), 1
+        )
+
+    @staticmethod
+    def count_songs():
+
+        with metrics.phase('serialization'):
+            return HttpResponse(str(Song.objects.count()))
+
+    def test_metrics_can_be_turned_off(self):
+
+        with override_settings(AUDIOFILE_METRICS=False, AUDIOFILE_QUERY_BUDGETS='off'):
+            with self.assertRaises(MiddlewareNotUsed):
+                metrics_middleware(lambda request: HttpResponse())
+
+    def test_recording_stays_within_overhead_budget(self):
+
+        song = Song.objects.create(name='Song', duration=10)
+        url = reverse('common-actions-audio-file', kwargs={'audiofiletype': SONG, 'audiofileid': song.pk})
+        with override_settings(AUDIOFILE_METRICS=False, AUDIOFILE_QUERY_BUDGETS=querybudget.OFF):
+            samples = benchmarks.time_calls(lambda: self.client.get(url), 50)
+        recording = benchmarks.time_metrics_recording(AudioFileViewSet.query_budgets['retrieve'])
+        self.assertGreater(recording, 0)
+        self.assertLess(recording / statistics.median(samples) * 100, benchmarks.METRICS_OVERHEAD_BUDGET)
+
+
+class BenchmarkBaselineTests(SimpleTestCase):
+
+    baseline = {
+        'song.list': {'p95_ms': 10.0, 'ops_per_second': 100.0, 'queries_per_request': 2.0},
+        'song.create': {'p95_ms': 10.0, 'ops_per_second': 100.0, 'queries_per_request': 1.0},
+    }
+
+    def test_runs_within_tolerance_pass(self):
+
+        report = {
+            'song.list': {'p95_ms': 11.9, 'ops_per_second': 81.0, 'queries_per_request': 2.0},
+            'song.create': {'p95_ms': 5.0, 'ops_per_second': 300.0, 'queries_per_request': 1.0},
+            'podcast.list': {'p95_ms': 100.0, 'ops_per_second': 1.0, 'queries_per_request': 9.0},
+        }
+        self.assertEqual(benchmarks.find_regressions(report, self.baseline), [])
+
+    def test_slower_runs_and_extra_queries_are_regressions(self):
+
+        report = {
+            'song.list': {'p95_ms': 12.1, 'ops_per_second': 79.0, 'queries_per_request': 2.0},
+            'song.create': {'p95_ms': 10.0, 'ops_per_second': 100.0, 'queries_per_request': 1.5},
+        }
+        self.assertEqual(benchmarks.find_regressions(report, self.baseline), [
+            'song.list: p95 12.1ms, baseline 10.0ms',
+            'song.list: 79.0 ops/s, baseline 100.0 ops/s',
+            'song.create: 1.5 queries per request, baseline 1.0',
+        ])
+        self.assertEqual(benchmarks.find_regressions(report, self.baseline, tolerance=0.5), [
+            'song.create: 1.5 queries per request, baseline 1.0',
+        ])
+
+    def test_more_errors_are_regressions(self):
+
+        report = {
+            'song.list': {'p95_ms': 1.0, 'ops_per_second': 1000.0, 'queries_per_request': 2.0, 'errors': 3},
+            'song.create': {'p95_ms': 10.0, 'ops_per_second': 100.0, 'queries_per_request': 1.0, 'errors': 0},
+        }
+        self.assertEqual(benchmarks.find_regressions(report, self.baseline), ['song.list: 3 errors, baseline 0'])
+        baseline = {'song.list': {**self.baseline['song.list'], 'errors': 3}}
+        self.assertEqual(benchmarks.find_regressions(report, baseline), [])
+
+    def test_metrics_overhead_over_budget_is_reported(self):
+
+        overhead = {
+            'song.list': {'recording_us': 10.0, 'overhead_percent': 0.5},
+            'song.create': {'recording_us': 90.0, 'overhead_percent': 2.5},
+        }
+        self.assertEqual(benchmarks.find_metrics_overhead(overhead), [
+            'song.create: recording metrics adds 2.5%, budget 2.0%',
+        ])
+        self.assertEqual(benchmarks.find_metrics_overhead(overhead, budget=3.0), [])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class QueryBudgetTests(APITestCase):
+
+    def setUp(self):
+
+        settings_override = override_settings(AUDIOFILE_QUERY_BUDGETS=querybudget.RAISE)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.podcast = Podcast.objects.create(name='Podcast', duration=10, host='Host', participants=['Guest'])
+        self.detail_url = reverse(
+            'common-actions-audio-file',
+            kwargs={'audiofiletype': PODCAST, 'audiofileid': self.podcast.pk}
+        )
+        self.bulk_url = reverse('bulk-actions-audio-files', kwargs={'audiofiletype': PODCAST})
+
+    def test_actions_stay_within_their_budget(self):
+
+        response = self.client.post(
+            reverse('create-audio-file'),
+            {'audiofiletype': SONG, 'audiofilemetadata': {'name': 'Song', 'duration': 100}}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        list_url = reverse('list-audio-files', kwargs={'audiofiletype': PODCAST})
+        self.assertEqual(self.client.get(f'{list_url}?host=Host').status_code, status.HTTP_200_OK)
+        etag = self.client.get(self.detail_url)['ETag']
+        metadata = {'name': 'Renamed', 'duration': 20, 'host': 'Host', 'participants': ['Guest']}
+        self.assertEqual(self.client.put(self.detail_url, metadata).status_code, status.HTTP_200_OK)
+        response = self.client.patch(self.detail_url, {'duration': 30}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        etag = self.client.get(self.detail_url)['ETag']
+        response = self.client.patch(self.detail_url, {'duration': 30}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        others = Podcast.objects.bulk_create([
+            Podcast(name=f'Podcast {index}', duration=index + 1, host='Host') for index in range(20)
+        ])
+        response = self.client.patch(self.bulk_url, {'items': [{'id': other.pk, 'duration': 5} for other in others]})
+        self.assertEqual(response.data, {'updated': 20})
+        response = self.client.patch(self.bulk_url, {'ids': [others[0].pk], 'audiofilemetadata': {'duration': 6}})
+        self.assertEqual(response.data, {'updated': 1})
+
+        blob = AudioBlob.objects.create(checksum='a' * 64, name=blobs.get_name('a' * 64), size=1, references=3)
+        Podcast.objects.filter(pk__in=[self.podcast.pk, others[0].pk, others[1].pk]).update(file=blob.name)
+        self.assertEqual(self.client.delete(self.detail_url).status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.delete(self.bulk_url, {'ids': [other.pk for other in others]})
+        self.assertEqual(response.data, {'deleted': 20})
+        self.assertFalse(AudioBlob.objects.exists())
+
+    def test_exceeded_budgets_raise_or_log(self):
+
+        with mock.patch.object(AudioFileViewSet, 'query_budgets', {'retrieve': 1}):
+            with self.assertRaisesMessage(
+                querybudget.QueryBudgetExceeded,
+                'AudioFileViewSet.retrieve ran 2 queries, its budget is 1'
+            ):
+                self.client.get(self.detail_url)
+
+            with override_settings(AUDIOFILE_QUERY_BUDGETS=querybudget.LOG):
+                with self.assertLogs('core.querybudget', 'WARNING') as logs:
+                    response = self.client.get(self.detail_url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(logs.output, [
+                'WARNING:core.querybudget:AudioFileViewSet.retrieve ran 2 queries, its budget is 1'
+            ])
+
+            with override_settings(AUDIOFILE_QUERY_BUDGETS=querybudget.OFF):
+                self.assertEqual(self.client.get(self.detail_url).status_code, status.HTTP_200_OK)
+
+        # A mistyped mode is not taken for 'log'
+        with override_settings(AUDIOFILE_QUERY_BUDGETS='warn'):
+            with self.assertRaisesMessage(
+                ImproperlyConfigured,
+                "AUDIOFILE_QUERY_BUDGETS must be one of off, log, raise, not 'warn'"
+            ):
+                self.client.get(self.detail_url)
+        # Views and actions without a budget are not checked
+        self.assertEqual(self.client.get(reverse('audio-file-stats')).status_code, status.HTTP_200_OK)
+
+    def test_repeated_statements_are_reported_as_n_plus_one_queries(self):
+
+        lookup = 'SELECT "song"."id" FROM "song" WHERE "song"."id" = %s'
+        statements = Counter({
+            lookup: 5,
+            'SELECT "song"."id" FROM "song" WHERE "song"."id" IN (%s, %s, %s)': 10,
+            'SAVEPOINT "s1_x1"': 8,
+            'SELECT 1': 4,
+        })
+        self.assertEqual(querybudget.find_repeated_statements(statements), [(lookup, 5)])
+        self.assertEqual(querybudget.count_queries(statements), 19)
+        with self.assertRaisesMessage(
+            querybudget.QueryBudgetExceeded,
+            f'SongView.list ran the same statement 5 times, a likely N+1 query: {lookup}'
+        ):
+            querybudget.check('SongView.list', 20, statements, querybudget.RAISE)
+
+        def list_page(view, request, *args, **kwargs):
+            for song in Podcast.objects.all()[:5]:
+                Podcast.objects.filter(pk=song.pk).exists()
+            return Response([])
+
+        Podcast.objects.bulk_create([Podcast(name=f'Podcast {index}', duration=1, host='Host') for index in range(4)])
+        with mock.patch.object(AudioFileViewSet, 'list_page', list_page):
+            with self.assertRaisesMessage(querybudget.QueryBudgetExceeded, 'likely N+1 query'):
+                self.client.get(reverse('list-audio-files', kwargs={'audiofiletype': PODCAST}))
+
+
+class ImportAudioFilesTests(APITestCase):
+
+    def write_input(self, suffix, content):
+
+        input_file = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8', newline='')
+        self.addCleanup(os.unlink, input_file.name)
+        with input_file:
+            input_file.write(content)
+        return input_file.name
+
+    def import_audiofiles(self, path, **options):
+
+        output = io.StringIO()
+        call_command('import_audiofiles', path, stdout=output, **{'processes': 0, **options})
+        return json.loads(output.getvalue())
+
+    def test_ndjson_rows_are_validated_like_the_api(self):
+
+        rows = [
+            {'name': 'Talk', 'duration': 60, 'host': 'Ann', 'participants': ['Tab\there', 'Quote " and \\ slash']},
+            {'name': 'Crowded', 'duration': 60, 'host': 'Ann', 'participants': [str(index) for index in range(11)]},
+            {'name': 'Negative', 'duration': -1, 'host': 'Ann'},
+            {'name': 'No participants', 'duration': 30, 'host': 'Bob\nNewline'},
+        ]
+        path = self.write_input('.ndjson', ''.join(json.dumps(row) + '\n' for row in rows) + '\n[1]\nnot json\n')
+        rejects_path = self.write_input('.ndjson', '')
+
+        report = self.import_audiofiles(path, audiofiletype=PODCAST, chunk_size=2, rejects=rejects_path)
+        self.assertEqual(
+            {key: report[key] for key in ('rows', 'imported', 'rejected', 'chunks', 'skipped_chunks')},
+            {'rows': 6, 'imported': 2, 'rejected': 4, 'chunks': 3, 'skipped_chunks': 0}
+        )
+        self.assertGreater(report['rows_per_second'], 0)
+
+        talk, other = Podcast.objects.order_by('pk')
+        self.assertEqual(
+            (talk.name, talk.host, talk.participants),
+            ('Talk', 'Ann', ['Tab\there', 'Quote " and \\ slash'])
+        )
+        self.assertEqual((other.host, other.participants, other.file), ('Bob\nNewline', [], ''))
+        self.assertIsNotNone(talk.uploaded_time)
+        self.assertEqual(Podcast.objects.filter(search_vector='talk').count(), 1)
+        self.assertEqual(stats.get_type_totals()[PODCAST]['count'], 2)
+
+        with open(rejects_path) as rejects:
+            rejected = [json.loads(line) for line in rejects]
+        self.assertEqual([item['line'] for item in rejected], [2, 3, 6, 7])
+        self.assertIn('no more than 10', rejected[0]['errors']['participants'][0])
+        self.assertIn('duration', rejected[1]['errors'])
+        self.assertEqual(rejected[2]['errors'], {'non_field_errors': ['Expected a JSON object']})
+        self.assertIn('Invalid JSON', rejected[3]['errors']['non_field_errors'][0])
+
+    def test_csv_rows_on_worker_processes(self):
+
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(['name', 'duration', 'host', 'participants'])
+        writer.writerow(['Multi\nline, name', '10', 'Ann', '["One", "Two"]'])
+        writer.writerow(['Bad list', '10', 'Ann', 'One, Two'])
+        writer.writerow(['', '10', 'Ann', ''])
+        path = self.write_input('.csv', output.getvalue())
+
+        report = self.import_audiofiles(path, audiofiletype=PODCAST, processes=1)
+        self.assertEqual((report['imported'], report['rejected']), (1, 2))
+        self.assertEqual(
+            list(Podcast.objects.values_list('name', 'participants')),
+            [('Multi\nline, name', ['One', 'Two'])]
+        )
+
+    def test_interrupted_imports_resume_after_the_last_chunk(self):
+
+        path = self.write_input('.ndjson', ''.join(
+            json.dumps({'name': f'Song {index}', 'duration': index + 1}) + '\n' for index in range(10)
+        ))
+
+        copy_chunk = imports.Importer.copy_chunk
+        copied = []
+
+        def fail_on_third_chunk(importer, *args):
+            if len(copied) == 2:
+                raise psycopg2.OperationalError('server closed the connection unexpectedly')
+            copy_chunk(importer, *args)
+            copied.append(args)
+
+        with mock.patch.object(imports.Importer, 'copy_chunk', fail_on_third_chunk):
+            with self.assertRaises(psycopg2.OperationalError):
+                self.import_audiofiles(path, audiofiletype=SONG, chunk_size=3)
+        self.assertEqual(Song.objects.count(), 6)
+
+        report = self.import_audiofiles(path, audiofiletype=SONG, chunk_size=3)
+        self.assertEqual((report['skipped_chunks'], report['chunks'], report['imported']), (2, 2, 4))
+        self.assertEqual(sorted(Song.objects.values_list('duration', flat=True)), list(range(1, 11)))
+        progress = AudioImport.objects.get(pk=report['import_id'])
+        self.assertEqual((progress.chunks, progress.imported, progress.rejected), (4, 10, 0))
+
+        report = self.import_audiofiles(path, audiofiletype=SONG, chunk_size=3)
+        self.assertEqual((report['skipped_chunks'], report['imported']), (4, 0))
+
+        with self.assertRaisesMessage(CommandError, 'in chunks of 3 rows'):
+            self.import_audiofiles(path, audiofiletype=SONG, chunk_size=5, import_id=report['import_id'])
+        with self.assertRaisesMessage(CommandError, 'Cannot guess the input format'):
+            self.import_audiofiles(self.write_input('.txt', ''), audiofiletype=SONG)
+
+    def test_chunks_loaded_by_a_concurrent_run_are_not_loaded_again(self):
+
+        path = self.write_input('.ndjson', ''.join(
+            json.dumps({'name': f'Song {index}', 'duration': index + 1}) + '\n' for index in range(4)
+        ))
+        copy_chunk = imports.Importer.copy_chunk
+
+        def copy_after_another_run(importer, index, *args):
+            if index == 1:
+                # Another run of the same import committed the second chunk after this one loaded the first
+                AudioImport.objects.filter(pk=importer.key).update(chunks=2, imported=4)
+            copy_chunk(importer, index, *args)
+
+        with mock.patch.object(imports.Importer, 'copy_chunk', copy_after_another_run):
+            with self.assertRaisesMessage(CommandError, 'Chunk 2 of import concurrent was loaded by another run'):
+                self.import_audiofiles(path, audiofiletype=SONG, chunk_size=2, import_id='concurrent')
+        self.assertEqual(Song.objects.count(), 2)
+        self.assertEqual(AudioImport.objects.get(pk='concurrent').chunks, 2)
+
+    def test_rejects_are_written_when_their_chunk_commits(self):
+
+        rows = [
+            {'name': 'Valid', 'duration': 1},
+            {'name': 'Negative', 'duration': -1},
+            {'name': 'Later', 'duration': 2},
+        ]
+        path = self.write_input('.ndjson', ''.join(json.dumps(row) + '\n' for row in rows))
+        rejects_path = self.write_input('.ndjson', '')
+        copy_chunk = imports.Importer.copy_chunk
+
+        def stop_after_first_chunk(importer, index, *args):
+            copy_chunk(importer, index, *args)
+            # The run stops right after the first chunk committed
+            raise KeyboardInterrupt
+
+        with mock.patch.object(imports.Importer, 'copy_chunk', stop_after_first_chunk):
+            with self.assertRaises(KeyboardInterrupt):
+                self.import_audiofiles(path, audiofiletype=SONG, chunk_size=2, rejects=rejects_path)
+
+        progress = AudioImport.objects.get()
+        self.assertEqual((progress.chunks, progress.imported, progress.rejected), (1, 1, 1))
+        with open(rejects_path) as rejects:
+            self.assertEqual([json.loads(line)['line'] for line in rejects], [2])
+
+
+class ExportAudioFilesTests(APITestCase):
+
+    def setUp(self):
+
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+
+    def export_audiofiles(self, **options):
+
+        output = io.StringIO()
+        call_command('export_audiofiles', self.output_dir, stdout=output, **{'processes': 0, **options})
+        return json.loads(output.getvalue())
+
+    def read_parts(self, audiofiletype):
+
+        with open(os.path.join(self.output_dir, 'manifest.json')) as manifest_file:
+            manifest = json.load(manifest_file)
+        opener = gzip.open if manifest['compression'] == exports.GZIP else open
+        return manifest, [
+            opener(
+                os.path.join(self.output_dir, audiofiletype, part['name']), 'rt', encoding='utf-8', newline=''
+            ).read()
+            for part in manifest['types'][audiofiletype]['parts']
+        ]
+
+    def test_ndjson_parts_match_the_api_representation(self):
+
+        podcasts = [
+            Podcast.objects.create(name=f'Talk {index}', duration=60, host='Ann', participants=['Tab\there', 'Q "\\'])
+            for index in range(5)
+        ]
+
+        report = self.export_audiofiles(audiofiletype=[PODCAST], format='ndjson', rows_per_part=2)
+        self.assertEqual((report['rows'], report['types'][PODCAST]['rows']), (5, 5))
+        self.assertGreater(report['rows_per_second'], 0)
+
+        manifest, parts = self.read_parts(PODCAST)
+        self.assertEqual(
+            [part['name'] for part in manifest['types'][PODCAST]['parts']],
+            ['part-00000.ndjson.gz', 'part-00001.ndjson.gz', 'part-00002.ndjson.gz']
+        )
+        self.assertEqual([part['rows'] for part in manifest['types'][PODCAST]['parts']], [2, 2, 1])
+        rows = [json.loads(line) for part in parts for line in part.splitlines()]
+        expected = PodcastSerializer(podcasts, many=True).data
+        self.assertEqual(len(rows), len(expected))
+        self.assertEqual(rows, expected)
+
+    def test_csv_parts_are_read_back_by_import_audiofiles(self):
+
+        Podcast.objects.create(name='Multi\nline, name', duration=10, host='Ann', participants=['One', 'Two, "Three"'])
+        Podcast.objects.create(name='Alone', duration=20, host='Bob')
+        expected = list(Podcast.objects.order_by('pk').values_list('name', 'duration', 'host', 'participants'))
+
+        report = self.export_audiofiles(audiofiletype=[PODCAST, SONG], compression='none')
+        self.assertEqual((report['types'][PODCAST]['rows'], report['types'][SONG]['rows']), (2, 0))
+        manifest, (part,) = self.read_parts(PODCAST)
+        self.assertEqual(manifest['types'][SONG]['parts'], [])
+        header, first_row = list(csv.reader(io.StringIO(part)))[:2]
+        self.assertEqual(header, manifest['types'][PODCAST]['columns'])
+        self.assertEqual(
+            first_row[header.index('uploaded_time')],
+            PodcastSerializer(Podcast.objects.order_by('pk').first()).data['uploaded_time']
+        )
+
+        # A second export replaces the parts of the first
+        self.export_audiofiles(audiofiletype=[PODCAST], compression='none', rows_per_part=1)
+        self.export_audiofiles(audiofiletype=[PODCAST], compression='none')
+        self.assertEqual(os.listdir(os.path.join(self.output_dir, PODCAST)), ['part-00000.csv'])
+
+        Podcast.objects.all().delete()
+        call_command(
+            'import_audiofiles',
+            os.path.join(self.output_dir, PODCAST, 'part-00000.csv'),
+            audiofiletype=PODCAST,
+            processes=0,
+            stdout=io.StringIO()
+        )
+        self.assertEqual(
+            list(Podcast.objects.order_by('pk').values_list('name', 'duration', 'host', 'participants')),
+            expected
+        )
+
+        with self.assertRaisesMessage(CommandError, '--rows-per-part must be at least 1'):
+            self.export_audiofiles(rows_per_part=0)
+
+    def test_columns_without_a_field_plan(self):
+
+        columns = exports.get_columns(PODCAST)
+        with mock.patch('core.exports.get_field_plan', return_value=None):
+            self.assertEqual(exports.get_columns(PODCAST), columns)
+
+        class LabelledSongSerializer(SongSerializer):
+
+            label = serializers.SerializerMethodField()
+
+            def get_label(self, song):
+                return song.name.upper()
+
+        serializer_mapping = {SONG: LabelledSongSerializer}
+        with mock.patch.dict(AudioFileModelSerializerMappingMixin.audio_type_serializer_mapping, serializer_mapping):
+            with self.assertRaisesMessage(ValueError, 'Field label of LabelledSongSerializer does not read a column'):
+                exports.get_columns(SONG)
+
+
+class ExportAudioFilesTransactionTests(TransactionTestCase):
+
+    def test_parts_exported_in_process_read_one_snapshot(self):
+
+        songs = [Song.objects.create(name=f'Song {index}', duration=1) for index in range(4)]
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        export_range = exports.export_range
+
+        def delete_last_song():
+            Song.objects.filter(pk=songs[-1].pk).delete()
+            connection.close()
+
+        def export_range_then_delete(*args, **kwargs):
+            result = export_range(*args, **kwargs)
+            if Song.objects.filter(pk=songs[-1].pk).exists():
+                # A write committed by another connection between two parts
+                thread = threading.Thread(target=delete_last_song)
+                thread.start()
+                thread.join()
+            return result
+
+        with mock.patch('core.exports.export_range', export_range_then_delete):
+            manifest = exports.Exporter(output_dir, compression='none', rows_per_part=2).run([SONG])
+
+        self.assertFalse(Song.objects.filter(pk=songs[-1].pk).exists())
+        self.assertEqual([part['rows'] for part in manifest['types'][SONG]['parts']], [2, 2])
+
+    def test_worker_processes_read_the_database_of_the_exporting_process(self):
+
+        Song.objects.bulk_create([Song(name=f'Song {index}', duration=1) for index in range(3)])
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+
+        manifest = exports.Exporter(output_dir, compression='none', processes=1, rows_per_part=2).run([SONG])
+        self.assertEqual([part['rows'] for part in manifest['types'][SONG]['parts']], [2, 1])
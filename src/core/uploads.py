@@ -0,0 +1,184 @@
+"""
+Streaming and resumable uploads of audio media
+
+Request bodies are read and written to the audio storage in chunks of `AUDIOFILE_UPLOAD_CHUNK_SIZE` bytes and the
+sha256 checksum is computed along the way, so a file is never held in memory. Whatever part of a body was received
+is kept when a request is interrupted, and the upload resumes from there with the next request.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.http import UnreadablePostError
+
+from core import blobs, constants, jobs, mixins, models, probing, storage as audio_storage
+
+
+class HasherCache:
+    """
+    Checksum state of in-progress uploads, so that resuming one does not read its stored bytes again
+
+    The state is only per process and bounded, a request for an upload whose state is missing or at another offset
+    rebuilds it from the stored bytes.
+    """
+
+    def __init__(self, max_entries=256):
+
+        self.max_entries = max_entries
+        self._hashers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def pop(self, upload, storage):
+
+        with self._lock:
+            offset, hasher = self._hashers.pop(upload.pk, (None, None))
+        if offset == upload.offset:
+            return hasher
+
+        hasher = hashlib.sha256()
+        if upload.offset:
+            with storage.open(upload.storage_name) as file:
+                for chunk in iter(lambda: file.read(settings.AUDIOFILE_UPLOAD_CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+        return hasher
+
+    def put(self, upload, hasher):
+
+        with self._lock:
+            self._hashers[upload.pk] = (upload.offset, hasher)
+            while len(self._hashers) > self.max_entries:
+                self._hashers.popitem(last=False)
+
+    def discard(self, upload):
+
+        with self._lock:
+            self._hashers.pop(upload.pk, None)
+
+
+hashers = HasherCache()
+
+
+def read_chunks(stream, limit, hasher):
+    """Yield the chunks of `stream` up to `limit` bytes, adding them to the checksum"""
+
+    remaining = limit
+    while stream is not None and remaining > 0:
+        try:
+            chunk = stream.read(min(settings.AUDIOFILE_UPLOAD_CHUNK_SIZE, remaining))
+        except UnreadablePostError:
+            # The client went away, what it sent so far is kept
+            return
+        if not chunk:
+            return
+        remaining -= len(chunk)
+        hasher.update(chunk)
+        yield chunk
+
+
+def append(upload, stream):
+    """
+    Write the bytes of `stream` at the current offset of the upload and move its offset past them
+
+    Returns False when another request moved the offset in the meantime, in which case nothing is written. The upload
+    row is locked while writing, so concurrent requests at the same offset never write over each other's bytes.
+    """
+
+    storage = audio_storage.get_storage()
+    with transaction.atomic():
+        offset = models.AudioUpload.objects.select_for_update().filter(pk=upload.pk).values_list(
+            'offset', flat=True
+        ).first()
+        if offset != upload.offset:
+            return False
+        hasher = hashers.pop(upload, storage)
+        try:
+            written = storage.write(
+                upload.storage_name,
+                read_chunks(stream, upload.size - upload.offset, hasher),
+                offset=upload.offset
+            )
+        except Exception:
+            # The checksum may hold bytes that never reached the storage, the next request rebuilds it
+            hashers.discard(upload)
+            raise
+        models.AudioUpload.objects.filter(pk=upload.pk).update(offset=upload.offset + written)
+
+    upload.offset += written
+    if upload.complete:
+        complete(upload, hasher.hexdigest())
+    else:
+        hashers.put(upload, hasher)
+    return True
+
+
+def complete(upload, checksum):
+    """
+    Store the received file as a blob and record it on the audiofile, replacing its previous media
+
+    A file whose content was uploaded before takes the probed properties and peaks of the existing blob right away.
+    Otherwise probe and peaks jobs are queued in the same transaction, the properties probed from the file replace
+    those given by the client once a worker ran them.
+    """
+
+    storage = audio_storage.get_storage()
+    mapping = mixins.AudioFileModelSerializerMappingMixin.audio_type_serializer_model_mapping
+    model = mapping[upload.audiofiletype]['model']
+
+    with transaction.atomic():
+        audiofile = model.objects.select_for_update().filter(pk=upload.audiofileid).first()
+        if audiofile is None:
+            storage.delete(upload.storage_name)
+            models.AudioUpload.objects.filter(pk=upload.pk).delete()
+            raise model.DoesNotExist
+        blob = blobs.acquire(upload.storage_name, checksum, upload.size)
+        previous_media = (audiofile.file, audiofile.peaks)
+        audiofile.file = blob.name
+        audiofile.peaks = blob.peaks
+        audiofile.file_size = upload.size
+        audiofile.content_type = upload.content_type
+        audiofile.checksum = checksum
+        info = blobs.get_info(blob)
+        if info is None:
+            audiofile.bitrate = audiofile.sample_rate = audiofile.channels = None
+            jobs.enqueue(audiofile, constants.PROBE_JOB)
+        else:
+            probing.apply_info(audiofile, info)
+        if not blob.peaks:
+            jobs.enqueue(audiofile, constants.PEAKS_JOB)
+        audiofile.save(
+            update_fields=['file', 'file_size', 'content_type', 'checksum', 'peaks', 'last_modified']
+            + probing.PROBED_FIELDS
+        )
+        models.AudioUpload.objects.filter(pk=upload.pk).delete()
+        blobs.release([previous_media])
+
+    upload.audiofile = audiofile
+    return audiofile
+
+
+def abort(upload):
+    """Drop an upload and the bytes received for it"""
+
+    hashers.discard(upload)
+    audio_storage.get_storage().delete(upload.storage_name)
+    upload.delete()
+
+
+def release_audiofiles(audiofiletype, audiofileids, media):
+    """
+    Release what deleted audiofiles leave behind: their media, given as (file, peaks) name pairs, their jobs and
+    their unfinished uploads along with the bytes received for them once committed
+    """
+
+    blobs.release(media)
+    models.AudioJob.objects.filter(audiofiletype=audiofiletype, audiofileid__in=audiofileids).delete()
+    upload_ids = list(models.AudioUpload.objects.filter(
+        audiofiletype=audiofiletype,
+        audiofileid__in=audiofileids
+    ).values_list('pk', flat=True))
+    if upload_ids:
+        models.AudioUpload.objects.filter(pk__in=upload_ids).delete()
+        names = [models.AudioUpload(pk=upload_id).storage_name for upload_id in upload_ids]
+        transaction.on_commit(lambda: blobs.delete_files(names))
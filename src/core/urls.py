@@ -1,15 +1,25 @@
+from django.conf import settings
 from django.urls import path, include, re_path
 
-from core import views, constants
+from core import async_views, views, constants, renderers
 
 audiofiletype_url_param = r'(?P<audiofiletype>{}|{}|{})'.format(constants.SONG, constants.AUDIOBOOK, constants.PODCAST)
 audiofileid_url_param = r'(?P<audiofileid>\d+)'
 
+if settings.AUDIOFILE_ASYNC_VIEWS:
+    create_view_class, viewset_class = async_views.AsyncAudioFileCreateAPIView, async_views.AsyncAudioFileViewSet
+else:
+    create_view_class, viewset_class = views.AudioFileCreateAPIView, views.AudioFileViewSet
+
 audiofileurlpatterns = [
-    path("", views.AudioFileCreateAPIView.as_view(), name='create-audio-file'),
+    path("", create_view_class.as_view(), name='create-audio-file'),
+    path("bulk/", views.AudioFileBulkCreateAPIView.as_view(), name='bulk-create-audio-files'),
+    path("search/", views.AudioFileSearchAPIView.as_view(), name='search-audio-files'),
+    path("feed/", views.AudioFileFeedAPIView.as_view(), name='audio-file-feed'),
+    path("stats/", views.AudioFileStatsAPIView.as_view(), name='audio-file-stats'),
     re_path(
         r"^{}/{}/$".format(audiofiletype_url_param, audiofileid_url_param),
-        views.AudioFileViewSet.as_view(
+        viewset_class.as_view(
             actions={
                 "put": "update",
                 "patch": "partial_update",
@@ -19,11 +29,45 @@ audiofileurlpatterns = [
         ),
         name='common-actions-audio-file'
     ),
+    re_path(
+        r"^{}/{}/upload/$".format(audiofiletype_url_param, audiofileid_url_param),
+        views.AudioFileUploadAPIView.as_view(),
+        name='upload-audio-file'
+    ),
+    re_path(
+        r"^{}/{}/stream/$".format(audiofiletype_url_param, audiofileid_url_param),
+        views.AudioFileStreamAPIView.as_view(),
+        name='stream-audio-file'
+    ),
+    re_path(
+        r"^{}/{}/peaks/$".format(audiofiletype_url_param, audiofileid_url_param),
+        views.AudioFilePeaksAPIView.as_view(),
+        name='audio-file-peaks'
+    ),
+    re_path(
+        r"^{}/{}/jobs/$".format(audiofiletype_url_param, audiofileid_url_param),
+        views.AudioFileJobListAPIView.as_view(),
+        name='audio-file-jobs'
+    ),
+    path("upload/<uuid:upload_id>/", views.AudioUploadAPIView.as_view(), name='audio-upload'),
     re_path(
         r"^{}/$".format(audiofiletype_url_param),
-        views.AudioFileViewSet.as_view(actions={"get": "list"}),
+        viewset_class.as_view(actions={"get": "list"}),
         name='list-audio-files'
     ),
+    re_path(
+        r"^{}/bulk/$".format(audiofiletype_url_param),
+        views.AudioFileViewSet.as_view(actions={"patch": "bulk_partial_update", "delete": "bulk_destroy"}),
+        name='bulk-actions-audio-files'
+    ),
+    re_path(
+        r"^{}/export/$".format(audiofiletype_url_param),
+        views.AudioFileViewSet.as_view(
+            actions={"get": "export"},
+            renderer_classes=[renderers.StreamingJSONRenderer, renderers.NDJSONRenderer]
+        ),
+        name='export-audio-files'
+    ),
 ]
 
 
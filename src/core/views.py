@@ -1,28 +1,62 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection, transaction
+from django.db.models import CharField, F, Q, Value
+from django.shortcuts import get_object_or_404
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.crypto import get_random_string
+from django.utils.http import parse_http_date_safe, quote_etag
+from django.utils import timezone
 from rest_framework import generics, status, viewsets
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
-from rest_framework.exceptions import ValidationError
+from rest_framework.views import APIView
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.reverse import reverse
 
-from core import mixins, serializers
+from core import mixins, models, serializers, pagination, filters, renderers, fast_serializers, peaks, ranges
+from core import metrics, stats, uploads
+from core.storage import get_storage
+from core.cache import response_cache
 
 
-class AudioFileCreateAPIView(generics.CreateAPIView, mixins.AudioFileModelSerializerMappingMixin):
+class AudioFileCreateAPIView(
+    mixins.QueryBudgetMixin,
+    mixins.RequestParsePhaseMixin,
+    generics.CreateAPIView,
+    mixins.AudioFileModelSerializerMappingMixin
+):
     """Create an Audio File Record in the specified audio type"""
 
     serializer_class = serializers.AudioFileTypeSerializer
+    query_budgets = {'post': 1}
 
     def get_serializer_class(self):
-        """Check which audiofiletype is passed and choose a serializer for the same from the defined mapping"""
+        """
+        Check which audiofiletype is passed and choose a serializer for the same from the precomputed lookup
+
+        A known audiofiletype is dispatched with a single dictionary lookup, the choice serializer only runs to build
+        the error response of a missing or unknown one.
+        """
+
+        data = self.request.data
+        try:
+            return self.audio_type_serializer_mapping[data.get('audiofiletype')]
+        except (AttributeError, KeyError, TypeError):
+            pass
 
-        audiofiletype_serializer = self.serializer_class(data=self.request.data)
+        audiofiletype_serializer = self.serializer_class(data=data)
         audiofiletype_serializer.is_valid(raise_exception=True)
-        audiofiletype = audiofiletype_serializer.validated_data['audiofiletype']
-        return self.audio_type_serializer_model_mapping[audiofiletype]['serializer']
+        return self.audio_type_serializer_mapping[audiofiletype_serializer.validated_data['audiofiletype']]
 
     def create(self, request, *args, **kwargs):
         """Create a record in table of the deduced audiofiletype"""
 
         serializer_class = self.get_serializer_class()
-        self.kwargs.setdefault('context', self.get_serializer_context())
 
         metadata_field_name = 'audiofilemetadata'
         audiofilemetadata = request.data.get(metadata_field_name)
@@ -30,18 +64,253 @@ class AudioFileCreateAPIView(generics.CreateAPIView, mixins.AudioFileModelSerial
         if audiofilemetadata is None:
             raise ValidationError(detail={metadata_field_name: ['This field is required']})
 
-        serializer = serializer_class(data=audiofilemetadata)
+        serializer = serializer_class(data=audiofilemetadata, context=self.get_serializer_context())
         serializer.is_valid(raise_exception=True)
         self.perform_create(serializer)
-        headers = self.get_success_headers(serializer.data)
-        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+        data = serializer.data
+        return Response(data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(data))
+
+
+class AudioFileBulkCreateAPIView(
+    mixins.RequestParsePhaseMixin,
+    generics.GenericAPIView,
+    mixins.AudioFileModelSerializerMappingMixin
+):
+    """Create many Audio File Records, possibly of different audio types, in a single transaction"""
+
+    serializer_class = serializers.AudioFileTypeSerializer
+    max_items = 10000
+
+    def post(self, request, *args, **kwargs):
+        """
+        Validate a list of audiofiletype/audiofilemetadata pairs and bulk insert them per audiofiletype
+
+        Any invalid item rejects the whole request unless `partial` is passed as a query parameter, in which case
+        valid items are still created and the errors of the others are reported next to them.
+        """
+
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError(detail={'non_field_errors': ['Expected a list of audio files']})
+        if len(items) > self.max_items:
+            raise ValidationError(
+                detail={'non_field_errors': [f'Ensure there are no more than {self.max_items} items']}
+            )
+
+        skip_invalid = request.query_params.get('partial', '').lower() in ('1', 'true')
+        metadata_field_name = 'audiofilemetadata'
+        errors = [{} for _ in items]
+        indices_by_type = defaultdict(list)
+
+        for index, item in enumerate(items):
+            audiofiletype_serializer = self.get_serializer(data=item)
+            if not audiofiletype_serializer.is_valid():
+                errors[index] = audiofiletype_serializer.errors
+            elif item.get(metadata_field_name) is None:
+                errors[index] = {metadata_field_name: ['This field is required']}
+            else:
+                indices_by_type[audiofiletype_serializer.validated_data['audiofiletype']].append(index)
+
+        list_serializers = []
+        for audiofiletype, indices in indices_by_type.items():
+            serializer_class = self.audio_type_serializer_model_mapping[audiofiletype]['serializer']
+            list_serializer = serializer_class(
+                data=[items[index][metadata_field_name] for index in indices],
+                many=True,
+                context={**self.get_serializer_context(), 'skip_invalid': skip_invalid}
+            )
+            list_serializer.is_valid()
+            item_errors = list_serializer.item_errors if skip_invalid else list_serializer.errors
+            for index, item_error in zip(indices, item_errors):
+                errors[index] = item_error
+            list_serializers.append((list_serializer, [index for index in indices if not errors[index]]))
+
+        if not skip_invalid and any(errors):
+            raise ValidationError(detail=errors)
+
+        results = [None for _ in items]
+        with transaction.atomic():
+            for list_serializer, indices in list_serializers:
+                list_serializer.save()
+                for index, representation in zip(indices, list_serializer.data):
+                    results[index] = representation
+        # Bulk inserts do not send post_save signals
+        for audiofiletype in indices_by_type:
+            response_cache.invalidate(audiofiletype)
+
+        if not skip_invalid:
+            return Response(results, status=status.HTTP_201_CREATED)
+
+        created = any(result is not None for result in results)
+        return Response(
+            {'results': results, 'errors': errors},
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+        )
+
+
+class AudioFileSearchAPIView(generics.GenericAPIView, mixins.AudioFileModelSerializerMappingMixin):
+    """Search songs, podcasts and audiobooks at once by name, host, participants, author or narrator"""
+
+    serializer_class = serializers.AudioFileSearchSerializer
+
+    def get(self, request, *args, **kwargs):
+        """
+        Rank matches of every audio type in one UNION ALL query and return the best `limit` of them
+
+        A row matches when its stored search vector matches the full text query, or when its name is similar enough
+        to the text for typos to be forgiven. Both conditions are served by GIN indexes.
+        """
+
+        params_serializer = self.get_serializer(data=request.query_params)
+        params_serializer.is_valid(raise_exception=True)
+        text = params_serializer.validated_data['q']
+        limit = params_serializer.validated_data['limit']
+        search_query = SearchQuery(text, config='english', search_type='websearch')
+
+        ranked_querysets = [
+            mapping['model'].objects.annotate(
+                audiofiletype=Value(audiofiletype, output_field=CharField()),
+                rank=SearchRank(F('search_vector'), search_query) + TrigramSimilarity('name', text),
+            ).filter(
+                Q(search_vector=search_query) | Q(name__trigram_similar=text)
+            ).order_by('-rank').values_list('audiofiletype', 'id', 'rank')[:limit]
+            for audiofiletype, mapping in self.audio_type_serializer_model_mapping.items()
+        ]
+        first_queryset, *other_querysets = ranked_querysets
+        hits = list(first_queryset.union(*other_querysets, all=True).order_by('-rank')[:limit])
+
+        ids_by_type = defaultdict(list)
+        for audiofiletype, audiofileid, _ in hits:
+            ids_by_type[audiofiletype].append(audiofileid)
+        representations = {}
+        for audiofiletype, ids in ids_by_type.items():
+            mapping = self.audio_type_serializer_model_mapping[audiofiletype]
+            instances = mapping['model'].objects.in_bulk(ids)
+            for audiofileid, instance in instances.items():
+                representations[audiofiletype, audiofileid] = mapping['serializer'](instance).data
+
+        return Response([
+            {'audiofiletype': audiofiletype, 'rank': rank, 'audiofile': representations[audiofiletype, audiofileid]}
+            for audiofiletype, audiofileid, rank in hits
+            if (audiofiletype, audiofileid) in representations
+        ])
+
+
+class AudioFileStatsAPIView(generics.GenericAPIView):
+    """
+    Number, total and average duration of audiofiles per type, top hosts, authors and narrators, and uploads per day
+
+    Read from summary tables kept up to date by database triggers, see core.stats. `top` sets the number of hosts,
+    authors and narrators and `days` the number of days of uploads.
+    """
+
+    serializer_class = serializers.AudioFileStatsSerializer
+
+    def get(self, request, *args, **kwargs):
+
+        params_serializer = self.get_serializer(data=request.query_params)
+        params_serializer.is_valid(raise_exception=True)
+        return Response(stats.get_stats(**params_serializer.validated_data))
+
+
+class AudioFileFeedAPIView(generics.GenericAPIView, mixins.AudioFileModelSerializerMappingMixin):
+    """
+    List songs, podcasts and audiobooks together, most recently uploaded first
 
+    Every item tells its `audiofiletype` and holds the `audiofile` as serialized by the serializer of its type. The
+    `audiofiletype` query parameter restricts the feed to some types, comma separated. Filters naming a field some
+    types do not have leave those types out of the feed.
+    """
 
-class AudioFileViewSet(viewsets.ModelViewSet, mixins.AudioFileModelSerializerMappingMixin):
+    pagination_class = pagination.AudioFileFeedPagination
+    renderer_classes = [renderers.FastJSONRenderer, BrowsableAPIRenderer]
+    filter_backends = [filters.AudioFileFilterBackend, filters.AudioFileFeedOrderingFilter]
+    ordering = '-uploaded_time'
+
+    def get_audiofiletypes(self):
+
+        audiofiletypes = self.request.query_params.get('audiofiletype')
+        if audiofiletypes is None:
+            return list(self.audio_type_serializer_model_mapping)
+        audiofiletypes = [audiofiletype.strip() for audiofiletype in audiofiletypes.split(',')]
+        invalid_types = [value for value in audiofiletypes if value not in self.audio_type_serializer_model_mapping]
+        if invalid_types:
+            raise ValidationError(detail={'audiofiletype': [f'Invalid audiofiletypes: {", ".join(invalid_types)}']})
+        return audiofiletypes
+
+    def get_querysets(self):
+        """Filtered queryset of the model of every audiofiletype in the feed"""
+
+        filter_backend = filters.AudioFileFilterBackend()
+        querysets = {}
+        for audiofiletype in self.get_audiofiletypes():
+            model = self.audio_type_serializer_model_mapping[audiofiletype]['model']
+            if filter_backend.applies_to(self.request, model):
+                querysets[audiofiletype] = filter_backend.filter_queryset(self.request, model.objects.all(), self)
+        return querysets
+
+    def get_representations(self, rows):
+        """Representations of the audiofiles of a page by (audiofiletype, id), with one query per audiofiletype"""
+
+        ids_by_type = defaultdict(list)
+        for audiofiletype, audiofileid, _ in rows:
+            ids_by_type[audiofiletype].append(audiofileid)
+
+        representations = {}
+        for audiofiletype, ids in ids_by_type.items():
+            mapping = self.audio_type_serializer_model_mapping[audiofiletype]
+            field_plan = None
+            if settings.AUDIOFILE_FAST_SERIALIZATION:
+                field_plan = fast_serializers.get_field_plan(mapping['serializer'])
+            if field_plan is None:
+                for audiofileid, instance in mapping['model'].objects.in_bulk(ids).items():
+                    representations[audiofiletype, audiofileid] = mapping['serializer'](instance).data
+                continue
+            to_representation = field_plan.bind()
+            for row in mapping['model'].objects.filter(pk__in=ids).values(*field_plan.sources):
+                representations[audiofiletype, row['id']] = to_representation(row)
+        return representations
+
+    def get(self, request, *args, **kwargs):
+
+        rows = self.paginator.paginate_querysets(self.get_querysets(), request, view=self)
+        representations = self.get_representations(rows)
+        return self.get_paginated_response([
+            {'audiofiletype': audiofiletype, 'audiofile': representations[audiofiletype, audiofileid]}
+            for audiofiletype, audiofileid, _ in rows
+            if (audiofiletype, audiofileid) in representations
+        ])
+
+
+class AudioFileViewSet(
+    mixins.QueryBudgetMixin,
+    mixins.RequestParsePhaseMixin,
+    mixins.AudioFileConditionalRequestMixin,
+    viewsets.ModelViewSet,
+    mixins.AudioFileModelSerializerMappingMixin
+):
     """A Set of Views to Retieve, List, Update and Delete audiofiles of an audiotype"""
 
     http_method_names = ['get', 'put', 'patch', 'delete']
     lookup_url_kwarg = 'audiofileid'
+    pagination_class = pagination.AudioFileCursorPagination
+    renderer_classes = [renderers.FastJSONRenderer, BrowsableAPIRenderer]
+    filter_backends = [filters.AudioFileFilterBackend, filters.AudioFileOrderingFilter]
+    ordering = 'uploaded_time'
+    export_chunk_size = 2000
+    bulk_update_batch_size = 1000
+    query_budgets = {
+        'retrieve': 2,
+        'list': 2,
+        # Validators read under a row lock, the row and its update
+        'update': 3,
+        'partial_update': 3,
+        # The row, its delete, releasing its blob and dropping its jobs and unfinished uploads
+        'destroy': 7,
+        # The rows and one update per batch of the largest accepted item list
+        'bulk_partial_update': 11,
+        'bulk_destroy': 7,
+    }
 
     def get_queryset(self):
         """Select audiofiletype model based on the url paramter"""
@@ -53,3 +322,460 @@ class AudioFileViewSet(viewsets.ModelViewSet, mixins.AudioFileModelSerializerMap
         """Select audiofiletype serializer based on the url paramter"""
 
         return self.audio_type_serializer_model_mapping[self.kwargs.get('audiofiletype')]["serializer"]
+
+    def retrieve(self, request, *args, **kwargs):
+
+        return self.get_cached_response(self.get_object_validators, super().retrieve, request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+
+        return self.get_cached_response(self.get_list_validators, self.list_page, request, *args, **kwargs)
+
+    def get_field_plan(self):
+        """Field plan of the fast serialization path, None when the regular serializer has to be used"""
+
+        if not settings.AUDIOFILE_FAST_SERIALIZATION:
+            return None
+        return fast_serializers.get_field_plan(self.get_serializer_class())
+
+    def list_page(self, request, *args, **kwargs):
+        """List a page of audiofiles, building the payload straight from `values()` rows when possible"""
+
+        field_plan = self.get_field_plan()
+        if field_plan is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).values(*field_plan.sources)
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(field_plan.to_representations(page))
+
+    def get_cached_response(self, get_validators, handler, request, *args, **kwargs):
+        """
+        Answer conditional requests and serve payloads from the cache, filling the cache on a miss
+
+        Validators are cached next to the payload, so a cache hit answers both `If-None-Match`/`If-Modified-Since`
+        and plain requests without touching the database.
+        """
+
+        key = response_cache.make_key(self.kwargs['audiofiletype'], request, self.kwargs.get(self.lookup_url_kwarg))
+        cached = response_cache.get(key)
+        if cached is not None:
+            etag, last_modified = cached['etag'], cached['last_modified']
+        else:
+            etag, last_modified = get_validators()
+            if etag is None:
+                return handler(request, *args, **kwargs)
+
+        response = self.get_conditional_response(request, etag, last_modified)
+        if response is None and cached is not None:
+            response = Response(cached['data'])
+        elif response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                response_cache.set(key, {'data': response.data, 'etag': etag, 'last_modified': last_modified})
+        return self.set_validator_headers(response, etag, last_modified)
+
+    def update(self, request, *args, **kwargs):
+        """Update an audiofile, honouring `If-Match`/`If-Unmodified-Since` for optimistic concurrency"""
+
+        if not {'HTTP_IF_MATCH', 'HTTP_IF_UNMODIFIED_SINCE', 'HTTP_IF_NONE_MATCH'} & set(request.META):
+            return super().update(request, *args, **kwargs)
+
+        with transaction.atomic():
+            # The row stays locked until the update is written, so nobody can change it after the check
+            etag, last_modified = self.get_object_validators(lock=True)
+            if etag is not None:
+                response = self.get_conditional_response(request, etag, last_modified)
+                if response is not None:
+                    return response
+            return super().update(request, *args, **kwargs)
+
+    def perform_update(self, serializer):
+
+        instance = serializer.save()
+        self.set_validator_headers(
+            self.headers,
+            self.make_etag(self.kwargs['audiofiletype'], instance.pk, instance.last_modified.isoformat()),
+            instance.last_modified
+        )
+
+    def export(self, request, *args, **kwargs):
+        """Stream every audiofile of an audiotype, reading rows through a server side cursor"""
+
+        queryset = self.filter_queryset(self.get_queryset()).order_by('pk')
+        field_plan = self.get_field_plan()
+        if field_plan is None:
+            serializer = self.get_serializer()
+            items = (
+                serializer.to_representation(instance)
+                for instance in queryset.iterator(chunk_size=self.export_chunk_size)
+            )
+        else:
+            to_representation = field_plan.bind()
+            items = (
+                to_representation(row)
+                for row in queryset.values(*field_plan.sources).iterator(chunk_size=self.export_chunk_size)
+            )
+        renderer = request.accepted_renderer
+        return StreamingHttpResponse(
+            renderer.render_stream(items, self.export_chunk_size),
+            content_type=renderer.media_type
+        )
+
+    def get_bulk_queryset(self, ids):
+        """Rows targeted by a bulk action, selected by an id list, the list filters or both"""
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if ids is not None:
+            return queryset.filter(pk__in=ids)
+        if not queryset.query.has_filters():
+            raise ValidationError(detail={'ids': ['Either ids or a filter is required']})
+        return queryset
+
+    def bulk_partial_update(self, request, *args, **kwargs):
+        """Update many audiofiles of an audiotype with a single UPDATE, or batched bulk updates for per row values"""
+
+        bulk_serializer = serializers.AudioFileBulkUpdateSerializer(data=request.data)
+        bulk_serializer.is_valid(raise_exception=True)
+        serializer_class = self.get_serializer_class()
+
+        if 'items' not in bulk_serializer.validated_data:
+            serializer = serializer_class(
+                data=bulk_serializer.validated_data['audiofilemetadata'],
+                partial=True,
+                context=self.get_serializer_context()
+            )
+            serializer.is_valid(raise_exception=True)
+            if not serializer.validated_data:
+                return Response({'updated': 0})
+            queryset = self.get_bulk_queryset(bulk_serializer.validated_data.get('ids'))
+            updated = queryset.update(last_modified=timezone.now(), **serializer.validated_data)
+            response_cache.invalidate(self.kwargs['audiofiletype'])
+            return Response({'updated': updated})
+
+        items = bulk_serializer.validated_data['items']
+        queryset = self.filter_queryset(self.get_queryset())
+        instances = queryset.in_bulk([item['id'] for item in items])
+        errors = [{} for _ in items]
+        updated_fields = set()
+        now = timezone.now()
+        for index, item in enumerate(items):
+            instance = instances.get(item['id'])
+            if instance is None:
+                errors[index] = {'id': ['Not found.']}
+                continue
+            serializer = serializer_class(instance, data=item, partial=True, context=self.get_serializer_context())
+            if not serializer.is_valid():
+                errors[index] = serializer.errors
+                continue
+            for attr, value in serializer.validated_data.items():
+                setattr(instance, attr, value)
+            instance.last_modified = now
+            updated_fields.update(serializer.validated_data)
+
+        if any(errors):
+            raise ValidationError(detail={'items': errors})
+
+        if updated_fields:
+            queryset.model.objects.bulk_update(
+                instances.values(),
+                fields=sorted(updated_fields | {'last_modified'}),
+                batch_size=self.bulk_update_batch_size
+            )
+            response_cache.invalidate(self.kwargs['audiofiletype'])
+        return Response({'updated': len(instances) if updated_fields else 0})
+
+    def bulk_destroy(self, request, *args, **kwargs):
+        """Delete many audiofiles of an audiotype with a single DELETE"""
+
+        ids_serializer = serializers.AudioFileIdListSerializer(data=request.data)
+        ids_serializer.is_valid(raise_exception=True)
+        queryset = self.get_bulk_queryset(ids_serializer.validated_data.get('ids'))
+        # QuerySet.delete() would fetch every row to send post_delete signals, whose receivers would each run their
+        # own queries. The rows are deleted by id instead, and what the receivers do is done once for all of them.
+        with transaction.atomic():
+            rows = list(queryset.select_for_update().values_list('pk', 'file', 'peaks'))
+            audiofileids = [audiofileid for audiofileid, _, _ in rows]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {connection.ops.quote_name(queryset.model._meta.db_table)} WHERE "id" = ANY(%s)',
+                    [audiofileids]
+                )
+                deleted = cursor.rowcount
+            uploads.release_audiofiles(
+                self.kwargs['audiofiletype'],
+                audiofileids,
+                [(name, peaks_name) for _, name, peaks_name in rows]
+            )
+            response_cache.invalidate(self.kwargs['audiofiletype'])
+        return Response({'deleted': deleted})
+
+
+class AudioUploadResponseMixin:
+    """Respond with the state of an upload, and the updated audiofile once the upload is complete"""
+
+    def get_upload_response(self, upload, status_code=status.HTTP_200_OK):
+
+        data = serializers.AudioUploadSerializer(upload).data
+        headers = {'Upload-Offset': str(upload.offset), 'Upload-Length': str(upload.size)}
+        if upload.complete:
+            serializer_class = self.audio_type_serializer_model_mapping[upload.audiofiletype]['serializer']
+            data['audiofile'] = serializer_class(upload.audiofile).data
+        else:
+            headers['Location'] = reverse('audio-upload', kwargs={'upload_id': upload.pk}, request=self.request)
+        return Response(data, status=status_code, headers=headers)
+
+    def append(self, upload, request):
+        """Stream the request body into the upload"""
+
+        try:
+            appended = uploads.append(upload, request.stream)
+        except ObjectDoesNotExist:
+            raise NotFound('The audiofile of this upload no longer exists')
+        if not appended:
+            try:
+                upload.refresh_from_db()
+            except ObjectDoesNotExist:
+                raise NotFound('This upload was aborted')
+            return Response(
+                {'detail': 'The upload moved on, resume from the current offset'},
+                status=status.HTTP_409_CONFLICT,
+                headers={'Upload-Offset': str(upload.offset)}
+            )
+        return None
+
+
+class AudioFileUploadAPIView(AudioUploadResponseMixin, mixins.AudioFileRecordMixin, generics.GenericAPIView):
+    """
+    Start a resumable upload of the media of an Audio File Record
+
+    The `Upload-Length` header gives the size of the file and `Content-Type` its audio media type. The body, which may
+    be empty, holds the first bytes of the file, the rest is sent with PATCH requests to the returned upload.
+    """
+
+    def post(self, request, *args, **kwargs):
+
+        audiofile = self.get_object()
+        serializer = serializers.AudioUploadSerializer(
+            data={'size': request.headers.get('Upload-Length'), 'content_type': request.content_type}
+        )
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.save(audiofiletype=audiofile.audiofiletype, audiofileid=audiofile.pk)
+        return self.append(upload, request) or self.get_upload_response(upload, status.HTTP_201_CREATED)
+
+
+class AudioUploadAPIView(AudioUploadResponseMixin, APIView, mixins.AudioFileModelSerializerMappingMixin):
+    """
+    Resume, inspect or abort an upload
+
+    PATCH appends its body at the `Upload-Offset` header, which must match the offset of the upload.
+    """
+
+    def get_upload(self):
+
+        return get_object_or_404(models.AudioUpload, pk=self.kwargs['upload_id'])
+
+    def get(self, request, *args, **kwargs):
+
+        return self.get_upload_response(self.get_upload())
+
+    def patch(self, request, *args, **kwargs):
+
+        upload = self.get_upload()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            raise ValidationError(detail={'Upload-Offset': ['A valid integer is required.']})
+        if offset != upload.offset:
+            return Response(
+                {'detail': f'Upload-Offset {offset} does not match the offset of the upload'},
+                status=status.HTTP_409_CONFLICT,
+                headers={'Upload-Offset': str(upload.offset)}
+            )
+        return self.append(upload, request) or self.get_upload_response(upload)
+
+    def delete(self, request, *args, **kwargs):
+
+        uploads.abort(self.get_upload())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class AudioFileStreamAPIView(
+    mixins.AudioFileConditionalRequestMixin,
+    mixins.AudioFileRecordMixin,
+    generics.GenericAPIView
+):
+    """
+    Serve the uploaded media of an Audio File Record, honouring `Range` and `If-Range`
+
+    A single range is sent from the open file so that WSGI servers can use `os.sendfile`, several ranges are sent as a
+    `multipart/byteranges` body.
+    """
+
+    record_fields = ['file', 'file_size', 'content_type', 'checksum', 'last_modified']
+    block_size = 64 * 1024
+
+    def perform_content_negotiation(self, request, force=False):
+
+        # Players ask for audio types, which only the media itself is, errors are still rendered as JSON
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, *args, **kwargs):
+
+        audiofile = self.get_object()
+        if not audiofile.file:
+            raise NotFound('No media was uploaded for this audiofile')
+
+        etag = quote_etag(audiofile.checksum)
+        last_modified = audiofile.last_modified
+        response = self.get_conditional_response(request, etag, last_modified)
+        if response is None:
+            response = self.get_media_response(request, audiofile, etag, last_modified)
+        self.set_validator_headers(response, etag, last_modified)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    def get_media_response(self, request, audiofile, etag, last_modified):
+
+        size = audiofile.file_size
+        requested_ranges = None
+        range_header = request.headers.get('Range')
+        if range_header and self.if_range_matches(request, etag, last_modified):
+            requested_ranges = ranges.parse_range_header(range_header, size)
+
+        if requested_ranges == []:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        file = get_storage().open(audiofile.file)
+        if requested_ranges is None:
+            response = FileResponse(file, content_type=audiofile.content_type)
+            response['Content-Length'] = size
+        elif len(requested_ranges) == 1:
+            start, end = requested_ranges[0]
+            response = FileResponse(
+                ranges.FileRange(file, start, end - start + 1),
+                status=status.HTTP_206_PARTIAL_CONTENT,
+                content_type=audiofile.content_type
+            )
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        else:
+            boundary = get_random_string(32)
+            length, body = ranges.multipart_byteranges(
+                file, requested_ranges, size, audiofile.content_type, boundary, self.block_size
+            )
+            response = StreamingHttpResponse(
+                body,
+                status=status.HTTP_206_PARTIAL_CONTENT,
+                content_type=f'multipart/byteranges; boundary={boundary}'
+            )
+            response['Content-Length'] = length
+        response.block_size = self.block_size
+        return response
+
+    @staticmethod
+    def if_range_matches(request, etag, last_modified):
+        """Whether the representation `If-Range` was sent for, if any, is still the current one"""
+
+        if_range = request.headers.get('If-Range')
+        if if_range is None:
+            return True
+        if if_range.startswith('"'):
+            return if_range == etag
+        # A date only matches the exact Last-Modified the client was sent
+        return parse_http_date_safe(if_range) == int(last_modified.timestamp())
+
+
+class AudioFileJobListAPIView(mixins.AudioFileRecordMixin, generics.ListAPIView):
+    """Processing jobs of an Audio File Record, most recent first"""
+
+    serializer_class = serializers.AudioJobSerializer
+    record_fields = ['pk']
+
+    def get_queryset(self):
+
+        get_object_or_404(self.get_record_queryset(), pk=self.kwargs['audiofileid'])
+        return models.AudioJob.objects.filter(
+            audiofiletype=self.kwargs.get('audiofiletype'),
+            audiofileid=self.kwargs['audiofileid']
+        ).order_by('-created_time', '-id')
+
+
+class AudioFilePeaksAPIView(
+    mixins.AudioFileConditionalRequestMixin,
+    mixins.AudioFileRecordMixin,
+    generics.GenericAPIView
+):
+    """
+    Waveform peaks of the uploaded media of an Audio File Record at the `zoom` query parameter level
+
+    Zoom 0, the default, covers the whole file in a few hundred peaks and every level above doubles the resolution.
+    Peaks are sent as raw 16-bit little-endian (min, max) pairs described by the `X-Peaks-*` headers, or in JSON with
+    `?format=json`.
+    """
+
+    record_fields = ['peaks']
+    renderer_classes = [renderers.PeaksRenderer, renderers.FastJSONRenderer]
+
+    def handle_exception(self, exc):
+
+        response = super().handle_exception(exc)
+        # Errors are described in JSON even when the peaks themselves were asked in binary
+        self.request.accepted_renderer = renderers.FastJSONRenderer()
+        self.request.accepted_media_type = self.request.accepted_renderer.media_type
+        return response
+
+    def get_zoom(self, request):
+
+        try:
+            zoom = int(request.query_params.get('zoom', 0))
+        except ValueError:
+            zoom = -1
+        if zoom < 0:
+            raise ValidationError(detail={'zoom': ['A valid non negative integer is required.']})
+        return zoom
+
+    def get(self, request, *args, **kwargs):
+
+        zoom = self.get_zoom(request)
+        audiofile = self.get_object()
+        if not audiofile.peaks:
+            raise NotFound('The peaks of this audiofile are not computed yet')
+
+        etag = self.make_etag('peaks', audiofile.peaks, zoom, request.accepted_renderer.format)
+        response = self.get_conditional_response(request, etag, None)
+        if response is None:
+            with get_storage().open(audiofile.peaks) as file:
+                level = peaks.read_level(file, zoom)
+            headers = {
+                'X-Peaks-Sample-Rate': str(level.sample_rate),
+                'X-Peaks-Samples-Per-Peak': str(level.samples_per_peak),
+                'X-Peaks-Levels': str(level.levels),
+            }
+            if isinstance(request.accepted_renderer, renderers.PeaksRenderer):
+                data = level.data
+            else:
+                data = {
+                    'zoom': zoom,
+                    'levels': level.levels,
+                    'sample_rate': level.sample_rate,
+                    'samples_per_peak': level.samples_per_peak,
+                    'data': peaks.decode_pairs(level.data),
+                }
+            response = Response(data, headers=headers)
+        self.set_validator_headers(response, etag, None)
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+
+class MetricsAPIView(APIView):
+    """Request metrics of this process in the Prometheus text exposition format"""
+
+    renderer_classes = [renderers.PrometheusRenderer]
+
+    def get(self, request, *args, **kwargs):
+
+        # The format version is left out of the renderer, whose media type parameters must match the Accept header
+        return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,21 @@
+"""
+Setup of the processes of process pools
+
+Pools spawn their processes, which start without Django set up: the initializer and what it imports must not import
+models, as the modules of `core` mostly do.
+"""
+import django
+from django.db import connection
+
+
+def setup(settings_dict=None):
+    """
+    Set Django up in a new process, connecting to the database of `settings_dict` when given
+
+    Workers reading the database are given the settings of the connection of the parent process, which tests and
+    benchmarks point at a database of their own.
+    """
+
+    django.setup()
+    if settings_dict is not None:
+        connection.settings_dict.update(settings_dict)